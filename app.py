@@ -1,20 +1,34 @@
+import queue
+import threading
+
 import streamlit as st
 import pandas as pd
 from pathlib import Path
-import yaml
 import plotly.express as px
 
 from grader import (
+    extract_criteria_adjustments,
     run_grading_process,
     INPUT_FOLDER,
     OUTPUT_FOLDER,
     SUMMARY_FILE,
     load_rubric_config,
 )
+from metrics import load_run_report
+from result_store import iter_results
+from review_policy import parsed_bands
+from rubric_engine import compile_rubric
 
 
 def load_and_aggregate_data(output_dir: Path, rubric_config: dict):
-    """Return a DataFrame with criterion-level scores for all students."""
+    """Return a DataFrame with criterion-level scores for all students.
+
+    Points are recomputed from the stored results in ``results/`` (the
+    model's bands, the word count and the review's adjustments), as
+    ``python grader.py rescore`` does, so they match the graded reports.
+    Bands for the whole class are scored in one vectorised pass with
+    ``CompiledRubric.score_cohort``.
+    """
     summary_path = output_dir / SUMMARY_FILE
     if not summary_path.exists():
         return None
@@ -24,37 +38,41 @@ def load_and_aggregate_data(output_dir: Path, rubric_config: dict):
     except Exception:
         return None
 
-    criteria = rubric_config.get("criteria", {})
-    for cid in criteria:
-        df[f"{cid}_pts"] = pd.NA
-
-    for idx, row in df.iterrows():
-        student = str(row["student"])
-        raw_path = output_dir / f"{student}_raw_gemini_response.txt"
-        if not raw_path.exists():
+    compiled = compile_rubric(rubric_config)
+    records = {record["student_identifier"]: record for record in iter_results(output_dir)}
+    band_rows, word_counts, adjusted = {}, {}, {}
+    for idx, student in df["student"].astype(str).items():
+        record = records.get(student)
+        if record is None:
             continue
-        try:
-            text = raw_path.read_text()
-            cleaned = text.strip()
-            if cleaned.startswith("```yaml"):
-                cleaned = cleaned[len("```yaml") :]
-            if cleaned.startswith("```"):
-                cleaned = cleaned[3:]
-            if cleaned.endswith("```"):
-                cleaned = cleaned[:-3]
-            cleaned = cleaned.strip()
-            data = yaml.safe_load(cleaned)
-        except Exception:
-            continue
-
-        breakdown = (
-            data.get("assistant_grade", {}).get("breakdown", {}) if isinstance(data, dict) else {}
-        )
-        for cid in criteria:
-            pts = breakdown.get(cid, {}).get("points")
-            if pts is not None:
-                df.at[idx, f"{cid}_pts"] = pts
-
+        bands = parsed_bands(record["parsed_response"])
+        if not bands:  # fall back to the stored grade's bands
+            breakdown = (record.get("final_grade") or {}).get("breakdown") or {}
+            bands = {cid: item.get("band", 1) for cid, item in breakdown.items()}
+        band_rows[idx] = compiled.resolve_bands(bands)
+        word_counts[idx] = record.get("word_count") or 0
+        adjusted[idx] = {
+            cid: int(band)
+            for cid, band in extract_criteria_adjustments(record.get("review_text")).items()
+            if cid in compiled.criteria
+        }
+
+    pts_columns = [f"{cid}_pts" for cid in compiled.criteria]
+    for column in pts_columns:
+        df[column] = pd.NA
+    if band_rows:
+        band_matrix = pd.DataFrame.from_dict(band_rows, orient="index", columns=compiled.criteria)
+        scored = compiled.score_cohort(band_matrix, [word_counts[idx] for idx in band_matrix.index])
+        # Review adjustments replace a band after the rules, as during grading.
+        for idx, adjustments in adjusted.items():
+            for cid, band in adjustments.items():
+                scored.at[idx, f"{cid}_pts"] = min(band, compiled.max_points.get(cid, band))
+        df.loc[scored.index, pts_columns] = scored[pts_columns]
+        df.loc[scored.index, "total_points"] = scored[pts_columns].sum(axis=1)
+
+    totals = pd.to_numeric(df["total_points"], errors="coerce")
+    df["grade"] = compiled.grade_letters(totals.fillna(0).to_numpy())
+    df.loc[totals.isna(), "grade"] = pd.NA
     return df
 
 st.title("AI Student Assessment Grader")
@@ -75,8 +93,28 @@ if st.button("Run Grading"):
             save_path = INPUT_FOLDER / file.name
             with open(save_path, "wb") as f:
                 f.write(file.getbuffer())
+    # Grade in a worker thread; criterion results stream back through a queue
+    # because Streamlit elements can only be updated from the script thread.
+    streamed = queue.Queue()
+    worker = threading.Thread(
+        target=run_grading_process,
+        kwargs={"on_criterion": lambda student, item: streamed.put((student, item))},
+        daemon=True,
+    )
+    live_rows = []
+    live_table = st.empty()
     with st.spinner("Grading in progress..."):
-        run_grading_process()
+        worker.start()
+        while worker.is_alive() or not streamed.empty():
+            try:
+                student, item = streamed.get(timeout=0.2)
+            except queue.Empty:
+                continue
+            live_rows.append(
+                {"student": student, "criterion": item["criterion"], "band": item["band"]}
+            )
+            live_table.dataframe(pd.DataFrame(live_rows))
+        worker.join()
     st.success("Grading complete!")
     st.session_state["run_complete"] = True
 
@@ -137,6 +175,34 @@ if st.session_state.get("run_complete"):
                 )
                 col2.plotly_chart(fig2, use_container_width=True)
 
+    run_report = load_run_report(OUTPUT_FOLDER)
+    if run_report:
+        st.subheader("API Usage")
+        totals = run_report["totals"]
+        col1, col2, col3, col4 = st.columns(4)
+        col1.metric("Requests", totals["requests"])
+        col2.metric("Cache hits", totals["cache_hits"])
+        col3.metric("Tokens", totals["prompt_tokens"] + totals["output_tokens"])
+        col4.metric("Est. cost (USD)", f"{totals['cost_usd']:.4f}")
+        stage_rows = [
+            {
+                "stage": stage,
+                "requests": stats["requests"],
+                "throttled (429)": stats["outcomes"].get("throttled", 0),
+                "retries": stats["retries"],
+                "cache hits": stats["cache_hits"],
+                "prompt tokens": stats["prompt_tokens"],
+                "output tokens": stats["output_tokens"],
+                "mean latency (s)": (
+                    stats["latency_seconds"] / stats["requests"] if stats["requests"] else 0.0
+                ),
+                "est. cost (USD)": stats["cost_usd"],
+            }
+            for stage, stats in sorted(run_report["by_stage"].items())
+        ]
+        if stage_rows:
+            st.dataframe(pd.DataFrame(stage_rows))
+
     st.subheader("Feedback Reports")
     for report_path in sorted(OUTPUT_FOLDER.glob("*_graded.docx")):
         with open(report_path, "rb") as f:
@@ -0,0 +1,389 @@
+"""Offline batch grading built on Gemini batch jobs.
+
+Grading a whole year group synchronously holds a process open for hours. The
+batch workflow splits it into steps that can run independently:
+
+``prepare``
+    Extract every pending submission and write one generate-content request
+    per line to ``batch_jobs/grading_requests.jsonl``, keyed by the SHA-256 of
+    the submission file. A manifest maps each key back to its submission(s).
+``submit``
+    Upload the requests file and start a batch job (requires the optional
+    ``google-genai`` package). Without it, upload the file manually in AI
+    Studio and save the results as ``batch_jobs/grading_results.jsonl``.
+``fetch``
+    Check the submitted job and download its results when it has finished.
+``ingest``
+    Run each result through ``parse_gemini_yaml_response``,
+    ``calculate_final_grade`` and ``format_feedback_as_docx``, record the
+    submissions in the build manifest and merge them into the summary CSV.
+
+Like ``grader.py``, ``prepare`` uses the build manifest to pick the
+submissions that need grading, and ``ingest`` records what it graded and with
+which model, so a later ``prepare`` skips them. Because the batch model is one
+of those inputs, ``grader.py`` grades them again with its own model routes;
+``python grader.py rescore`` or ``rerender`` rebuilds their reports without
+API calls.
+
+Batch results are not sent through ``review_grade``; run the synchronous
+grader on individual submissions if a moderation pass is needed.
+
+Usage: ``python batch_mode.py prepare|submit|fetch|ingest [--model NAME]``
+"""
+
+import argparse
+import copy
+import json
+import logging
+import time
+from pathlib import Path
+
+import grader
+from build_manifest import (
+    MANIFEST_FILE,
+    BuildManifest,
+    assign_student_identifiers,
+    scan_submission_files,
+)
+from gemini_client import SAFETY_SETTINGS
+from report_renderer import RenderPool
+from response_repair import repair_grading_response
+from result_store import result_path, save_result
+from rubric_engine import compile_rubric
+import structured_output
+from structured_output import grading_response_schema, json_generation_config
+
+BATCH_FOLDER = Path("batch_jobs")
+BATCH_REQUESTS_FILE = BATCH_FOLDER / "grading_requests.jsonl"
+BATCH_RESULTS_FILE = BATCH_FOLDER / "grading_results.jsonl"
+BATCH_STATE_FILE = BATCH_FOLDER / "batch_job.json"
+# Batch jobs can run for up to a day, so they target a pinned model version
+# rather than a ``-latest`` alias that may move while the job is queued.
+BATCH_MODEL = "gemini-1.5-flash-002"
+
+
+def batch_model_fingerprint(model_name):
+    """Return the build-manifest ``model`` input for a batch graded by ``model_name``."""
+    return f"batch={model_name}"
+
+
+def manifest_path_for(requests_path):
+    """Return the manifest path that accompanies a requests JSONL file."""
+    requests_path = Path(requests_path)
+    return requests_path.with_name(requests_path.stem + ".manifest.json")
+
+
+def build_batch_request(key, prompt_messages, generation_config=None):
+    """Return one batch JSONL line for the given prompt parts."""
+    request = {
+        "contents": [{"role": "user", "parts": [{"text": part} for part in prompt_messages]}],
+        "safety_settings": [dict(s) for s in SAFETY_SETTINGS],
+    }
+    if generation_config:
+        request["generation_config"] = generation_config
+    return {"key": key, "request": request}
+
+
+def prepare_batch(requests_path=BATCH_REQUESTS_FILE, *, model_name=BATCH_MODEL, force=False):
+    """Render pending submissions into a batch requests file.
+
+    Only submissions the build manifest says need grading by ``model_name``
+    are included, unless ``force`` is set; ones that only need rescoring or
+    re-rendering are left to ``grader.py``, which handles them without API
+    calls. Identical files share a single request. Returns the number of
+    requests written.
+    """
+    requests_path = Path(requests_path)
+    master_prompt_template = grader.load_master_prompt()
+    structured = structured_output.STRUCTURED_OUTPUT_ENABLED
+    generation_config = None
+    if structured:
+        generation_config = json_generation_config(
+            grading_response_schema(grader.load_rubric_config())
+        )
+    if not grader.INPUT_FOLDER.exists():
+        logging.error(f"Input folder '{grader.INPUT_FOLDER}' not found.")
+        return 0
+
+    submission_files, _ = scan_submission_files(grader.INPUT_FOLDER)
+    identifiers = assign_student_identifiers(submission_files, grader.get_student_identifier)
+    build_manifest = BuildManifest(grader.OUTPUT_FOLDER / MANIFEST_FILE)
+    inputs = grader.manifest_inputs(submission_files, model=batch_model_fingerprint(model_name))
+
+    manifest = {}
+    lines = []
+    for filepath in submission_files:
+        student_identifier = identifiers[filepath]
+        stage = build_manifest.stage_for(
+            filepath.name,
+            student_identifier,
+            inputs[filepath],
+            report_exists=(grader.OUTPUT_FOLDER / f"{student_identifier}_graded.docx").exists(),
+            result_exists=result_path(grader.OUTPUT_FOLDER, student_identifier).exists(),
+        )
+        if not force and stage != "grade":
+            if stage is None:
+                logging.info(f"Outputs for {filepath.name} are up to date. Skipping.")
+            else:
+                logging.info(f"{filepath.name} only needs to {stage}; run grader.py for that.")
+            continue
+
+        extracted_text, doc_author = grader.extract_text_from_file(filepath)
+        if not extracted_text:
+            logging.warning(
+                f"Skipping {filepath.name} due to text extraction failure or empty content."
+            )
+            continue
+
+        key = inputs[filepath]["submission"]
+        submission = {
+            "path": str(filepath),
+            "name": filepath.name,
+            "inputs": inputs[filepath],
+            "student_identifier": student_identifier,
+            "word_count": len(extracted_text.split()),
+            "doc_author": doc_author,
+        }
+        if key in manifest:
+            manifest[key]["submissions"].append(submission)
+            continue
+        manifest[key] = {"submissions": [submission]}
+        prompt_messages = grader.construct_prompt_messages(
+            extracted_text, master_prompt_template, structured=structured
+        )
+        lines.append(build_batch_request(key, prompt_messages, generation_config))
+
+    requests_path.parent.mkdir(parents=True, exist_ok=True)
+    with open(requests_path, "w", encoding="utf-8") as f:
+        for line in lines:
+            f.write(json.dumps(line) + "\n")
+    with open(manifest_path_for(requests_path), "w", encoding="utf-8") as f:
+        json.dump(manifest, f, indent=2)
+    logging.info(f"Wrote {len(lines)} batch request(s) to {requests_path}")
+    return len(lines)
+
+
+def _load_genai_client():
+    """Return a ``google.genai`` client, or ``None`` if the package is missing."""
+    try:
+        from google import genai as google_genai
+    except ImportError:
+        logging.error(
+            "The google-genai package is not installed, so batch jobs cannot be submitted "
+            "automatically. Install it (pip install google-genai) or upload the requests "
+            "file manually and save the results JSONL for 'ingest'."
+        )
+        return None
+    return google_genai.Client(api_key=grader.load_api_key())
+
+
+def submit_batch(requests_path=BATCH_REQUESTS_FILE, model_name=BATCH_MODEL):
+    """Upload ``requests_path`` and start a batch job. Returns the job name."""
+    client = _load_genai_client()
+    if client is None:
+        return None
+    uploaded = client.files.upload(
+        file=str(requests_path),
+        config={"display_name": Path(requests_path).name, "mime_type": "jsonl"},
+    )
+    job = client.batches.create(
+        model=model_name,
+        src=uploaded.name,
+        config={"display_name": f"grader-{int(time.time())}"},
+    )
+    BATCH_STATE_FILE.parent.mkdir(parents=True, exist_ok=True)
+    with open(BATCH_STATE_FILE, "w", encoding="utf-8") as f:
+        json.dump(
+            {"job_name": job.name, "requests_path": str(requests_path), "model": model_name},
+            f,
+            indent=2,
+        )
+    logging.info(f"Submitted batch job {job.name} for {requests_path}")
+    return job.name
+
+
+def fetch_batch_results(results_path=BATCH_RESULTS_FILE):
+    """Download the results of the submitted job if it has finished.
+
+    Returns ``True`` once the results file has been written.
+    """
+    try:
+        with open(BATCH_STATE_FILE, "r", encoding="utf-8") as f:
+            state = json.load(f)
+    except FileNotFoundError:
+        logging.error(f"No submitted batch job recorded in {BATCH_STATE_FILE}.")
+        return False
+    client = _load_genai_client()
+    if client is None:
+        return False
+    job = client.batches.get(name=state["job_name"])
+    job_state = getattr(job.state, "name", str(job.state))
+    logging.info(f"Batch job {job.name} state: {job_state}")
+    if job_state != "JOB_STATE_SUCCEEDED":
+        return False
+    content = client.files.download(file=job.dest.file_name)
+    Path(results_path).parent.mkdir(parents=True, exist_ok=True)
+    Path(results_path).write_bytes(content)
+    logging.info(f"Batch results saved to: {results_path}")
+    return True
+
+
+def submitted_model(requests_path=BATCH_REQUESTS_FILE):
+    """Return the model the job for ``requests_path`` was submitted to.
+
+    Falls back to ``BATCH_MODEL`` when the job was not submitted by
+    :func:`submit_batch` (e.g. uploaded manually in AI Studio).
+    """
+    try:
+        with open(BATCH_STATE_FILE, "r", encoding="utf-8") as f:
+            state = json.load(f)
+    except FileNotFoundError:
+        return BATCH_MODEL
+    if state.get("requests_path") != str(requests_path):
+        return BATCH_MODEL
+    return state.get("model") or BATCH_MODEL
+
+
+def response_text_from_result(result):
+    """Extract the response text from one batch results line, or ``None``."""
+    if result.get("error"):
+        return None
+    response = result.get("response") or {}
+    texts = []
+    for candidate in response.get("candidates", [])[:1]:
+        for part in (candidate.get("content") or {}).get("parts", []):
+            if part.get("text"):
+                texts.append(part["text"])
+    return "".join(texts) or None
+
+
+def ingest_batch_results(
+    results_path=BATCH_RESULTS_FILE, requests_path=BATCH_REQUESTS_FILE, model_name=None
+):
+    """Grade and render every submission from a batch results file.
+
+    ``model_name`` is the model that produced the results (default: the one
+    recorded by :func:`submit_batch`); it is stored with each result and in
+    the build manifest. Returns the list of ``(student_identifier,
+    total_points, review_status)`` summary rows.
+    """
+    model_name = model_name or submitted_model(requests_path)
+    rubric_config = grader.load_rubric_config()
+    with open(manifest_path_for(requests_path), "r", encoding="utf-8") as f:
+        manifest = json.load(f)
+    grader.OUTPUT_FOLDER.mkdir(parents=True, exist_ok=True)
+    build_manifest = BuildManifest(grader.OUTPUT_FOLDER / MANIFEST_FILE)
+
+    ingested = []
+    # Reports render in worker processes; leaving the block waits for them.
+    with RenderPool() as render_pool, open(results_path, "r", encoding="utf-8") as f:
+        for line_number, line in enumerate(f, start=1):
+            if not line.strip():
+                continue
+            try:
+                result = json.loads(line)
+            except json.JSONDecodeError as e:
+                logging.error(f"Skipping malformed results line {line_number}: {e}")
+                continue
+            entry = manifest.get(result.get("key"))
+            if entry is None:
+                logging.warning(f"Result key {result.get('key')} is not in the batch manifest.")
+                continue
+
+            api_response = response_text_from_result(result)
+            for submission in entry["submissions"]:
+                student_identifier = submission["student_identifier"]
+                if not api_response:
+                    logging.warning(
+                        f"Skipping {student_identifier}: batch request failed ({result.get('error')})."
+                    )
+                    continue
+                parsed_data = grader.parse_gemini_yaml_response(api_response)
+                repair_strategy = None
+                if not parsed_data:
+                    # Offline ingest only tries the local repairs, never a fix request.
+                    parsed_data, repair_strategy = repair_grading_response(
+                        api_response, compile_rubric(rubric_config)
+                    )
+                if not parsed_data:
+                    logging.warning(f"Skipping {student_identifier} due to YAML parsing failure.")
+                    raw_response_path = (
+                        grader.OUTPUT_FOLDER / f"{student_identifier}_raw_gemini_response.txt"
+                    )
+                    raw_response_path.write_text(api_response, encoding="utf-8")
+                    continue
+                model_output = copy.deepcopy(parsed_data)
+                grader.apply_rubric_to_response(parsed_data, submission["word_count"], rubric_config)
+                save_result(
+                    grader.OUTPUT_FOLDER,
+                    student_identifier,
+                    source_path=submission["path"],
+                    model_response=api_response,
+                    parsed_response=model_output,
+                    word_count=submission["word_count"],
+                    doc_author=submission.get("doc_author"),
+                    final_grade=parsed_data.get("assistant_grade"),
+                    model_name=model_name,
+                    repair_strategy=repair_strategy,
+                )
+                grader.format_feedback_as_docx(
+                    parsed_data,
+                    grader.OUTPUT_FOLDER / f"{student_identifier}_graded.docx",
+                    student_identifier,
+                    rubric_config,
+                    doc_author=submission.get("doc_author"),
+                    render_pool=render_pool,
+                )
+                summary_row = (
+                    student_identifier,
+                    grader.summary_total_points(parsed_data),
+                    "skipped (batch)",
+                )
+                ingested.append((submission, summary_row))
+
+    summary_entries = []
+    for submission, summary_row in ingested:
+        student_identifier = submission["student_identifier"]
+        if not render_pool.rendered(grader.OUTPUT_FOLDER / f"{student_identifier}_graded.docx"):
+            continue
+        if "inputs" in submission:  # absent in manifests written before the build manifest
+            inputs = dict(submission["inputs"], model=batch_model_fingerprint(model_name))
+            build_manifest.record(submission["name"], student_identifier, inputs, summary_row)
+        summary_entries.append(summary_row)
+    build_manifest.save()
+    if summary_entries:
+        # Keep the rows of submissions this batch did not include.
+        rows = {row[0]: row for row in grader.read_summary()}
+        rows.update((row[0], row) for row in summary_entries)
+        grader.write_summary(list(rows.values()))
+    logging.info(f"Ingested {len(summary_entries)} graded submission(s) from {results_path}")
+    if render_pool.failures:
+        logging.error(f"Report rendering failed for {render_pool.failures} submission(s).")
+    return summary_entries
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Batch grading workflow")
+    parser.add_argument("step", choices=["prepare", "submit", "fetch", "ingest"])
+    parser.add_argument("--requests", type=Path, default=BATCH_REQUESTS_FILE)
+    parser.add_argument("--results", type=Path, default=BATCH_RESULTS_FILE)
+    parser.add_argument(
+        "--model",
+        default=None,
+        help=f"model to grade with (default {BATCH_MODEL}; ingest defaults to the submitted one)",
+    )
+    parser.add_argument("--force", action="store_true", help="Include up-to-date submissions")
+    args = parser.parse_args(argv)
+
+    if args.step == "prepare":
+        prepare_batch(args.requests, model_name=args.model or BATCH_MODEL, force=args.force)
+    elif args.step == "submit":
+        submit_batch(args.requests, args.model or BATCH_MODEL)
+    elif args.step == "fetch":
+        fetch_batch_results(args.results)
+    else:
+        ingest_batch_results(args.results, args.requests, model_name=args.model)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,52 @@
+"""Compare the streaming DOCX extractor with the python-docx object model.
+
+Usage: ``python benchmarks/bench_docx_extraction.py [folder] [--repeat N]``
+(defaults to ``input_assessments/``).
+"""
+
+import argparse
+import statistics
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from docx import Document as DocxDocument  # noqa: E402
+
+from text_extraction import extract_docx_fast, extract_text_from_docx  # noqa: E402
+
+
+def python_docx_path(filepath):
+    doc = DocxDocument(filepath)
+    return extract_text_from_docx(doc), doc.core_properties.author or None
+
+
+def time_extractor(extractor, filepath, repeat):
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        extractor(filepath)
+        timings.append(time.perf_counter() - start)
+    return statistics.median(timings)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("folder", nargs="?", type=Path, default=Path("input_assessments"))
+    parser.add_argument("--repeat", type=int, default=20)
+    args = parser.parse_args(argv)
+
+    files = sorted(args.folder.glob("*.docx"))
+    if not files:
+        print(f"No .docx files found in {args.folder}")
+        return
+    print(f"{'file':<45} {'python-docx':>12} {'streaming':>12} {'speed-up':>9}")
+    for filepath in files:
+        slow = time_extractor(python_docx_path, filepath, args.repeat)
+        fast = time_extractor(extract_docx_fast, filepath, args.repeat)
+        print(f"{filepath.name[:45]:<45} {slow * 1000:>10.1f}ms {fast * 1000:>10.1f}ms {slow / fast:>8.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,348 @@
+"""End-to-end throughput benchmark of the grading scripts, without API calls.
+
+Generates synthetic cohorts of DOCX and PDF submissions, then runs
+``grader``, ``bigbraingrader`` and ``draft_grader`` over each cohort against
+the local fake Gemini backend (``benchmarks/fake_gemini.py``). For every run
+it reports files/minute, per-stage time from the trace spans, API request
+counts and peak memory.
+
+Usage::
+
+    python benchmarks/bench_pipeline.py --sizes 10 100 1000
+    python benchmarks/bench_pipeline.py --scripts grader --latency 0.5 \\
+        --error-rate 0.05 --malformed-rate 0.1 --output bench.json
+    python benchmarks/bench_pipeline.py --baseline bench.json  # exit 1 on a regression
+"""
+
+import argparse
+import importlib
+import json
+import logging
+import os
+import random
+import sys
+import tempfile
+import textwrap
+import time
+import tracemalloc
+from pathlib import Path
+
+REPO_ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(REPO_ROOT))
+
+import yaml  # noqa: E402
+from docx import Document as DocxDocument  # noqa: E402
+
+import metrics  # noqa: E402
+import tracing  # noqa: E402
+from benchmarks.fake_gemini import FakeGeminiBackend  # noqa: E402
+
+SCRIPTS = ("grader", "bigbraingrader", "draft_grader")
+REPORT_PATTERNS = {"draft_grader": "*_draft_feedback.docx"}
+DEFAULT_REPORT_PATTERN = "*_graded.docx"
+MAX_REGRESSION = 0.2
+
+_SENTENCES = (
+    "Sam presents with a persistent low mood that has lasted for more than two weeks.",
+    "The client reports anhedonia, poor sleep and difficulty concentrating at work.",
+    "Biological factors include a family history of depression and recent illness.",
+    "Psychological factors include negative automatic thoughts and low self-esteem.",
+    "Social factors include the loss of a close relationship and financial stress.",
+    "The primary diagnosis is major depressive disorder, single episode, moderate.",
+    "Generalised anxiety disorder was considered but the worry is not excessive.",
+    "Adjustment disorder is less likely given the severity and duration of symptoms.",
+    "Cognitive behavioural therapy would target the negative thinking patterns.",
+    "An SSRI could be considered alongside therapy if symptoms do not improve.",
+    "Behavioural activation would help rebuild routine and rewarding activities.",
+    "The evidence from the case study supports each of these conclusions.",
+)
+
+
+def synthetic_paragraphs(rng, words):
+    """Return paragraphs of case-study prose totalling about ``words`` words."""
+    paragraphs = []
+    total = 0
+    while total < words:
+        paragraph = " ".join(rng.choice(_SENTENCES) for _ in range(rng.randint(4, 8)))
+        paragraphs.append(paragraph)
+        total += len(paragraph.split())
+    return paragraphs
+
+
+def write_docx(path, paragraphs, author=None):
+    document = DocxDocument()
+    for paragraph in paragraphs:
+        document.add_paragraph(paragraph)
+    if author:
+        document.core_properties.author = author
+    document.save(path)
+
+
+def _pdf_escape(text):
+    return text.replace("\\", "\\\\").replace("(", "\\(").replace(")", "\\)")
+
+
+def write_pdf(path, paragraphs, lines_per_page=48):
+    """Write a minimal text PDF (Helvetica, one content stream per page)."""
+    lines = []
+    for paragraph in paragraphs:
+        lines.extend(textwrap.wrap(paragraph, 90))
+        lines.append("")
+    pages = [lines[i : i + lines_per_page] for i in range(0, len(lines), lines_per_page)] or [[]]
+
+    objects = {3: b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>"}
+    page_ids = []
+    next_id = 4
+    for page_lines in pages:
+        shown = " ".join(f"({_pdf_escape(line)}) '" for line in page_lines)
+        data = f"BT /F1 10 Tf 14 TL 50 800 Td {shown} ET".encode("latin-1", "replace")
+        content_id, page_id = next_id, next_id + 1
+        next_id += 2
+        objects[content_id] = b"<< /Length %d >>\nstream\n%s\nendstream" % (len(data), data)
+        objects[page_id] = (
+            f"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 595 842] "
+            f"/Resources << /Font << /F1 3 0 R >> >> /Contents {content_id} 0 R >>"
+        ).encode()
+        page_ids.append(page_id)
+    objects[1] = b"<< /Type /Catalog /Pages 2 0 R >>"
+    kids = " ".join(f"{i} 0 R" for i in page_ids)
+    objects[2] = f"<< /Type /Pages /Kids [{kids}] /Count {len(page_ids)} >>".encode()
+
+    out = bytearray(b"%PDF-1.4\n")
+    offsets = {}
+    for i in range(1, next_id):
+        offsets[i] = len(out)
+        out += f"{i} 0 obj\n".encode() + objects[i] + b"\nendobj\n"
+    xref = len(out)
+    out += f"xref\n0 {next_id}\n0000000000 65535 f \n".encode()
+    for i in range(1, next_id):
+        out += f"{offsets[i]:010d} 00000 n \n".encode()
+    out += f"trailer\n<< /Size {next_id} /Root 1 0 R >>\nstartxref\n{xref}\n%%EOF\n".encode()
+    Path(path).write_bytes(bytes(out))
+
+
+def generate_cohort(folder, size, pdf_share=0.2, words=(600, 1500), seed=0):
+    """Write ``size`` synthetic submissions into ``folder`` and return their paths."""
+    rng = random.Random(seed)
+    folder = Path(folder)
+    folder.mkdir(parents=True, exist_ok=True)
+    paths = []
+    for i in range(size):
+        paragraphs = synthetic_paragraphs(rng, rng.randint(*words))
+        name = f"Student{i:04d}_Assessment"
+        if rng.random() < pdf_share:
+            path = folder / f"{name}.pdf"
+            write_pdf(path, paragraphs)
+        else:
+            path = folder / f"{name}.docx"
+            write_docx(path, paragraphs, author=f"Student {i:04d}")
+        paths.append(path)
+    return paths
+
+
+def _model_names(module):
+    names = {value for key, value in vars(module).items() if key.endswith("_MODEL") and isinstance(value, str)}
+    for chain in getattr(module, "MODEL_ROUTES", {}).values():
+        names.update(chain)
+    return sorted(names)
+
+
+def _max_rss_mb():
+    """Return the process's peak resident set size in MB, where available."""
+    try:
+        import resource
+    except ImportError:  # Windows
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return round(peak / (1024 * 1024 if sys.platform == "darwin" else 1024), 1)
+
+
+def run_script(script, cohort_folder, output_folder, backend, concurrency=None, trace_memory=False):
+    """Run one grading script over ``cohort_folder`` and return its measurements."""
+    module = importlib.import_module(script)
+    saved_folders = module.INPUT_FOLDER, module.OUTPUT_FOLDER
+    # ``grader`` uses Path folders, ``draft_grader`` plain strings.
+    module.INPUT_FOLDER = type(saved_folders[0])(cohort_folder)
+    module.OUTPUT_FOLDER = type(saved_folders[1])(output_folder)
+    metrics.get_metrics().reset()
+    tracing.get_tracer().durations = {}
+    backend_before = dict(backend.stats)
+    if trace_memory:
+        tracemalloc.start()
+    start = time.perf_counter()
+    try:
+        with backend.install(_model_names(module), max_concurrency=max(16, concurrency or 0)):
+            if script == "draft_grader":
+                module.main()
+            else:
+                module.run_grading_process(max_concurrency=concurrency)
+        elapsed = time.perf_counter() - start
+        peak_traced = tracemalloc.get_traced_memory()[1] if trace_memory else None
+    finally:
+        if trace_memory:
+            tracemalloc.stop()
+        module.INPUT_FOLDER, module.OUTPUT_FOLDER = saved_folders
+
+    files = [p for p in Path(cohort_folder).iterdir() if p.is_file()]
+    completed = len(list(Path(output_folder).glob(REPORT_PATTERNS.get(script, DEFAULT_REPORT_PATTERN))))
+    durations = tracing.get_tracer().durations
+    api = metrics.get_metrics().snapshot()
+    return {
+        "script": script,
+        "files": len(files),
+        "pdf_files": sum(1 for p in files if p.suffix.lower() == ".pdf"),
+        "completed": completed,
+        "elapsed_seconds": round(elapsed, 3),
+        "files_per_minute": round(len(files) / elapsed * 60, 2) if elapsed else None,
+        "stages": {
+            name: {
+                "total_seconds": round(sum(values), 3),
+                "p50": round(tracing.percentile(values, 50), 4),
+                "p95": round(tracing.percentile(values, 95), 4),
+            }
+            for name, values in sorted(durations.items())
+        },
+        "api": {
+            stage: {
+                "requests": stats["requests"],
+                "retries": stats["retries"],
+                "outcomes": stats["outcomes"],
+                "tokens": stats["prompt_tokens"] + stats["output_tokens"],
+            }
+            for stage, stats in api["by_stage"].items()
+        },
+        "backend": {key: backend.stats[key] - backend_before[key] for key in backend.stats},
+        "escalation_rate": api["cascade"]["escalation_rate"] if api["cascade"]["graded"] else None,
+        "peak_traced_mb": round(peak_traced / (1024 * 1024), 1) if peak_traced is not None else None,
+        "max_rss_mb": _max_rss_mb(),
+    }
+
+
+def run_benchmark(
+    scripts,
+    sizes,
+    backend_options,
+    pdf_share=0.2,
+    concurrency=None,
+    trace_memory=False,
+    seed=0,
+    workdir=None,
+):
+    """Run every script over a cohort of every size; return the result rows."""
+    rubric_config = yaml.safe_load((REPO_ROOT / "rubric.yml").read_text(encoding="utf-8"))
+    backend = FakeGeminiBackend(rubric_config, seed=seed, **backend_options)
+    results = []
+    with tempfile.TemporaryDirectory(dir=workdir) as tmp:
+        tmp = Path(tmp)
+        for size in sizes:
+            cohort = tmp / f"cohort_{size}"
+            generate_cohort(cohort, size, pdf_share=pdf_share, seed=seed)
+            for script in scripts:
+                row = run_script(
+                    script,
+                    cohort,
+                    tmp / f"out_{script}_{size}",
+                    backend,
+                    concurrency=concurrency,
+                    trace_memory=trace_memory,
+                )
+                row["cohort_size"] = size
+                results.append(row)
+                print(_format_row(row), flush=True)
+    return results
+
+
+def _format_row(row):
+    slowest = sorted(row["stages"].items(), key=lambda kv: -kv[1]["total_seconds"])[:3]
+    stages = ", ".join(f"{name} {s['total_seconds']:.1f}s" for name, s in slowest) or "-"
+    memory = row["peak_traced_mb"] if row["peak_traced_mb"] is not None else row["max_rss_mb"]
+    escalated = (
+        f"  {row['escalation_rate']:.0%} escalated" if row.get("escalation_rate") is not None else ""
+    )
+    return (
+        f"{row['script']:<15} n={row['cohort_size']:<5} {row['completed']:>5}/{row['files']:<5} "
+        f"{row['files_per_minute'] or 0:>9.1f} files/min  {row['elapsed_seconds']:>8.1f}s  "
+        f"peak {memory} MB{escalated}  [{stages}]"
+    )
+
+
+def find_regressions(results, baseline, max_regression=MAX_REGRESSION):
+    """Return messages for runs whose throughput fell more than ``max_regression``."""
+    previous = {(row["script"], row["cohort_size"]): row for row in baseline}
+    regressions = []
+    for row in results:
+        old = previous.get((row["script"], row["cohort_size"]))
+        if not old or not old.get("files_per_minute") or row["files_per_minute"] is None:
+            continue
+        change = row["files_per_minute"] / old["files_per_minute"] - 1
+        if change < -max_regression:
+            regressions.append(
+                f"{row['script']} n={row['cohort_size']}: {row['files_per_minute']:.1f} files/min, "
+                f"{-change:.0%} below the baseline {old['files_per_minute']:.1f}"
+            )
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--scripts", nargs="+", choices=SCRIPTS, default=list(SCRIPTS))
+    parser.add_argument("--sizes", nargs="+", type=int, default=[10, 100])
+    parser.add_argument("--pdf-share", type=float, default=0.2, help="fraction of PDF submissions")
+    parser.add_argument("--latency", type=float, default=0.8, help="median request latency (s)")
+    parser.add_argument("--latency-sigma", type=float, default=0.4)
+    parser.add_argument("--error-rate", type=float, default=0.02)
+    parser.add_argument("--error-codes", nargs="+", type=int, default=[429, 503])
+    parser.add_argument("--malformed-rate", type=float, default=0.05)
+    parser.add_argument(
+        "--disagreement-rate", type=float, default=0.1, help="sampled grades that change bands"
+    )
+    parser.add_argument("--output-tokens", type=int, default=600)
+    parser.add_argument("--concurrency", type=int, help="submissions in flight (grader default)")
+    parser.add_argument("--trace-memory", action="store_true", help="measure peak heap with tracemalloc")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--workdir", type=Path, help="where to generate cohorts (default: temp dir)")
+    parser.add_argument("--output", type=Path, help="write the results as JSON")
+    parser.add_argument("--baseline", type=Path, help="fail if slower than these JSON results")
+    parser.add_argument("--max-regression", type=float, default=MAX_REGRESSION)
+    parser.add_argument("--verbose", action="store_true", help="show the scripts' INFO logging")
+    args = parser.parse_args(argv)
+
+    # The scripts read their prompts and rubric relative to the repository.
+    os.chdir(REPO_ROOT)
+    for script in args.scripts:
+        importlib.import_module(script)  # configures logging on import
+    if not args.verbose:
+        logging.getLogger().setLevel(logging.WARNING)
+    results = run_benchmark(
+        args.scripts,
+        args.sizes,
+        {
+            "latency_median": args.latency,
+            "latency_sigma": args.latency_sigma,
+            "error_rate": args.error_rate,
+            "error_codes": args.error_codes,
+            "malformed_rate": args.malformed_rate,
+            "disagreement_rate": args.disagreement_rate,
+            "output_tokens": args.output_tokens,
+        },
+        pdf_share=args.pdf_share,
+        concurrency=args.concurrency,
+        trace_memory=args.trace_memory,
+        seed=args.seed,
+        workdir=args.workdir,
+    )
+    if args.output:
+        args.output.write_text(json.dumps(results, indent=2), encoding="utf-8")
+        print(f"Results written to {args.output}")
+    if args.baseline:
+        regressions = find_regressions(
+            results, json.loads(args.baseline.read_text(encoding="utf-8")), args.max_regression
+        )
+        for message in regressions:
+            print(f"REGRESSION: {message}")
+        return 1 if regressions else 0
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
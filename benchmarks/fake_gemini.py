@@ -0,0 +1,306 @@
+"""Local stand-in for the Gemini API, for offline benchmarks.
+
+:class:`FakeGeminiBackend` answers ``generate_content`` calls with plausible
+replies instead of calling the API: JSON or YAML grades built from the
+``rubric.yml`` criteria, JSON or prose reviews, and prose draft feedback. It
+can be tuned to behave like a loaded API:
+
+``latency_median`` / ``latency_sigma``
+    Each request takes a log-normally distributed time (seconds); streamed
+    replies spread it over their chunks after a time to first token.
+``error_rate`` / ``error_codes``
+    The fraction of requests that fail, and the status codes to fail with
+    (429 and 503 are retried by the rate limiter, others are not).
+``malformed_rate``
+    The fraction of grading replies that come back truncated, exercising the
+    repair path.
+``disagreement_rate``
+    Bands are a stable function of the prompt; this is the fraction of
+    sampled (``temperature`` > 0) grades that pick different bands, which
+    drives the self-consistency check of the Flash/Pro cascade.
+``output_tokens``
+    The approximate size of each grading reply; usage metadata reports
+    prompt, output and cached-prefix token counts.
+
+``with backend.install(model_names):`` routes ``gemini_client`` to the fake,
+serves prompt prefixes from an in-process cache, turns off the response and
+extraction caches and lifts the rate limits, restoring everything on exit.
+"""
+
+import hashlib
+import json
+import math
+import os
+import random
+import threading
+import time
+from contextlib import contextmanager
+
+import yaml
+
+import gemini_client
+import prompt_cache
+import rate_limiter
+import response_cache
+import text_extraction
+from rate_limiter import RateLimiter, estimate_tokens
+
+STREAM_CHUNK_CHARS = 400
+# Share of the request latency spent before the first streamed chunk.
+TIME_TO_FIRST_TOKEN_SHARE = 0.3
+
+
+class FakeApiError(Exception):
+    """An injected API failure with a ``code`` the rate limiter understands."""
+
+    def __init__(self, code):
+        super().__init__(f"{code} injected fake Gemini error")
+        self.code = code
+
+
+class FakeUsage:
+    def __init__(self, prompt_tokens, output_tokens, cached_tokens=0):
+        self.prompt_token_count = prompt_tokens
+        self.candidates_token_count = output_tokens
+        self.cached_content_token_count = cached_tokens
+        self.total_token_count = prompt_tokens + output_tokens
+
+
+class FakeChunk:
+    def __init__(self, text):
+        self.text = text
+
+
+class FakeResponse:
+    """Looks enough like ``GenerateContentResponse`` for ``gemini_client``."""
+
+    def __init__(self, text, usage, chunk_delays=None):
+        self.text = text
+        self.parts = [text] if text else []
+        self.prompt_feedback = None
+        self.usage_metadata = usage
+        self._chunk_delays = chunk_delays
+
+    def __iter__(self):
+        chunks = [
+            self.text[i : i + STREAM_CHUNK_CHARS]
+            for i in range(0, len(self.text), STREAM_CHUNK_CHARS)
+        ]
+        for chunk, delay in zip(chunks, self._chunk_delays or [0] * len(chunks)):
+            time.sleep(delay)
+            yield FakeChunk(chunk)
+
+
+class FakeModel:
+    """A ``GenerativeModel`` replacement bound to a backend and settings."""
+
+    def __init__(self, backend, model_name, generation_config=None, prefix_text=None):
+        self.backend = backend
+        self.model_name = model_name
+        self.generation_config = generation_config or {}
+        self.prefix_text = prefix_text
+
+    def generate_content(self, contents, stream=False):
+        return self.backend.respond(self, contents, stream)
+
+
+class _CachedPrefix:
+    def __init__(self, name, model_name, prefix_text):
+        self.name = name
+        self.model_name = model_name
+        self.prefix_text = prefix_text
+
+
+def _flatten(contents):
+    """Return the text of a prompt or its parts."""
+    if isinstance(contents, str):
+        return contents
+    if isinstance(contents, (list, tuple)):
+        return "\n".join(_flatten(part) for part in contents)
+    return str(contents)
+
+
+class FakeGeminiBackend:
+    """Configurable fake model backend; see the module docstring."""
+
+    def __init__(
+        self,
+        rubric_config,
+        latency_median=0.8,
+        latency_sigma=0.4,
+        error_rate=0.0,
+        error_codes=(429, 503),
+        malformed_rate=0.0,
+        disagreement_rate=0.1,
+        output_tokens=600,
+        seed=0,
+    ):
+        self.criteria = list(rubric_config["criteria"])
+        self.latency_median = latency_median
+        self.latency_sigma = latency_sigma
+        self.error_rate = error_rate
+        self.error_codes = tuple(error_codes)
+        self.malformed_rate = malformed_rate
+        self.disagreement_rate = disagreement_rate
+        self.output_tokens = output_tokens
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        self.stats = {"requests": 0, "errors": 0, "malformed": 0, "prefixes": 0}
+
+    # --- request handling ---
+
+    def _draw(self, sampled=False):
+        """Return ``(latency, error_code, malformed, band_seed)`` for one request.
+
+        ``band_seed`` is ``None`` unless a ``sampled`` request disagrees.
+        """
+        with self._lock:
+            self.stats["requests"] += 1
+            latency = 0.0
+            if self.latency_median > 0:
+                latency = self._random.lognormvariate(
+                    math.log(self.latency_median), self.latency_sigma
+                )
+            error_code = None
+            if self._random.random() < self.error_rate:
+                error_code = self._random.choice(self.error_codes)
+                self.stats["errors"] += 1
+            malformed = self._random.random() < self.malformed_rate
+            band_seed = None
+            if sampled and self._random.random() < self.disagreement_rate:
+                band_seed = self._random.random()
+        return latency, error_code, malformed, band_seed
+
+    def respond(self, model, contents, stream=False):
+        sampled = bool(model.generation_config.get("temperature"))
+        latency, error_code, malformed, band_seed = self._draw(sampled)
+        if error_code is not None:
+            time.sleep(latency * TIME_TO_FIRST_TOKEN_SHARE)
+            raise FakeApiError(error_code)
+
+        prompt_text = _flatten(contents)
+        if band_seed is None:
+            digest = hashlib.sha256(prompt_text.encode("utf-8")).digest()
+            band_seed = int.from_bytes(digest[:8], "big") / 2**64
+        text = self._reply_text(model.generation_config, prompt_text, band_seed)
+        if malformed and self._is_grade(model.generation_config, prompt_text):
+            with self._lock:
+                self.stats["malformed"] += 1
+            text = text[: int(len(text) * 0.7)]
+
+        cached_tokens = estimate_tokens(model.prefix_text) if model.prefix_text else 0
+        usage = FakeUsage(
+            estimate_tokens(prompt_text) + cached_tokens, estimate_tokens(text), cached_tokens
+        )
+        if not stream:
+            time.sleep(latency)
+            return FakeResponse(text, usage)
+        n_chunks = max(1, math.ceil(len(text) / STREAM_CHUNK_CHARS))
+        first = latency * TIME_TO_FIRST_TOKEN_SHARE
+        rest = (latency - first) / n_chunks
+        return FakeResponse(text, usage, [first + rest] + [rest] * (n_chunks - 1))
+
+    # --- reply content ---
+
+    @staticmethod
+    def _schema_properties(generation_config):
+        schema = (generation_config or {}).get("response_schema") or {}
+        return schema.get("properties") or {}
+
+    def _is_grade(self, generation_config, prompt_text):
+        if self._schema_properties(generation_config):
+            return "assistant_reasons" in self._schema_properties(generation_config)
+        return "assistant_reasons" in prompt_text and "ADJUSTMENT" not in prompt_text
+
+    def _reasons(self, band_seed):
+        # About 3/4 of a word per token, spread over the criteria.
+        words_per_reason = max(20, self.output_tokens * 3 // 4 // max(1, len(self.criteria)))
+        filler = "The response addresses the criterion with supporting detail.".split()
+        thinking = " ".join(filler[i % len(filler)] for i in range(words_per_reason))
+        return [
+            {
+                "criterion": cid,
+                "thinking_process": thinking,
+                "evidence": "Quoted evidence from the submission.",
+                "band": 2 + int((band_seed * 7 + i) % 4),
+                "rationale": "Meets most band descriptors for this criterion.",
+                "improvements": ["Link the evidence more explicitly to the criterion."],
+                "confidence": 0.9,
+            }
+            for i, cid in enumerate(self.criteria)
+        ]
+
+    def _reply_text(self, generation_config, prompt_text, band_seed):
+        properties = self._schema_properties(generation_config)
+        if "assistant_reasons" in properties:
+            return json.dumps({"assistant_reasons": self._reasons(band_seed)})
+        if "adjustments" in properties:
+            return json.dumps({"issues": [], "adjustments": [], "recommended_total": None})
+        if self._is_grade(generation_config, prompt_text):
+            body = yaml.safe_dump({"assistant_reasons": self._reasons(band_seed)}, sort_keys=False)
+            return f"```yaml\n{body}```"
+        if "ADJUSTMENT" in prompt_text:
+            return "No issues found."
+        return "Overall this is a solid draft. " * max(1, self.output_tokens // 8)
+
+    # --- prompt-prefix cache backend interface (see ``prompt_cache``) ---
+
+    def create(self, model_name, prefix_text, ttl_seconds):
+        with self._lock:
+            self.stats["prefixes"] += 1
+            name = f"cachedContents/fake-{self.stats['prefixes']}"
+        return _CachedPrefix(name, model_name, prefix_text)
+
+    def refresh(self, handle, ttl_seconds):
+        pass
+
+    def model_for(self, handle, safety_settings, generation_config=None):
+        return FakeModel(self, handle.model_name, generation_config, handle.prefix_text)
+
+    def delete(self, handle):
+        pass
+
+    # --- installation ---
+
+    @contextmanager
+    def install(self, model_names, max_concurrency=16, backoff_scale=0.01):
+        """Route all Gemini traffic for ``model_names`` to this backend.
+
+        Rate limits are lifted to ``max_concurrency`` requests in flight and
+        retry backoff sleeps are scaled by ``backoff_scale``.
+        """
+        limiter = RateLimiter(sleep=lambda seconds: time.sleep(seconds * backoff_scale))
+        for name in model_names:
+            limiter.set_model_limits(
+                name, rpm=10**9, tpm=10**12, max_concurrency=max_concurrency
+            )
+        saved = (
+            gemini_client.get_model,
+            prompt_cache._shared_prefix_cache,
+            rate_limiter._shared_limiter,
+            response_cache.RESPONSE_CACHE_ENABLED,
+            text_extraction.EXTRACTION_CACHE_ENABLED,
+            os.environ.get("GEMINI_API_KEY"),
+        )
+        gemini_client.get_model = lambda name, api_key, config=None: FakeModel(self, name, config)
+        prompt_cache._shared_prefix_cache = prompt_cache.PrefixCache(self)
+        rate_limiter._shared_limiter = limiter
+        response_cache.RESPONSE_CACHE_ENABLED = False
+        # Every run parses its cohort afresh and leaves no .extraction_cache behind.
+        text_extraction.EXTRACTION_CACHE_ENABLED = False
+        os.environ["GEMINI_API_KEY"] = saved[5] or "fake-benchmark-key"
+        try:
+            yield self
+        finally:
+            (
+                gemini_client.get_model,
+                prompt_cache._shared_prefix_cache,
+                rate_limiter._shared_limiter,
+                response_cache.RESPONSE_CACHE_ENABLED,
+                text_extraction.EXTRACTION_CACHE_ENABLED,
+                api_key,
+            ) = saved
+            if api_key is None:
+                os.environ.pop("GEMINI_API_KEY", None)
+            else:
+                os.environ["GEMINI_API_KEY"] = api_key
@@ -0,0 +1,142 @@
+"""Incremental build manifest for the grading scripts.
+
+The manifest in ``<output folder>/.grading_manifest.json`` records, per
+submission, the content hashes of every input that went into its outputs.
+``run_grading_process`` compares them with the current inputs and redoes only
+the stages whose inputs changed:
+
+``grade``
+    The submission, master prompt, review prompt or model changed, or there
+    is no stored result yet. Extraction and API calls run again.
+``rescore``
+    Only ``rubric.yml`` changed. The stored model output is re-scored and
+    the report re-rendered without calling the API.
+``render``
+    Nothing changed but the report is missing; it is rendered from the
+    stored grade.
+"""
+
+import json
+import logging
+import os
+import threading
+from pathlib import Path
+
+from response_cache import file_fingerprint
+
+MANIFEST_FILE = ".grading_manifest.json"
+MANIFEST_VERSION = 2
+# Inputs whose change requires new model output, and inputs only used locally.
+GRADE_INPUTS = ("submission", "master_prompt", "review_prompt", "model")
+SCORE_INPUTS = ("rubric",)
+
+
+def scan_submission_files(folder):
+    """Scan ``folder`` once, returning ``(sorted file paths, total entries)``."""
+    files = []
+    total = 0
+    with os.scandir(folder) as entries:
+        for entry in entries:
+            total += 1
+            if entry.is_file():
+                files.append(Path(entry.path))
+    return sorted(files), total
+
+
+def assign_student_identifiers(paths, guess_identifier):
+    """Map each path to a unique identifier for its output files.
+
+    ``guess_identifier`` derives the base name. When two submissions share a
+    guess, later ones (in sorted order) get a ``_2``, ``_3``... suffix so they
+    no longer overwrite each other's reports.
+    """
+    identifiers = {}
+    taken = set()
+    for path in sorted(paths):
+        base = guess_identifier(path)
+        identifier = base
+        n = 2
+        while identifier in taken:
+            identifier = f"{base}_{n}"
+            n += 1
+        if identifier != base:
+            logging.warning(
+                f"Student identifier '{base}' is shared by several files; using "
+                f"'{identifier}' for {Path(path).name}."
+            )
+        taken.add(identifier)
+        identifiers[path] = identifier
+    return identifiers
+
+
+def shared_input_fingerprints(model_name, **files):
+    """Return ``{name: fingerprint}`` for the run-wide inputs.
+
+    ``files`` maps input names to paths; a missing file fingerprints as
+    ``None``. ``model_name`` is recorded as-is.
+    """
+    fingerprints = {"model": model_name}
+    for name, path in files.items():
+        fingerprints[name] = file_fingerprint(path) if Path(path).exists() else None
+    return fingerprints
+
+
+class BuildManifest:
+    """Per-submission input hashes from the last successful build."""
+
+    def __init__(self, path):
+        self.path = Path(path)
+        self._lock = threading.Lock()
+        self.entries = {}
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+            if data.get("version") == MANIFEST_VERSION:
+                self.entries = data.get("submissions") or {}
+        except FileNotFoundError:
+            pass
+        except Exception as e:
+            logging.warning(f"Ignoring unreadable build manifest {self.path}: {e}")
+
+    def stage_for(self, name, identifier, inputs, report_exists, result_exists):
+        """Return the first stage to run for submission ``name``, or ``None``."""
+        entry = self.entries.get(name)
+        if entry is None or not result_exists or entry.get("identifier") != identifier:
+            return "grade"
+        recorded = entry.get("inputs") or {}
+        if any(recorded.get(key) != inputs.get(key) for key in GRADE_INPUTS):
+            return "grade"
+        if any(recorded.get(key) != inputs.get(key) for key in SCORE_INPUTS):
+            return "rescore"
+        if not report_exists:
+            return "render"
+        return None
+
+    def summary_row(self, name):
+        """Return the summary CSV row recorded for ``name`` by the last build, if any."""
+        row = (self.entries.get(name) or {}).get("summary")
+        return tuple(row) if row else None
+
+    def record(self, name, identifier, inputs, summary_row):
+        """Record a submission whose outputs were built from ``inputs``."""
+        with self._lock:
+            self.entries[name] = {
+                "identifier": identifier,
+                "inputs": dict(inputs),
+                "summary": list(summary_row),
+            }
+
+    def save(self, keep=None):
+        """Write the manifest, dropping entries not named in ``keep``."""
+        with self._lock:
+            if keep is not None:
+                keep = set(keep)
+                self.entries = {k: v for k, v in self.entries.items() if k in keep}
+            data = {"version": MANIFEST_VERSION, "submissions": self.entries}
+            try:
+                self.path.parent.mkdir(parents=True, exist_ok=True)
+                tmp_path = self.path.with_suffix(".tmp")
+                tmp_path.write_text(json.dumps(data, indent=2), encoding="utf-8")
+                os.replace(tmp_path, self.path)
+            except Exception as e:
+                logging.error(f"Failed to save build manifest {self.path}: {e}")
@@ -0,0 +1,85 @@
+"""Decide which Flash-graded submissions are escalated to Pro.
+
+In cascade mode ``bigbraingrader`` grades every submission with Flash first
+and only sends it to Pro when :func:`escalation_reasons` returns a reason;
+an empty list keeps the Flash grade. The reasons are:
+
+``parse``
+    The Flash reply could not be parsed, even after local repairs (always
+    escalated).
+``boundary``
+    A criterion's band sits next to a threshold in a ``rubric.yml`` rule, or
+    in a band listed under ``cascade_policy.boundary_bands``.
+``inconsistent``
+    Extra Flash samples (``consistency_samples``) agree on fewer than
+    ``min_agreement`` of the criteria bands.
+``review``
+    The Flash review suggested changing a band.
+
+The policy is read from the optional ``cascade_policy`` section of
+``rubric.yml``.
+"""
+
+from review_policy import boundary_hits, parsed_bands
+from rubric_engine import compile_rubric, normalize_criterion_key
+
+DEFAULT_CASCADE_POLICY = {
+    "escalate_on_boundary": True,
+    "escalate_on_review": True,
+    "consistency_samples": 1,
+    "min_agreement": 0.75,
+    "boundary_bands": {},
+}
+
+
+def load_cascade_policy(rubric_config):
+    """Return the cascade policy from ``rubric_config`` merged over the defaults."""
+    policy = dict(DEFAULT_CASCADE_POLICY)
+    policy.update(rubric_config.get("cascade_policy") or {})
+    return policy
+
+
+def band_agreement(samples, rubric_config):
+    """Return the fraction of criteria on which every parsed sample gives the same band."""
+    rubric = compile_rubric(rubric_config)
+    resolved = [rubric.resolve_bands(parsed_bands(sample)) for sample in samples]
+    if len(resolved) < 2:
+        return 1.0
+    agreeing = sum(len({bands[cid] for bands in resolved}) == 1 for cid in rubric.criteria)
+    return agreeing / len(rubric.criteria)
+
+
+def escalation_reasons(parsed_data, rubric_config, *, samples=(), review_adjustments=None):
+    """Return the reasons to regrade a Flash grade with Pro (empty to keep it).
+
+    ``parsed_data`` is the parsed Flash reply (``None`` if it did not parse),
+    ``samples`` the parsed extra Flash samples and ``review_adjustments`` the
+    band changes suggested by the Flash review, if one ran.
+    """
+    if parsed_data is None:
+        return ["parse"]
+
+    policy = load_cascade_policy(rubric_config)
+    rubric = compile_rubric(rubric_config)
+    bands = rubric.resolve_bands(parsed_bands(parsed_data))
+    reasons = []
+
+    if policy["escalate_on_boundary"]:
+        reasons.extend(boundary_hits(bands, rubric, policy.get("boundary_bands")))
+
+    if samples:
+        agreement = band_agreement([parsed_data, *samples], rubric_config)
+        if agreement < float(policy["min_agreement"]):
+            reasons.append(f"inconsistent:{agreement:.2f}")
+
+    if policy["escalate_on_review"] and review_adjustments:
+        for key, band in review_adjustments.items():
+            cid = rubric.key_lookup.get(normalize_criterion_key(key))
+            if cid is not None and bands[cid] != int(band):
+                reasons.append(f"review:{cid}={bands[cid]}->{int(band)}")
+    return reasons
+
+
+def reason_kind(reason):
+    """Return the kind of an escalation reason (``"boundary:a=2"`` -> ``"boundary"``)."""
+    return reason.split(":", 1)[0]
@@ -1,13 +1,18 @@
 import os
 import re
 import logging
-import time # For potential delays
 from dotenv import load_dotenv
-import google.generativeai as genai
-from docx import Document as DocxDocument
 # from docx.shared import Pt # Not strictly needed for basic prose dump
 # from docx.enum.text import WD_ALIGN_PARAGRAPH # Not strictly needed
 
+import metrics
+import model_router
+from model_router import ModelRouter
+from text_extraction import extract_text_from_file
+from prompt_cache import get_prefix_cache
+from report_renderer import RenderPool, render_draft_report
+from response_cache import file_fingerprint, get_response_cache
+
 # --- Configuration ---
 INPUT_FOLDER = "input_assessments"
 OUTPUT_FOLDER = "output_draft_feedback" # Separate output folder for draft feedback
@@ -17,9 +22,16 @@ REVIEW_PROMPT_FILE = "feedback_review_prompt.txt"  # Prompt for comparing feedba
 LOG_FILE = "draft_grading_process.log"
 # Folder containing scenario text files
 SCENARIO_FOLDER = "Diagnosis scenarios"
-# Set to True if you want to add a delay between API calls (e.g., to respect free tier limits)
-USE_API_DELAY = True
-API_DELAY_SECONDS = 20 # Delay in seconds (e.g., 20-30 for gemini-1.5-flash)
+# Using gemini-1.5-flash-latest as it has better free tier quotas.
+# Request pacing is handled by the shared limiter in rate_limiter.py and
+# clients are reused across calls via gemini_client.py.
+GEMINI_MODEL = "gemini-1.5-flash-latest"
+# Models tried in order per stage; a throttled or failing model falls through to the next
+MODEL_ROUTES = {
+    "draft": [GEMINI_MODEL, "gemini-1.5-pro-latest"],
+    "review": [GEMINI_MODEL, "gemini-1.5-pro-latest"],
+}
+MODEL_ROUTER = ModelRouter(MODEL_ROUTES, default_stage="draft")
 
 # Setup basic logging
 logging.basicConfig(
@@ -57,79 +69,6 @@ def sanitize_for_filename(text):
     sanitized = re.sub(r"[^A-Za-z0-9_-]+", "_", text.strip())
     return sanitized.strip("_")
 
-def extract_text_from_docx(doc):
-    """Extract text from paragraphs and tables in a DOCX Document."""
-    text_parts = []
-    for para in doc.paragraphs:
-        if para.text:
-            text_parts.append(para.text)
-    for table in doc.tables:
-        for row in table.rows:
-            for cell in row.cells:
-                for para in cell.paragraphs:
-                    if para.text:
-                        text_parts.append(para.text)
-    return "\n".join(text_parts)
-
-
-def extract_text_from_file(filepath):
-    """Extracts text and author metadata from supported files.
-
-    Returns a tuple ``(text, author)`` where ``author`` may be ``None`` if not
-    available.
-    """
-    _, extension = os.path.splitext(filepath)
-    text = ""
-    doc_author = None
-    try:
-        if extension.lower() == ".docx":
-            doc = DocxDocument(filepath)
-            doc_author = doc.core_properties.author or None
-            for para in doc.paragraphs:
-                text += para.text + "\n"
-
-            text = extract_text_from_docx(doc)
-        elif extension.lower() == ".pdf":
-            # Lazy import PyPDF2 to avoid error if not installed and not processing PDFs
-            try:
-                import PyPDF2
-            except ImportError:
-                logging.error("PyPDF2 library is not installed. Please install it to process PDF files: pip install PyPDF2")
-                return None, None
-
-            with open(filepath, "rb") as f:
-                reader = PyPDF2.PdfReader(f)
-                if reader.is_encrypted:
-                    logging.warning(f"PDF '{filepath}' is encrypted. Attempting to read anyway if default password allows.")
-                for page_num in range(len(reader.pages)):
-                    page = reader.pages[page_num]
-                    try:
-                        extracted_page_text = page.extract_text()
-                        if extracted_page_text: # Ensure text was actually extracted
-                             text += extracted_page_text + "\n"
-                    except Exception as page_e:
-                        logging.warning(f"Could not extract text from page {page_num+1} of {filepath}: {page_e}")
-        else: # Attempt plain text for other files
-            logging.info(f"Attempting to read '{filepath}' as plain text.")
-            with open(filepath, "r", encoding="utf-8", errors="ignore") as f:
-                text = f.read()
-        
-        text = re.sub(r'\s{3,}', '\n\n', text).strip()
-        if not text.strip():
-            logging.warning(f"No text extracted or file is empty: {filepath}")
-            return None, None
-        return text, doc_author
-
-    except FileNotFoundError:
-        logging.error(f"File not found: {filepath}")
-        return None, None
-    except Exception as e: # Catching general exception from PyPDF2 if it was imported
-        if 'PyPDF2' in str(type(e)): # Check if it's a PyPDF2 error
-             logging.error(f"Could not read PDF (possibly corrupted or password protected): {filepath} - {e}")
-             return None, None
-        logging.error(f"Error extracting text from {filepath}: {e}")
-        return None, None
-
 def load_draft_prompt_template():
     """Load the draft feedback prompt and inject the rubric JSON if needed."""
     try:
@@ -242,45 +181,23 @@ def construct_prompt_messages(student_text, master_prompt_template, scenario_tex
     return [master_prompt_template + "\n\n" + combined_text]
 
 
-def call_gemini_api(prompt, api_key):
+def call_gemini_api(prompt, api_key, stage="draft"):
     """Calls the Gemini API and returns the response text.
 
     ``prompt`` may be a single string or a list of prompt parts, allowing large
-    submissions to be sent as a multi-turn request.
+    submissions to be sent as a multi-turn request. The request goes to the
+    models routed for ``stage`` (see ``MODEL_ROUTES``).
     """
-    genai.configure(api_key=api_key)
-    # Using gemini-1.5-flash-latest as it has better free tier quotas
-    model_name = 'gemini-1.5-flash-latest'
-    logging.info(f"Using Gemini model: {model_name}")
-    model = genai.GenerativeModel(model_name)
-    
-    safety_settings = [
-        {"category": "HARM_CATEGORY_HARASSMENT", "threshold": "BLOCK_NONE"},
-        {"category": "HARM_CATEGORY_HATE_SPEECH", "threshold": "BLOCK_NONE"},
-        {"category": "HARM_CATEGORY_SEXUALLY_EXPLICIT", "threshold": "BLOCK_NONE"},
-        {"category": "HARM_CATEGORY_DANGEROUS_CONTENT", "threshold": "BLOCK_NONE"},
-    ]
-    try:
-        logging.info("Sending request to Gemini API...")
-        response = model.generate_content(prompt, safety_settings=safety_settings)
-        
-        if not response.parts:
-            if response.prompt_feedback and response.prompt_feedback.block_reason:
-                logging.error(f"Gemini API request blocked. Reason: {response.prompt_feedback.block_reason_message}")
-                return None
-            else:
-                logging.error("Gemini API returned an empty response with no parts.")
-                return None
-        
-        ai_response_text = response.text
-        logging.info("Received response from Gemini API.")
-        return ai_response_text.strip() # Strip any leading/trailing whitespace
-    except Exception as e:
-        logging.error(f"Gemini API call failed: {e}")
-        # Log more details if it's a specific Google API error
-        if hasattr(e, 'message'):
-            logging.error(f"Google API Error Message: {e.message}")
+    ai_response_text = MODEL_ROUTER.generate(
+        stage,
+        prompt,
+        api_key,
+        cache_context={"rubric": file_fingerprint(RUBRIC_PROMPT_FILE)},
+    )
+    if ai_response_text is None:
         return None
+    return ai_response_text.strip() # Strip any leading/trailing whitespace
+
 
 def review_feedback(student_text, feedback_text, api_key, review_prompt_template=None):
     """Sends student text and AI feedback to Gemini for accuracy review."""
@@ -303,50 +220,19 @@ def review_feedback(student_text, feedback_text, api_key, review_prompt_template
         logging.warning("Draft feedback placeholder missing in review prompt template")
         prompt += f"\n\nAI DRAFT FEEDBACK:\n{feedback_text}"
 
-    return call_gemini_api(prompt, api_key)
-
-def _add_formatted_run(paragraph, text):
-    """Adds text to a paragraph, interpreting **bold** markdown syntax."""
-    parts = re.split(r"(\*\*[^*]+\*\*)", text)
-    for part in parts:
-        if part.startswith("**") and part.endswith("**") and len(part) > 4:
-            run = paragraph.add_run(part[2:-2])
-            run.bold = True
-        else:
-            paragraph.add_run(part)
+    return call_gemini_api(prompt, api_key, stage="review")
 
+def save_draft_feedback_to_docx(feedback_prose, output_filepath, student_identifier, render_pool=None):
+    """Saves the AI-generated prose feedback to a nicely formatted DOCX file.
 
-def save_draft_feedback_to_docx(feedback_prose, output_filepath, student_identifier):
-    """Saves the AI-generated prose feedback to a nicely formatted DOCX file."""
+    The report is rendered from the report template by ``report_renderer``;
+    with ``render_pool`` it is queued on that :class:`RenderPool` and the
+    render's future is returned.
+    """
+    if render_pool is not None:
+        return render_pool.submit(render_draft_report, feedback_prose, output_filepath, student_identifier)
     try:
-        doc = DocxDocument()
-        doc.add_heading(f"Draft Feedback Report for: {student_identifier}", level=1)
-
-        bullet_styles = ["List Bullet", "List Bullet 2", "List Bullet 3"]
-
-        for raw_line in feedback_prose.splitlines():
-            line = raw_line.rstrip()
-            if not line.strip():
-                doc.add_paragraph()
-                continue
-
-            if line.startswith("**") and line.endswith("**") and len(line) > 4:
-                heading_text = line.strip("*")
-                doc.add_heading(heading_text, level=2)
-                continue
-
-            bullet_match = re.match(r"^(\s*)\*\s+(.*)", line)
-            if bullet_match:
-                indent, bullet_text = bullet_match.groups()
-                level = min(len(indent) // 4, 2)
-                para = doc.add_paragraph(style=bullet_styles[level])
-                _add_formatted_run(para, bullet_text.strip())
-                continue
-
-            para = doc.add_paragraph()
-            _add_formatted_run(para, line.strip())
-
-        doc.save(output_filepath)
+        render_draft_report(feedback_prose, output_filepath, student_identifier)
         logging.info(f"Draft feedback report saved to: {output_filepath}")
     except Exception as e:
         logging.error(f"Failed to create DOCX draft report for {student_identifier}: {e}")
@@ -369,85 +255,96 @@ def main():
     if not os.path.exists(OUTPUT_FOLDER):
         os.makedirs(OUTPUT_FOLDER)
         logging.info(f"Created output folder for draft feedback: {OUTPUT_FOLDER}")
+    get_response_cache().evict()
 
     processed_files = 0
     successful_feedback_generations = 0
     
     assessment_files = [f for f in os.listdir(INPUT_FOLDER) if os.path.isfile(os.path.join(INPUT_FOLDER, f))]
-
-    for i, filename in enumerate(assessment_files):
-        filepath = os.path.join(INPUT_FOLDER, filename)
+    # Reports render in worker processes while the next submission is sent;
+    # leaving the block waits for them.
+    with RenderPool() as render_pool:
+        for i, filename in enumerate(assessment_files):
+            filepath = os.path.join(INPUT_FOLDER, filename)
         
-        logging.info(f"--- Processing file ({i+1}/{len(assessment_files)}): {filename} ---")
-        processed_files += 1
-
-        student_identifier = get_student_identifier_from_filename(filename)
-
-        extracted_text, doc_author = extract_text_from_file(filepath)
-        if not extracted_text:
-            logging.warning(f"Skipping {filename} due to text extraction failure or empty content.")
-            continue
-
-        word_count = len(extracted_text.split())
-        logging.info(f"Extracted approx. {word_count} words from {filename}.")
-        if word_count < 50 : # Arbitrary threshold
-             logging.warning(f"Extracted text for {filename} is very short ({word_count} words). Feedback might be limited.")
-
-        scenario_path = detect_scenario(extracted_text, scenario_map)
-        scenario_text = load_text_file(scenario_path) if scenario_path else None
-        if scenario_text:
-            logging.info(
-                f"Detected scenario text from '{os.path.basename(scenario_path)}' for {filename}."
-            )
-        else:
-            logging.info("No specific scenario detected; proceeding without scenario context.")
+            logging.info(f"--- Processing file ({i+1}/{len(assessment_files)}): {filename} ---")
+            processed_files += 1
+
+            student_identifier = get_student_identifier_from_filename(filename)
 
-        full_prompt = construct_full_prompt(extracted_text, draft_prompt_template, scenario_text)
-        prompt_messages = construct_prompt_messages(extracted_text, draft_prompt_template, scenario_text)
+            extracted_text, doc_author = extract_text_from_file(filepath)
+            if not extracted_text:
+                logging.warning(f"Skipping {filename} due to text extraction failure or empty content.")
+                continue
+
+            word_count = len(extracted_text.split())
+            logging.info(f"Extracted approx. {word_count} words from {filename}.")
+            if word_count < 50 : # Arbitrary threshold
+                 logging.warning(f"Extracted text for {filename} is very short ({word_count} words). Feedback might be limited.")
+
+            scenario_path = detect_scenario(extracted_text, scenario_map)
+            scenario_text = load_text_file(scenario_path) if scenario_path else None
+            if scenario_text:
+                logging.info(
+                    f"Detected scenario text from '{os.path.basename(scenario_path)}' for {filename}."
+                )
+            else:
+                logging.info("No specific scenario detected; proceeding without scenario context.")
+
+            full_prompt = construct_full_prompt(extracted_text, draft_prompt_template, scenario_text)
+            prompt_messages = construct_prompt_messages(extracted_text, draft_prompt_template, scenario_text)
         
-        # For debugging, save the full prompt sent to the API
-        # prompt_debug_path = os.path.join(OUTPUT_FOLDER, f"{student_identifier}_draft_prompt_sent.txt")
-        # with open(prompt_debug_path, "w", encoding="utf-8") as pf:
-        #    pf.write(full_prompt)
-        # logging.info(f"Full draft prompt saved for debugging: {prompt_debug_path}")
-
-        ai_feedback_prose = call_gemini_api(prompt_messages, api_key)
-
-        if not ai_feedback_prose:
-            logging.warning(f"Skipping {filename} due to Gemini API call failure or empty response.")
-            continue
-
-        output_filename_base = student_identifier
-        if doc_author:
-            output_filename_base += f"_{sanitize_for_filename(doc_author)}"
-        output_docx_path = os.path.join(OUTPUT_FOLDER, f"{output_filename_base}_draft_feedback.docx")
-
-        save_draft_feedback_to_docx(ai_feedback_prose, output_docx_path, student_identifier)
-
-        review_text = review_feedback(extracted_text, ai_feedback_prose, api_key, review_prompt_template)
-        if review_text:
-            review_path = os.path.join(OUTPUT_FOLDER, f"{output_filename_base}_feedback_review.txt")
-            try:
-                with open(review_path, "w", encoding="utf-8") as rf:
-                    rf.write(review_text)
-                logging.info(f"Feedback review saved to: {review_path}")
-            except Exception as e:
-                logging.error(f"Failed to save feedback review for {student_identifier}: {e}")
-        successful_feedback_generations +=1
-        logging.info(f"Successfully generated draft feedback for: {filename}")
-
-        # Add delay if processing multiple files to respect API rate limits
-        if USE_API_DELAY and i < len(assessment_files) - 1 : # Don't sleep after the last file
-            logging.info(f"Waiting for {API_DELAY_SECONDS} seconds before processing next file...")
-            time.sleep(API_DELAY_SECONDS)
+            # For debugging, save the full prompt sent to the API
+            # prompt_debug_path = os.path.join(OUTPUT_FOLDER, f"{student_identifier}_draft_prompt_sent.txt")
+            # with open(prompt_debug_path, "w", encoding="utf-8") as pf:
+            #    pf.write(full_prompt)
+            # logging.info(f"Full draft prompt saved for debugging: {prompt_debug_path}")
+
+            with metrics.labels(stage="draft", submission=student_identifier), model_router.track_models() as served:
+                ai_feedback_prose = call_gemini_api(prompt_messages, api_key)
 
+            if not ai_feedback_prose:
+                logging.warning(f"Skipping {filename} due to Gemini API call failure or empty response.")
+                continue
+
+            output_filename_base = student_identifier
+            if doc_author:
+                output_filename_base += f"_{sanitize_for_filename(doc_author)}"
+            output_docx_path = os.path.join(OUTPUT_FOLDER, f"{output_filename_base}_draft_feedback.docx")
+
+            save_draft_feedback_to_docx(
+                ai_feedback_prose, output_docx_path, student_identifier, render_pool=render_pool
+            )
+            logging.info(f"Draft feedback for {filename} produced by {served.get('draft', GEMINI_MODEL)}.")
+
+            with metrics.labels(stage="draft_review", submission=student_identifier):
+                review_text = review_feedback(
+                    extracted_text, ai_feedback_prose, api_key, review_prompt_template
+                )
+            if review_text:
+                review_path = os.path.join(OUTPUT_FOLDER, f"{output_filename_base}_feedback_review.txt")
+                try:
+                    with open(review_path, "w", encoding="utf-8") as rf:
+                        rf.write(review_text)
+                    logging.info(f"Feedback review saved to: {review_path}")
+                except Exception as e:
+                    logging.error(f"Failed to save feedback review for {student_identifier}: {e}")
+            successful_feedback_generations +=1
+            logging.info(f"Successfully generated draft feedback for: {filename}")
 
     logging.info("--- Draft Feedback Generation Complete ---")
     logging.info(f"Total files found in input folder: {len(assessment_files)}")
     logging.info(f"Files attempted for processing: {processed_files}")
+    successful_feedback_generations -= render_pool.failures
     logging.info(f"Successfully generated draft feedback for: {successful_feedback_generations} files")
+    if render_pool.failures:
+        logging.error(f"Report rendering failed for {render_pool.failures} file(s).")
     logging.info(f"Draft feedback reports saved in: {OUTPUT_FOLDER}")
     logging.info(f"Log file saved at: {LOG_FILE}")
+    logging.info(get_response_cache().stats_summary())
+    logging.info(metrics.get_metrics().summary())
+    metrics.get_metrics().export(OUTPUT_FOLDER)
+    get_prefix_cache().release_all()
 
 if __name__ == "__main__":
     # Ensure PyPDF2 is available if PDF processing is expected.
@@ -0,0 +1,296 @@
+"""Long-lived Gemini clients shared by the grading scripts.
+
+``genai.configure`` is called once per API key and ``GenerativeModel``
+instances are cached by model name and generation settings, so the grade,
+review and draft calls for every student reuse the same transport instead of
+rebuilding it per request. The registry is guarded by a lock and the cached
+models are safe to share between worker threads.
+"""
+
+import json
+import logging
+import threading
+import time
+
+import google.generativeai as genai
+
+from metrics import get_metrics
+from prompt_cache import get_prefix_cache
+from rate_limiter import (
+    FAILOVER_MAX_RETRIES,
+    MAX_RETRIES,
+    error_status,
+    estimate_tokens,
+    get_rate_limiter,
+    is_failover_error,
+)
+import response_cache
+from response_cache import get_response_cache, make_cache_key
+from stream_parser import StreamAborted
+
+# Safety settings can be adjusted if needed
+SAFETY_SETTINGS = (
+    {"category": "HARM_CATEGORY_HARASSMENT", "threshold": "BLOCK_NONE"},
+    {"category": "HARM_CATEGORY_HATE_SPEECH", "threshold": "BLOCK_NONE"},
+    {"category": "HARM_CATEGORY_SEXUALLY_EXPLICIT", "threshold": "BLOCK_NONE"},
+    {"category": "HARM_CATEGORY_DANGEROUS_CONTENT", "threshold": "BLOCK_NONE"},
+)
+
+_registry_lock = threading.Lock()
+_configured_api_key = None
+_models = {}
+
+
+class ModelUnavailable(RuntimeError):
+    """A model is throttled, timing out or failing (5xx); try another one."""
+
+    def __init__(self, model_name, reason):
+        super().__init__(f"{model_name} unavailable: {reason}")
+        self.model_name = model_name
+        self.reason = reason
+
+
+def _settings_key(generation_config):
+    """Return a hashable, order-independent key for ``generation_config``."""
+    if not generation_config:
+        return ""
+    return json.dumps(generation_config, sort_keys=True, default=str)
+
+
+def configure_client(api_key):
+    """Configure the SDK for ``api_key`` unless it is already configured."""
+    global _configured_api_key
+    with _registry_lock:
+        if api_key != _configured_api_key:
+            genai.configure(api_key=api_key)
+            _configured_api_key = api_key
+            # Models hold a reference to the previous client; rebuild them lazily.
+            _models.clear()
+
+
+def get_model(model_name, api_key, generation_config=None):
+    """Return a cached ``GenerativeModel`` for ``model_name`` and its settings."""
+    configure_client(api_key)
+    key = (model_name, _settings_key(generation_config))
+    with _registry_lock:
+        model = _models.get(key)
+        if model is None:
+            model = genai.GenerativeModel(
+                model_name,
+                safety_settings=[dict(s) for s in SAFETY_SETTINGS],
+                generation_config=generation_config,
+            )
+            _models[key] = model
+        return model
+
+
+def clear_models():
+    """Drop all cached models (e.g. after rotating the API key)."""
+    global _configured_api_key
+    with _registry_lock:
+        _models.clear()
+        _configured_api_key = None
+
+
+def generate_text(
+    prompt,
+    api_key,
+    model_name,
+    generation_config=None,
+    cache_context=None,
+    on_chunk=None,
+    failover=False,
+    validate=None,
+):
+    """Send ``prompt`` to ``model_name`` and return the response text.
+
+    ``prompt`` may be a single string or a list of prompt parts. Returns
+    ``None`` if the request fails, is blocked, or comes back empty.
+    Successful responses are stored in the response cache keyed by the model,
+    generation config, prompt and ``cache_context`` (e.g. a rubric hash), so
+    an identical request is answered from disk. With ``validate`` only replies
+    for which ``validate(text)`` is true are stored or served from the cache,
+    so a reply the caller cannot use is asked for again on the next run.
+
+    With ``on_chunk`` the response is streamed and each text chunk is passed
+    to ``on_chunk`` as it arrives (a cached response arrives as one chunk).
+    ``on_chunk`` may raise :class:`stream_parser.StreamAborted` to stop the
+    stream; that exception propagates to the caller.
+
+    With ``failover`` a throttled request is retried only once, and a 429,
+    5xx or timeout raises :class:`ModelUnavailable` instead of returning
+    ``None`` so that ``model_router`` can try the next model.
+    """
+    cache_key = None
+    if response_cache.RESPONSE_CACHE_ENABLED:
+        cache_key = make_cache_key(model_name, prompt, generation_config, cache_context)
+        cached_text = get_response_cache().get(cache_key)
+        if cached_text is not None and (validate is None or validate(cached_text)):
+            logging.info(f"Using cached Gemini response ({model_name}).")
+            get_metrics().record_cache_hit(model_name)
+            if on_chunk is not None:
+                on_chunk(cached_text)
+            return cached_text
+
+    ai_response_text = _request_text(
+        prompt, api_key, model_name, generation_config, on_chunk, failover=failover
+    )
+    if ai_response_text and cache_key and (validate is None or validate(ai_response_text)):
+        get_response_cache().put(cache_key, ai_response_text, model=model_name)
+    return ai_response_text
+
+
+class _StreamInterrupted(RuntimeError):
+    """A stream failed after some chunks were already handed to the caller."""
+
+
+def _chunk_text(chunk):
+    """Return the text of one streamed chunk ("" for chunks without parts)."""
+    try:
+        return chunk.text
+    except ValueError:
+        return ""
+
+
+def _cancel_stream(response):
+    """Cancel the underlying gRPC stream of a partially consumed response."""
+    # The SDK does not expose cancellation; the wrapped iterator is a gRPC call.
+    cancel = getattr(getattr(response, "_iterator", None), "cancel", None)
+    if callable(cancel):
+        try:
+            cancel()
+        except Exception as e:
+            logging.debug(f"Could not cancel Gemini stream: {e}")
+
+
+def _consume_stream(model, contents, on_chunk):
+    """Stream ``contents`` through ``model``, passing each text chunk to ``on_chunk``."""
+    response = model.generate_content(contents, stream=True)
+    received = False
+    try:
+        for chunk in response:
+            text = _chunk_text(chunk)
+            if text:
+                received = True
+                on_chunk(text)
+    except StreamAborted:
+        _cancel_stream(response)
+        raise
+    except Exception as e:
+        _cancel_stream(response)
+        if received:
+            # Retrying or resending would replay chunks the caller already consumed.
+            raise _StreamInterrupted(f"Gemini stream interrupted after partial output: {e}") from e
+        raise
+    return response
+
+
+def _request_outcome(exc):
+    """Return the metrics outcome label for a failed request attempt."""
+    if isinstance(exc, StreamAborted):
+        return "aborted"
+    return {429: "throttled", 503: "unavailable"}.get(error_status(exc), "error")
+
+
+def _timed(model_name, request):
+    """Wrap ``request`` so each attempt is recorded in the run metrics."""
+
+    def attempt():
+        started = time.perf_counter()
+        try:
+            response = request()
+        except Exception as e:
+            get_metrics().record_request(
+                model_name, time.perf_counter() - started, outcome=_request_outcome(e)
+            )
+            raise
+        get_metrics().record_request(model_name, time.perf_counter() - started, response)
+        return response
+
+    return attempt
+
+
+def _send(model, model_name, contents, on_chunk=None, max_retries=MAX_RETRIES):
+    """Send ``contents`` through the shared rate limiter."""
+    # The shared limiter enforces the model's RPM/TPM quota and retries
+    # throttled (429/503) requests with jittered exponential backoff.
+    if on_chunk is None:
+        request = lambda: model.generate_content(contents)
+    else:
+        request = lambda: _consume_stream(model, contents, on_chunk)
+    return get_rate_limiter().call(
+        model_name,
+        _timed(model_name, request),
+        estimated_tokens=estimate_tokens(contents),
+        max_retries=max_retries,
+    )
+
+
+def _split_prefix(prompt):
+    """Return ``(static_prefix, remaining_parts)`` for a multi-part prompt.
+
+    Returns ``(None, None)`` when there is no prefix to cache.
+    """
+    if isinstance(prompt, (list, tuple)) and len(prompt) > 1:
+        return prompt[0], list(prompt[1:])
+    return None, None
+
+
+def _request_text(prompt, api_key, model_name, generation_config, on_chunk=None, failover=False):
+    """Perform the rate-limited API request behind :func:`generate_text`.
+
+    For multi-part prompts the first part is the static template prefix; it is
+    served from the prompt-prefix cache when possible so only the remaining
+    parts are sent.
+    """
+    max_retries = FAILOVER_MAX_RETRIES if failover else MAX_RETRIES
+    model = get_model(model_name, api_key, generation_config)
+    prefix_model = None
+    prefix_text, remaining = _split_prefix(prompt)
+    if prefix_text is not None:
+        prefix_model = get_prefix_cache().model_for(
+            model_name,
+            prefix_text,
+            [dict(s) for s in SAFETY_SETTINGS],
+            generation_config,
+            settings_key=_settings_key(generation_config),
+        )
+    try:
+        logging.info(f"Sending request to Gemini API ({model_name})...")
+        if prefix_model is not None:
+            try:
+                response = _send(prefix_model, model_name, remaining, on_chunk, max_retries)
+            except (StreamAborted, _StreamInterrupted):
+                raise
+            except Exception as e:
+                if failover and is_failover_error(e):
+                    raise
+                logging.warning(f"Cached prompt prefix request failed ({e}); resending full prompt.")
+                get_prefix_cache().invalidate(model_name, prefix_text)
+                response = _send(model, model_name, prompt, on_chunk, max_retries)
+        else:
+            response = _send(model, model_name, prompt, on_chunk, max_retries)
+        # Check for empty or blocked responses
+        if not response.parts:
+            if response.prompt_feedback and response.prompt_feedback.block_reason:
+                logging.error(
+                    f"Gemini API request blocked. Reason: {response.prompt_feedback.block_reason_message}"
+                )
+            else:
+                logging.error("Gemini API returned an empty response with no parts.")
+            return None
+
+        ai_response_text = response.text
+        logging.info("Received response from Gemini API.")
+        return ai_response_text
+    except StreamAborted:
+        raise
+    except Exception as e:
+        # A partially streamed reply cannot be replayed on another model.
+        if failover and is_failover_error(e) and not isinstance(e, _StreamInterrupted):
+            raise ModelUnavailable(model_name, e) from e
+        logging.error(f"Gemini API call failed: {e}")
+        # Log more details if it's a specific Google API error
+        if hasattr(e, "message"):
+            logging.error(f"Google API Error Message: {e.message}")
+        return None
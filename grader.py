@@ -1,13 +1,43 @@
 import os
 from pathlib import Path
 import re
+import copy
 import logging
+import argparse
+from concurrent.futures import ThreadPoolExecutor
 from dotenv import load_dotenv
-import google.generativeai as genai
-from docx import Document as DocxDocument  # To avoid clash with local 'Document'
-import PyPDF2
 import yaml  # PyYAML
 
+from build_manifest import (
+    MANIFEST_FILE,
+    BuildManifest,
+    assign_student_identifiers,
+    scan_submission_files,
+    shared_input_fingerprints,
+)
+import metrics
+import model_router
+from model_router import ModelRouter
+import tracing
+from text_extraction import ExtractionPool, extract_text_from_file
+from prompt_cache import get_prefix_cache
+from report_renderer import RenderPool, render_feedback_report
+from response_cache import file_fingerprint, get_response_cache
+from response_repair import build_fix_prompt, repair_grading_response
+from result_store import iter_results, load_result, result_path, save_result, update_final_grade
+from review_policy import review_triggers
+from rubric_engine import compile_rubric
+import structured_output
+from stream_parser import IncrementalGradeParser, StreamAborted
+from structured_output import (
+    grading_response_schema,
+    json_generation_config,
+    load_yaml,
+    parse_grading_json,
+    parse_review_json,
+    review_response_schema,
+)
+
 # --- Configuration ---
 INPUT_FOLDER = Path("input_assessments")
 OUTPUT_FOLDER = Path("output_feedback")
@@ -16,6 +46,20 @@ LOG_FILE = "grading_process.log"
 SUMMARY_FILE = "grading_summary.csv"
 GRADE_REVIEW_PROMPT_FILE = Path("grade_review_prompt.txt")
 RUBRIC_FILE = Path("rubric.yml")
+GEMINI_MODEL = "gemini-1.5-flash-latest"  # Or your preferred model
+# Models tried in order per stage; a throttled or failing model falls through to the next
+MODEL_ROUTES = {
+    "grade": [GEMINI_MODEL, "gemini-1.5-pro-latest"],
+    "review": [GEMINI_MODEL, "gemini-1.5-pro-latest"],
+    "repair": [GEMINI_MODEL, "gemini-1.5-pro-latest"],
+}
+MODEL_ROUTER = ModelRouter(MODEL_ROUTES)
+# Stages whose replies are only cached once they parse (see grading_reply_usable).
+CACHE_VALIDATED_STAGES = ("grade", "repair")
+# Number of submissions graded concurrently by ``run_grading_process``
+MAX_CONCURRENT_SUBMISSIONS = 4
+# Stream grading replies so entries are parsed (and checked) as they arrive
+STREAMING_ENABLED = True
 
 # Setup basic logging
 logging.basicConfig(
@@ -56,67 +100,6 @@ def get_student_name_from_filename(filename):
     return None
 
 
-def extract_text_from_docx(doc):
-    """Extract text from paragraphs and tables in a DOCX Document."""
-    text_parts = []
-    for para in doc.paragraphs:
-        if para.text:
-            text_parts.append(para.text)
-    for table in doc.tables:
-        for row in table.rows:
-            for cell in row.cells:
-                for para in cell.paragraphs:
-                    if para.text:
-                        text_parts.append(para.text)
-    return "\n".join(text_parts)
-
-
-def extract_text_from_file(filepath):
-    """Extracts text and author metadata from supported files."""
-    filepath = Path(filepath)
-    extension = filepath.suffix
-    text = ""
-    doc_author = None
-    try:
-        if extension.lower() == ".docx":
-            doc = DocxDocument(filepath)
-            doc_author = doc.core_properties.author or None
-            text = extract_text_from_docx(doc)
-        elif extension.lower() == ".pdf":
-            with open(filepath, "rb") as f:
-                reader = PyPDF2.PdfReader(f)
-                if reader.is_encrypted:
-                    logging.warning(
-                        f"PDF '{filepath}' is encrypted. Attempting to read anyway if default password allows."
-                    )
-                    # You might need to handle decryption if password is known: reader.decrypt('')
-                for page_num in range(len(reader.pages)):
-                    page = reader.pages[page_num]
-                    text += page.extract_text() + "\n"
-        else:  # Attempt plain text for other files
-            logging.info(f"Attempting to read '{filepath}' as plain text.")
-            with open(filepath, "r", encoding="utf-8", errors="ignore") as f:
-                text = f.read()
-
-        text = re.sub(r"\s{3,}", "\n\n", text).strip()
-        if not text.strip():
-            logging.warning(f"No text extracted or file is empty: {filepath}")
-            return None, None
-        return text, doc_author
-
-    except FileNotFoundError:
-        logging.error(f"File not found: {filepath}")
-        return None, None
-    except PyPDF2.errors.PdfReadError:
-        logging.error(
-            f"Could not read PDF (possibly corrupted or password protected): {filepath}"
-        )
-        return None, None
-    except Exception as e:
-        logging.error(f"Error extracting text from {filepath}: {e}")
-        return None, None
-
-
 def load_master_prompt():
     """Loads the master prompt template from file."""
     try:
@@ -144,10 +127,16 @@ def load_grade_review_prompt_template():
 
 
 def load_rubric_config():
-    """Load grading rubric from YAML configuration."""
+    """Load grading rubric from YAML configuration.
+
+    The rules are compiled and validated here, so a malformed rule raises
+    ``RubricError`` before any submission is graded.
+    """
     try:
         with open(RUBRIC_FILE, "r", encoding="utf-8") as f:
-            return yaml.safe_load(f)
+            rubric_config = yaml.safe_load(f)
+        compile_rubric(rubric_config)
+        return rubric_config
     except FileNotFoundError:
         logging.error(f"Rubric file '{RUBRIC_FILE}' not found.")
         raise
@@ -198,16 +187,25 @@ def construct_full_prompt(
     return master_prompt_template.replace(placeholder, student_text)
 
 
-def construct_prompt_messages(student_text, master_prompt_template):
-    """Return a list of prompt messages for multi-part API calls."""
+def construct_prompt_messages(student_text, master_prompt_template, structured=False):
+    """Return a list of prompt messages for multi-part API calls.
+
+    With ``structured`` the closing instruction asks for the JSON response
+    schema instead of the YAML block described in the template.
+    """
 
     placeholder = "{{STUDENT_SUBMISSION_TEXT_HERE}}"
     if placeholder in master_prompt_template:
         pre_prompt = master_prompt_template.split(placeholder)[0].rstrip()
+        output_format = (
+            "return a JSON object matching the response schema, with the same fields as the YAML example"
+            if structured
+            else "return the YAML as specified"
+        )
         return [
             pre_prompt,
             student_text,
-            "Please grade the submission above according to the rubric and return the YAML as specified.",
+            f"Please grade the submission above according to the rubric and {output_format}.",
         ]
 
     logging.warning(
@@ -216,50 +214,47 @@ def construct_prompt_messages(student_text, master_prompt_template):
     return [master_prompt_template + "\n\n" + student_text]
 
 
-def call_gemini_api(prompt, api_key):
+def call_gemini_api(prompt, api_key, generation_config=None, on_chunk=None, stage="grade"):
     """Calls the Gemini API and returns the response text.
 
     ``prompt`` may be a single string or a list of prompt parts to be sent as a
     multi-turn request. Splitting large prompts can help the model process long
-    student submissions more reliably.
+    student submissions more reliably. ``on_chunk`` streams the reply (see
+    ``gemini_client.generate_text``). The request goes to the models routed
+    for ``stage`` (see ``MODEL_ROUTES``), failing over when one is unavailable.
     """
-    genai.configure(api_key=api_key)
-    model = genai.GenerativeModel("gemini-1.5-flash-latest")  # Or your preferred model
-    # Safety settings can be adjusted if needed
-    safety_settings = [
-        {"category": "HARM_CATEGORY_HARASSMENT", "threshold": "BLOCK_NONE"},
-        {"category": "HARM_CATEGORY_HATE_SPEECH", "threshold": "BLOCK_NONE"},
-        {"category": "HARM_CATEGORY_SEXUALLY_EXPLICIT", "threshold": "BLOCK_NONE"},
-        {"category": "HARM_CATEGORY_DANGEROUS_CONTENT", "threshold": "BLOCK_NONE"},
-    ]
-    try:
-        logging.info("Sending request to Gemini API...")
-        # ``prompt`` can be a string or list of strings for multi-part input
-        response = model.generate_content(prompt, safety_settings=safety_settings)
-        # Check for empty or blocked responses
-        if not response.parts:
-            if response.prompt_feedback and response.prompt_feedback.block_reason:
-                logging.error(
-                    f"Gemini API request blocked. Reason: {response.prompt_feedback.block_reason_message}"
-                )
-                return None
-            else:
-                logging.error("Gemini API returned an empty response with no parts.")
-                return None
-
-        # Assuming the response is text. If it could be multi-modal, access response.text
-        ai_response_text = response.text
-        logging.info("Received response from Gemini API.")
-        return ai_response_text
-    except Exception as e:
-        logging.error(f"Gemini API call failed: {e}")
-        return None
+    # The rubric is part of the cache key so editing it never reuses old grades,
+    # and grading replies are only cached once they are known to be usable.
+    return MODEL_ROUTER.generate(
+        stage,
+        prompt,
+        api_key,
+        generation_config=generation_config,
+        cache_context={"rubric": file_fingerprint(RUBRIC_FILE)},
+        on_chunk=on_chunk,
+        validate=grading_reply_usable if stage in CACHE_VALIDATED_STAGES else None,
+    )
+
+
+def grading_reply_usable(response_text):
+    """Return ``True`` if a grading reply parses, possibly after local repairs."""
+    if parse_gemini_yaml_response(response_text):
+        return True
+    parsed_data, _ = repair_grading_response(response_text, compile_rubric(load_rubric_config()))
+    return bool(parsed_data)
 
 
 def parse_gemini_yaml_response(response_text):
-    """Parses the YAML response from Gemini."""
+    """Parses the grading response from Gemini.
+
+    Schema-constrained JSON replies are parsed on a fast path; anything else is
+    treated as (possibly fenced) YAML.
+    """
     if not response_text:
         return None
+    parsed_data = parse_grading_json(response_text)
+    if parsed_data is not None:
+        return parsed_data
     try:
         # LLMs can sometimes add markdown backticks around YAML
         cleaned_response = response_text.strip()
@@ -291,10 +286,12 @@ def parse_gemini_yaml_response(response_text):
                 logging.info("Sanitized unescaped quotes in Gemini YAML response.")
             return "\n".join(sanitized_lines)
 
-        cleaned_response = _sanitize_unescaped_quotes(cleaned_response)
-
-        parsed_data = yaml.safe_load(cleaned_response)
-        if "assistant_reasons" in parsed_data:
+        try:
+            parsed_data = load_yaml(cleaned_response)
+        except yaml.YAMLError:
+            # Only pay for the line-by-line sanitizer when the raw text fails.
+            parsed_data = load_yaml(_sanitize_unescaped_quotes(cleaned_response))
+        if isinstance(parsed_data, dict) and "assistant_reasons" in parsed_data:
             return parsed_data
         logging.error(
             f"Parsed YAML does not have expected structure. Parsed: {parsed_data}"
@@ -312,6 +309,38 @@ def parse_gemini_yaml_response(response_text):
         return None
 
 
+def parse_or_repair_response(api_response, api_key, rubric_config, generation_config=None):
+    """Parse a grading reply, repairing it before giving up.
+
+    Local repairs from ``response_repair`` are tried first; only if they all
+    fail is the broken reply (without the student's text) sent back with a
+    short "fix this output" request. Returns ``(parsed_data, repair_strategy)``
+    where the strategy is ``None`` for a reply that parsed as-is.
+    """
+    parsed_data = parse_gemini_yaml_response(api_response)
+    if parsed_data:
+        return parsed_data, None
+
+    rubric = compile_rubric(rubric_config)
+    parsed_data, strategy = repair_grading_response(api_response, rubric)
+    if parsed_data:
+        logging.info(f"Repaired grading response locally ({strategy}).")
+        return parsed_data, strategy
+
+    logging.info("Local repair failed; requesting a syntax fix of the response.")
+    with metrics.labels(stage="repair"):
+        fixed_response = call_gemini_api(
+            build_fix_prompt(api_response),
+            api_key,
+            generation_config=generation_config,
+            stage="repair",
+        )
+    parsed_data = parse_gemini_yaml_response(fixed_response) if fixed_response else None
+    if not parsed_data and fixed_response:
+        parsed_data, _ = repair_grading_response(fixed_response, rubric)
+    return (parsed_data, "fix_request") if parsed_data else (None, None)
+
+
 def compute_overall_grade(breakdown, grade_bands, total_possible):
     """Return the total points achieved across all rubric criteria."""
     if not isinstance(breakdown, dict):
@@ -328,66 +357,22 @@ def compute_overall_grade(breakdown, grade_bands, total_possible):
 
 
 def calculate_final_grade(bands_data, word_count, rubric_config):
-    """Apply rubric rules and compute final grade breakdown."""
-    criteria_cfg = rubric_config.get("criteria", {})
-    # grade_bands and total_possible retained for backward compatibility but no
-    # longer used to map to letter grades
-    grade_bands = rubric_config.get("grade_bands", {})
-    total_possible = rubric_config.get("total_points_possible", 0)
-
-    bands = bands_data.copy()
-
-    # Apply rules deterministically
-    for rule in rubric_config.get("rules", []):
-        name = rule.get("name")
-        try:
-            condition = rule.get("condition", "")
-            local_vars = {
-                f"{cid}_band": int(bands.get(cid, 1))
-                for cid in criteria_cfg.keys()
-            }
-            local_vars["word_count"] = word_count
-            if eval(condition, {}, local_vars):
-                if rule.get("action") == "set_band":
-                    target = rule.get("target")
-                    if target:
-                        bands[target] = rule.get("band", bands.get(target))
-                elif rule.get("action") == "cap_points":
-                    target = rule.get("target")
-                    points_cap = rule.get("points")
-                    if target and target in bands:
-                        bands[target] = min(bands[target], points_cap)
-        except Exception:
-            logging.warning(f"Failed to evaluate rule '{name}'.")
-
-    def _norm(key):
-        """Normalize keys for robust matching."""
-        return re.sub(r"\s+", "", str(key)).lower()
+    """Apply rubric rules and compute final grade breakdown.
 
-    normalized_bands = {_norm(k): v for k, v in bands.items()}
+    The rubric is compiled once (see ``rubric_engine``); later calls with the
+    same config only evaluate the precompiled rules.
+    """
+    return compile_rubric(rubric_config).score(bands_data, word_count)
 
-    breakdown = {}
-    total_points = 0
-    for cid, cfg in criteria_cfg.items():
-        lookup_keys = [_norm(cid), _norm(cfg.get("name", ""))]
-        band = 1
-        for lk in lookup_keys:
-            if lk in normalized_bands:
-                band = int(normalized_bands[lk])
-                break
-        max_points = int(cfg.get("max_points", band))
-        points = min(band, max_points)
-        breakdown[cid] = {"band": band, "points": points}
-        total_points += points
-
-    return {
-        "total_points": total_points,
-        "breakdown": breakdown,
-    }
 
+def review_grade(
+    student_text, grade_yaml_text, api_key, review_prompt_template=None, rubric_config=None
+):
+    """Sends student text and the AI's grade to Gemini for fairness review.
 
-def review_grade(student_text, grade_yaml_text, api_key, review_prompt_template=None):
-    """Sends student text and the AI's grade to Gemini for fairness review."""
+    With ``rubric_config`` (and structured output enabled) the review is
+    requested as JSON with an ``adjustments`` list.
+    """
     if review_prompt_template is None:
         try:
             review_prompt_template = load_grade_review_prompt_template()
@@ -407,7 +392,10 @@ def review_grade(student_text, grade_yaml_text, api_key, review_prompt_template=
         logging.warning("AI grade placeholder missing in grade review prompt template")
         prompt += f"\n\nAI GRADE:\n{grade_yaml_text}"
 
-    return call_gemini_api(prompt, api_key)
+    generation_config = None
+    if rubric_config is not None and structured_output.STRUCTURED_OUTPUT_ENABLED:
+        generation_config = json_generation_config(review_response_schema(rubric_config))
+    return call_gemini_api(prompt, api_key, generation_config=generation_config, stage="review")
 
 
 
@@ -428,10 +416,18 @@ def apply_criteria_adjustments(parsed_data, adjustments, rubric_config):
     grade_section["total_points"] = total_points
 
 def extract_criteria_adjustments(review_text):
-    """Parse review text for suggested band adjustments using regex."""
+    """Return the band adjustments suggested by a review.
+
+    Structured (JSON) reviews carry them in ``adjustments``; free-text reviews
+    are scanned for ``ADJUSTMENT:`` lines.
+    """
     if not review_text:
         return {}
 
+    structured = parse_review_json(review_text)
+    if structured is not None:
+        return structured
+
     pattern = re.compile(r"ADJUSTMENT:\s*(\w+)\s*->\s*([1-5])", re.IGNORECASE)
     adjustments = {}
     for match in pattern.finditer(review_text):
@@ -447,107 +443,347 @@ def format_feedback_as_docx(
     student_identifier,
     rubric_config,
     doc_author=None,
+    render_pool=None,
 ):
-    """Formats the YAML data into a human-readable DOCX report."""
+    """Formats the YAML data into a human-readable DOCX report.
+
+    The report is rendered from the report template by ``report_renderer``;
+    with ``render_pool`` it is queued on that :class:`RenderPool` instead of
+    being rendered inline, and the render's future is returned.
+    """
+    if render_pool is not None:
+        return render_pool.submit(
+            render_feedback_report,
+            yaml_data,
+            output_filepath,
+            student_identifier,
+            rubric_config,
+            doc_author=doc_author,
+        )
     try:
-        doc = DocxDocument()
-        doc.add_heading(f"Feedback Report for: {student_identifier}", level=1)
-        if doc_author:
-            doc.add_paragraph(f"Author (from file metadata): {doc_author}")
-
-        grade_info = yaml_data.get("assistant_grade", {})
-        breakdown = grade_info.get("breakdown", {})
-
-        rubric_criteria_details = {
-            cid: {
-                "name": cfg.get("name", cid),
-                "max_points": cfg.get("max_points", 0),
-            }
-            for cid, cfg in rubric_config.get("criteria", {}).items()
-        }
+        render_feedback_report(
+            yaml_data, output_filepath, student_identifier, rubric_config, doc_author=doc_author
+        )
+        logging.info(f"Feedback report saved to: {output_filepath}")
+    except Exception as e:
+        logging.error(f"Failed to create DOCX report for {student_identifier}: {e}")
 
-        doc.add_heading("Summary of Points", level=2)
-        summary_table = doc.add_table(rows=1, cols=3)
-        header_cells = summary_table.rows[0].cells
-        header_cells[0].text = "Criterion"
-        header_cells[1].text = "Points Achieved"
-        header_cells[2].text = "Max Points"
-        for cid, details in rubric_criteria_details.items():
-            row_cells = summary_table.add_row().cells
-            row_cells[0].text = details["name"]
-            row_cells[1].text = str(breakdown.get(cid, {}).get("points", "N/A"))
-            row_cells[2].text = str(details["max_points"])
-        doc.add_paragraph()
-        try:
-            total_points = sum(int(item.get("points", 0)) for item in breakdown.values())
-        except Exception:
-            total_points = grade_info.get("total_points", "N/A")
-        max_total_points = rubric_config.get("total_points_possible", 0)
-
-        doc.add_heading("Overall Assessment", level=2)
-        doc.add_paragraph(f"Total Points: {total_points} / {max_total_points}")
-        doc.add_paragraph()  # Spacer
-
-        # Criteria Breakdown
-        doc.add_heading("Detailed Breakdown by Criterion", level=2)
-        reasons = yaml_data.get("assistant_reasons", [])
-
-        for idx, reason_item in enumerate(reasons, start=1):
-            criterion_id = reason_item.get("criterion", "Unknown Criterion")
-            band = reason_item.get("band", "N/A")
-            rationale = reason_item.get("rationale", "No rationale provided.")
-            evidence = reason_item.get("evidence", "No evidence quoted.")
-            improvements = reason_item.get("improvements", [])
-
-            criterion_details = rubric_criteria_details.get(
-                criterion_id,
-                {"name": criterion_id.replace("_", " ").title(), "max_points": "N/A"},
-            )
-            criterion_name = criterion_details["name"]
 
-            criterion_grade_info = breakdown.get(criterion_id, {})
-            points_achieved = criterion_grade_info.get("points", "N/A")
-            max_criterion_points = criterion_details["max_points"]
+def get_student_identifier(filepath):
+    """Return the name used for a submission's output files."""
+    student_name_guess = get_student_name_from_filename(Path(filepath).name)
+    return student_name_guess if student_name_guess else Path(filepath).stem
 
-            doc.add_heading(f"{idx}. {criterion_name}", level=3)
 
-            doc.add_paragraph(
-                f"Points: {points_achieved} / {max_criterion_points} (Band Achieved: {band})"
-            )
+def manifest_inputs(submission_files, model=None):
+    """Return ``{path: input fingerprints}`` as recorded in the build manifest.
+
+    ``model`` describes the model(s) used to grade; it defaults to the
+    fingerprint of ``MODEL_ROUTER``.
+    """
+    shared_inputs = shared_input_fingerprints(
+        model or MODEL_ROUTER.fingerprint(),
+        master_prompt=MASTER_PROMPT_FILE,
+        review_prompt=GRADE_REVIEW_PROMPT_FILE,
+        rubric=RUBRIC_FILE,
+    )
+    return {
+        path: dict(shared_inputs, submission=file_fingerprint(path)) for path in submission_files
+    }
+
+
+def apply_rubric_to_response(parsed_data, word_count, rubric_config):
+    """Compute ``assistant_grade`` from the model's criterion bands."""
+    bands = {
+        item.get("criterion"): int(item.get("band", 1))
+        for item in parsed_data.get("assistant_reasons", [])
+        if item.get("criterion")
+    }
+    parsed_data["assistant_grade"] = calculate_final_grade(
+        bands, word_count, rubric_config
+    )
+    return parsed_data
+
+
+def summary_total_points(parsed_data):
+    """Return the total points reported in the summary CSV."""
+    breakdown = parsed_data.get("assistant_grade", {}).get("breakdown", {})
+    try:
+        return sum(int(item.get("points", 0)) for item in breakdown.values())
+    except Exception:
+        return parsed_data.get("assistant_grade", {}).get("total_points", "N/A")
+
+
+def read_summary():
+    """Return the ``(student, total_points, review_status)`` rows of the summary CSV."""
+    summary_path = OUTPUT_FOLDER / SUMMARY_FILE
+    try:
+        with open(summary_path, "r", encoding="utf-8") as sf:
+            lines = sf.read().splitlines()[1:]
+    except FileNotFoundError:
+        return []
+    # Review statuses never contain commas (see write_summary); student names might.
+    return [tuple(line.rsplit(",", 2)) for line in lines if line]
 
-            doc.add_heading("AI's Rationale:", level=4)
-            doc.add_paragraph(rationale)
-
-            doc.add_heading("Evidence from Student's Work:", level=4)
-            if "\n" in evidence:
-                for line in evidence.splitlines():
-                    line = line.strip()
-                    if not line:
-                        continue
-                    doc.add_paragraph(line, style="List Bullet")
-            else:
-                doc.add_paragraph(evidence if evidence else "N/A")
-
-            doc.add_heading("Suggested Improvements:", level=4)
-            if isinstance(improvements, list):
-                for imp in improvements:
-                    if not imp:
-                        continue
-                    doc.add_paragraph(imp, style="List Bullet")
-            elif improvements:
-                doc.add_paragraph(str(improvements))
-
-            doc.add_paragraph()  # Spacer
-
-        doc.save(output_filepath)
-        logging.info(f"Feedback report saved to: {output_filepath}")
 
+def write_summary(summary_entries):
+    """Write ``(student, total_points, review_status)`` rows to the summary CSV."""
+    summary_path = OUTPUT_FOLDER / SUMMARY_FILE
+    try:
+        with open(summary_path, "w", encoding="utf-8") as sf:
+            sf.write("student,total_points,review\n")
+            for ident, points, review_status in summary_entries:
+                sf.write(f"{ident},{points},{str(review_status).replace(',', ';')}\n")
+        logging.info(f"Summary saved to: {summary_path}")
     except Exception as e:
-        logging.error(f"Failed to create DOCX report for {student_identifier}: {e}")
+        logging.error(f"Failed to write summary file: {e}")
 
 
 # --- Main Processing Logic ---
-def run_grading_process():
+def grade_submission(
+    filepath,
+    api_key,
+    master_prompt_template,
+    rubric_config,
+    extraction=None,
+    student_identifier=None,
+    on_criterion=None,
+    render_pool=None,
+):
+    """Grade a single submission and write its report and review files.
+
+    ``extraction`` is an optional future from :class:`ExtractionPool` that
+    resolves to ``(text, author)``; without it the file is extracted inline.
+    ``student_identifier`` defaults to the name guessed from the filename.
+    ``on_criterion(student_identifier, item)`` is called for each criterion
+    entry of the model's reply as soon as it has streamed in. With
+    ``render_pool`` the report is rendered in that :class:`RenderPool`.
+    Returns ``(student_identifier, total_points, review_status)`` for the
+    summary CSV when the submission was graded, otherwise ``None``.
+    """
+    filename = filepath.name
+    logging.info(f"--- Processing file: {filename} ---")
+
+    if not student_identifier:
+        student_identifier = get_student_identifier(filepath)
+
+    with tracing.span("extract", pooled=extraction is not None):
+        if extraction is not None:
+            extracted_text, doc_author = extraction.result()
+        else:
+            extracted_text, doc_author = extract_text_from_file(filepath)
+    if not extracted_text:
+        logging.warning(
+            f"Skipping {filename} due to text extraction failure or empty content."
+        )
+        return None
+
+    # Simple word count for info, AI will use its own logic based on rubric
+    word_count = len(extracted_text.split())
+    logging.info(f"Extracted approx. {word_count} words from {filename}.")
+    if word_count < 50:  # Arbitrary threshold for very short/empty files
+        logging.warning(
+            f"Extracted text for {filename} is very short ({word_count} words). May not be suitable for grading."
+        )
+        # return None # Optional: skip very short files
+
+    with tracing.span("build_prompt"):
+        full_prompt = construct_full_prompt(extracted_text, master_prompt_template)
+        structured = structured_output.STRUCTURED_OUTPUT_ENABLED
+        prompt_messages = construct_prompt_messages(
+            extracted_text, master_prompt_template, structured=structured
+        )
+        generation_config = (
+            json_generation_config(grading_response_schema(rubric_config)) if structured else None
+        )
+
+    # For debugging, you might want to save the full prompt
+    # with open(os.path.join(OUTPUT_FOLDER, f"{student_identifier}_prompt.txt"), "w", encoding="utf-8") as pf:
+    #    pf.write(full_prompt)
+
+    parser = None
+    if STREAMING_ENABLED:
+        parser = IncrementalGradeParser(
+            compile_rubric(rubric_config),
+            on_criterion=(lambda item: on_criterion(student_identifier, item)) if on_criterion else None,
+        )
+    try:
+        with tracing.span("grade_call"), metrics.labels(stage="grade"):
+            api_response = call_gemini_api(
+                prompt_messages,
+                api_key,
+                generation_config=generation_config,
+                on_chunk=parser.feed if parser else None,
+            )
+        if api_response and parser:
+            parser.finish(api_response)
+    except StreamAborted as e:
+        logging.warning(f"Skipping {filename}: grading reply aborted early ({e.reason}).")
+        raw_response_path = OUTPUT_FOLDER / f"{student_identifier}_raw_gemini_response.txt"
+        raw_response_path.write_text(e.partial_text, encoding="utf-8")
+        return None
+    if not api_response:
+        logging.warning(f"Skipping {filename} due to Gemini API call failure.")
+        return None
+
+    with tracing.span("parse"):
+        parsed_data, repair_strategy = parse_or_repair_response(
+            api_response, api_key, rubric_config, generation_config=generation_config
+        )
+    if not parsed_data:
+        logging.warning(f"Skipping {filename} due to YAML parsing failure.")
+        # Save raw response for debugging
+        raw_response_path = OUTPUT_FOLDER / f"{student_identifier}_raw_gemini_response.txt"
+        with open(raw_response_path, "w", encoding="utf-8") as f:
+            f.write(api_response if api_response else "No response received.")
+        logging.info(f"Raw Gemini response saved to: {raw_response_path}")
+        return None
+
+    model_output = copy.deepcopy(parsed_data)
+
+    # Calculate grade using rubric
+    with tracing.span("score"):
+        apply_rubric_to_response(parsed_data, word_count, rubric_config)
+
+    output_filename_base = student_identifier
+    output_docx_path = OUTPUT_FOLDER / f"{output_filename_base}_graded.docx"
+
+    # Only pay for the review call when it is likely to change the grade.
+    triggers = review_triggers(model_output, word_count, rubric_config, file_fingerprint(filepath))
+    review_text = None
+    if triggers:
+        review_status = f"reviewed ({'; '.join(triggers)})"
+        logging.info(f"Reviewing grade for {filename}: {', '.join(triggers)}")
+        with tracing.span("review", triggers=triggers), metrics.labels(stage="review"):
+            review_text = review_grade(
+                extracted_text,
+                api_response,
+                api_key,
+                rubric_config=rubric_config,
+            )
+    else:
+        review_status = "skipped"
+        logging.info(f"Skipping grade review for {filename}: no review trigger.")
+    if review_text:
+        review_path = OUTPUT_FOLDER / f"{output_filename_base}_grade_review.txt"
+        try:
+            with open(review_path, "w", encoding="utf-8") as rf:
+                rf.write(review_text)
+            logging.info(f"Grade review saved to: {review_path}")
+            adjustments = extract_criteria_adjustments(review_text)
+            if adjustments:
+                apply_criteria_adjustments(parsed_data, adjustments, rubric_config)
+                logging.info(f"Applied criterion adjustments: {adjustments}")
+        except Exception as e:
+            logging.error(f"Failed to save grade review for {student_identifier}: {e}")
+
+    total_points = summary_total_points(parsed_data)
+    stage_models = model_router.served_models()
+
+    # Keep the parsed output so grades and reports can be rebuilt offline.
+    with tracing.span("save"):
+        save_result(
+            OUTPUT_FOLDER,
+            student_identifier,
+            source_path=filepath,
+            model_response=api_response,
+            parsed_response=model_output,
+            word_count=word_count,
+            doc_author=doc_author,
+            review_text=review_text,
+            final_grade=parsed_data.get("assistant_grade"),
+            repair_strategy=repair_strategy,
+            review_status=review_status,
+            model_name=stage_models.get("grade", MODEL_ROUTER.primary("grade")),
+            stage_models=stage_models,
+        )
+
+    with tracing.span("render", pooled=render_pool is not None):
+        format_feedback_as_docx(
+            parsed_data,
+            output_docx_path,
+            student_identifier,
+            rubric_config,
+            doc_author=doc_author,
+            render_pool=render_pool,
+        )
+    logging.info(f"Successfully processed and graded: {filename}")
+    return student_identifier, total_points, review_status
+
+
+def _grade_submission_isolated(filepath, *args, **kwargs):
+    """Run :func:`grade_submission` so one failing file cannot stop the batch."""
+    student_identifier = kwargs.get("student_identifier") or filepath.stem
+    try:
+        with tracing.span("submission", submission=student_identifier, file=filepath.name):
+            with metrics.labels(submission=student_identifier), model_router.track_models():
+                return grade_submission(filepath, *args, **kwargs)
+    except Exception as e:
+        logging.error(f"Unexpected error while processing {filepath.name}: {e}")
+        return None
+
+
+def regrade_stored_result(record, rubric_config):
+    """Recompute a stored result's grade with the current rubric and review."""
+    parsed_data = copy.deepcopy(record["parsed_response"])
+    apply_rubric_to_response(parsed_data, record.get("word_count") or 0, rubric_config)
+    adjustments = extract_criteria_adjustments(record.get("review_text"))
+    if adjustments:
+        apply_criteria_adjustments(parsed_data, adjustments, rubric_config)
+    return parsed_data
+
+
+def rebuild_report(record, rubric_config, rescore=True, render_pool=None):
+    """Render a stored result's report without API calls.
+
+    With ``rescore`` the grade is recomputed and stored first; otherwise the
+    stored grade is rendered as it is. Returns ``(student_identifier,
+    total_points, review_status)`` for the summary CSV. With ``render_pool``
+    the report is rendered in that :class:`RenderPool`.
+    """
+    student_identifier = record["student_identifier"]
+    if rescore or not record.get("final_grade"):
+        parsed_data = regrade_stored_result(record, rubric_config)
+        update_final_grade(OUTPUT_FOLDER, record, parsed_data["assistant_grade"])
+    else:
+        parsed_data = copy.deepcopy(record["parsed_response"])
+        parsed_data["assistant_grade"] = record["final_grade"]
+    format_feedback_as_docx(
+        parsed_data,
+        OUTPUT_FOLDER / f"{student_identifier}_graded.docx",
+        student_identifier,
+        rubric_config,
+        doc_author=record.get("doc_author"),
+        render_pool=render_pool,
+    )
+    review_status = record.get("review_status") or (
+        "reviewed" if record.get("review_text") else "skipped"
+    )
+    return student_identifier, summary_total_points(parsed_data), review_status
+
+
+def _rebuild_submission_isolated(student_identifier, rubric_config, rescore=True, render_pool=None):
+    """Run :func:`rebuild_report` for one stored result, logging any failure."""
+    record = load_result(result_path(OUTPUT_FOLDER, student_identifier))
+    if record is None:
+        return None
+    try:
+        with tracing.span("rebuild", submission=student_identifier, rescore=rescore):
+            return rebuild_report(record, rubric_config, rescore=rescore, render_pool=render_pool)
+    except Exception as e:
+        logging.error(f"Failed to rebuild report for {student_identifier}: {e}")
+        return None
+
+
+def run_grading_process(max_concurrency=None, on_criterion=None):
+    """Grade every file in ``INPUT_FOLDER``.
+
+    Up to ``max_concurrency`` submissions (default
+    ``MAX_CONCURRENT_SUBMISSIONS``) are in flight at once, so a cohort is
+    bounded by API throughput rather than by the latency of a single request.
+    ``on_criterion`` is passed to :func:`grade_submission`; it is called from
+    worker threads.
+    """
     logging.info("Starting AI Student Assessment Grader...")
     try:
         api_key = load_api_key()
@@ -563,141 +799,171 @@ def run_grading_process():
     if not OUTPUT_FOLDER.exists():
         OUTPUT_FOLDER.mkdir(parents=True)
         logging.info(f"Created output folder: {OUTPUT_FOLDER}")
-
-    processed_files = 0
-    successful_grades = 0
-    summary_entries = []
-
-    for filepath in INPUT_FOLDER.iterdir():
-        if not filepath.is_file():
-            continue
-        filename = filepath.name
-
-        logging.info(f"--- Processing file: {filename} ---")
-        processed_files += 1
-
-        student_name_guess = get_student_name_from_filename(filename)
-        student_identifier = (
-            student_name_guess if student_name_guess else filepath.stem
+    get_response_cache().evict()
+    metrics.get_metrics().reset()
+    tracing.get_tracer().start_run(OUTPUT_FOLDER)
+
+    if max_concurrency is None:
+        max_concurrency = MAX_CONCURRENT_SUBMISSIONS
+    max_concurrency = max(1, int(max_concurrency))
+
+    # One directory scan; the manifest decides what each submission needs.
+    submission_files, total_entries = scan_submission_files(INPUT_FOLDER)
+    identifiers = assign_student_identifiers(submission_files, get_student_identifier)
+    manifest = BuildManifest(OUTPUT_FOLDER / MANIFEST_FILE)
+    inputs = manifest_inputs(submission_files)
+    stages = {
+        path: manifest.stage_for(
+            path.name,
+            identifiers[path],
+            inputs[path],
+            report_exists=(OUTPUT_FOLDER / f"{identifiers[path]}_graded.docx").exists(),
+            result_exists=result_path(OUTPUT_FOLDER, identifiers[path]).exists(),
         )
+        for path in submission_files
+    }
+    stage_counts = {
+        stage: sum(1 for s in stages.values() if s == stage)
+        for stage in ("grade", "rescore", "render", None)
+    }
+    logging.info(
+        f"{len(submission_files)} file(s): {stage_counts['grade']} to grade, "
+        f"{stage_counts['rescore']} to rescore, {stage_counts['render']} to re-render, "
+        f"{stage_counts[None]} up to date. Up to {max_concurrency} in flight."
+    )
 
-        output_docx_path = OUTPUT_FOLDER / f"{student_identifier}_graded.docx"
-        if output_docx_path.exists():
-            try:
-                feedback_mtime = output_docx_path.stat().st_mtime
-                submission_mtime = filepath.stat().st_mtime
-                if feedback_mtime >= submission_mtime:
-                    logging.info(
-                        f"Feedback for {filename} is up to date. Skipping."
-                    )
-                    continue
-            except Exception as e:
-                logging.warning(
-                    f"Could not check modification times for caching: {e}"
-                )
-
-        extracted_text, doc_author = extract_text_from_file(filepath)
-        if not extracted_text:
-            logging.warning(
-                f"Skipping {filename} due to text extraction failure or empty content."
+    def build(path):
+        stage = stages[path]
+        student_identifier = identifiers[path]
+        if stage is None:
+            logging.info(f"Outputs for {path.name} are up to date. Skipping.")
+            return manifest.summary_row(path.name)
+        if stage == "grade":
+            entry = _grade_submission_isolated(
+                path,
+                api_key,
+                master_prompt_template,
+                rubric_config,
+                extraction=extractions.get(path),
+                student_identifier=student_identifier,
+                on_criterion=on_criterion,
+                render_pool=render_pool,
             )
-            continue
-
-        # Simple word count for info, AI will use its own logic based on rubric
-        word_count = len(extracted_text.split())
-        logging.info(f"Extracted approx. {word_count} words from {filename}.")
-        if word_count < 50:  # Arbitrary threshold for very short/empty files
-            logging.warning(
-                f"Extracted text for {filename} is very short ({word_count} words). May not be suitable for grading."
+        else:
+            entry = _rebuild_submission_isolated(
+                student_identifier,
+                rubric_config,
+                rescore=stage == "rescore",
+                render_pool=render_pool,
             )
-            # continue # Optional: skip very short files
-
-        full_prompt = construct_full_prompt(extracted_text, master_prompt_template)
-        prompt_messages = construct_prompt_messages(extracted_text, master_prompt_template)
-
-        # For debugging, you might want to save the full prompt
-        # with open(os.path.join(OUTPUT_FOLDER, f"{student_identifier}_prompt.txt"), "w", encoding="utf-8") as pf:
-        #    pf.write(full_prompt)
-
-        api_response = call_gemini_api(prompt_messages, api_key)
-        if not api_response:
-            logging.warning(f"Skipping {filename} due to Gemini API call failure.")
-            continue
+        return entry
+
+    # CPU-bound extraction runs in worker processes ahead of the API stage,
+    # each with its own timeout and memory ceiling, and reports are rendered
+    # in worker processes behind it; leaving the block waits for both.
+    # ``executor.map`` yields results in input order, so the summary CSV keeps
+    # a stable ordering regardless of which submission finishes first.
+    with RenderPool() as render_pool, ExtractionPool() as extraction_pool, ThreadPoolExecutor(
+        max_workers=max_concurrency
+    ) as executor:
+        extractions = {
+            path: extraction_pool.submit(path)
+            for path in submission_files
+            if stages[path] == "grade"
+        }
+        results = list(executor.map(build, submission_files))
 
-        parsed_data = parse_gemini_yaml_response(api_response)
-        if not parsed_data:
-            logging.warning(f"Skipping {filename} due to YAML parsing failure.")
-            # Save raw response for debugging
-            raw_response_path = OUTPUT_FOLDER / f"{student_identifier}_raw_gemini_response.txt"
-            with open(raw_response_path, "w", encoding="utf-8") as f:
-                f.write(api_response if api_response else "No response received.")
-            logging.info(f"Raw Gemini response saved to: {raw_response_path}")
+    # Every queued report has been rendered by now; a submission only counts
+    # as built (recorded in the manifest and the summary) once its report exists.
+    built = 0
+    summary_entries = []
+    for path, entry in zip(submission_files, results):
+        if not entry:
             continue
+        if stages[path] is not None:
+            if not render_pool.rendered(OUTPUT_FOLDER / f"{identifiers[path]}_graded.docx"):
+                continue
+            manifest.record(path.name, identifiers[path], inputs[path], entry)
+            built += 1
+        summary_entries.append(entry)
+    manifest.save(keep=[path.name for path in submission_files])
 
-        # Calculate grade using rubric
-        bands = {
-            item.get("criterion"): int(item.get("band", 1))
-            for item in parsed_data.get("assistant_reasons", [])
-            if item.get("criterion")
-        }
-        parsed_data["assistant_grade"] = calculate_final_grade(
-            bands, word_count, rubric_config
+    logging.info("--- Processing Complete ---")
+    logging.info(f"Total entries found: {total_entries}")
+    logging.info(f"Files attempted for processing: {len(submission_files) - stage_counts[None]}")
+    logging.info(f"Successfully graded or rebuilt: {built}")
+    if render_pool.failures:
+        logging.error(
+            f"Report rendering failed for {render_pool.failures} submission(s); "
+            "they will be redone on the next run."
         )
+    logging.info(f"Reports saved in: {OUTPUT_FOLDER}")
+    logging.info(f"Log file saved at: {LOG_FILE}")
+    logging.info(get_response_cache().stats_summary())
+    logging.info(metrics.get_metrics().summary())
+    metrics.get_metrics().export(OUTPUT_FOLDER)
+    logging.info(tracing.get_tracer().summary())
+    tracing.get_tracer().close()
+    get_prefix_cache().release_all()
 
-        output_filename_base = student_identifier
-        output_docx_path = OUTPUT_FOLDER / f"{output_filename_base}_graded.docx"
+    if summary_entries:
+        write_summary(summary_entries)
 
-        review_text = review_grade(extracted_text, api_response, api_key)
-        if review_text:
-            review_path = OUTPUT_FOLDER / f"{output_filename_base}_grade_review.txt"
-            try:
-                with open(review_path, "w", encoding="utf-8") as rf:
-                    rf.write(review_text)
-                logging.info(f"Grade review saved to: {review_path}")
-                adjustments = extract_criteria_adjustments(review_text)
-                if adjustments:
-                    apply_criteria_adjustments(parsed_data, adjustments, rubric_config)
-                    logging.info(f"Applied criterion adjustments: {adjustments}")
-            except Exception as e:
-                logging.error(f"Failed to save grade review for {student_identifier}: {e}")
 
-        breakdown = parsed_data.get("assistant_grade", {}).get("breakdown", {})
-        try:
-            total_points = sum(int(item.get("points", 0)) for item in breakdown.values())
-        except Exception:
-            total_points = parsed_data.get("assistant_grade", {}).get("total_points", "N/A")
-        summary_entries.append((student_identifier, total_points))
+def rebuild_from_stored_results(rescore=True):
+    """Rebuild reports and the summary from stored results without API calls.
 
-        format_feedback_as_docx(
-            parsed_data,
-            output_docx_path,
-            student_identifier,
-            rubric_config,
-            doc_author=doc_author,
-        )
-        successful_grades += 1
-        logging.info(f"Successfully processed and graded: {filename}")
+    With ``rescore`` the rubric rules and review adjustments are re-applied
+    (``rescore`` command); otherwise the stored grades are rendered as they are
+    (``rerender`` command).
+    """
+    logging.info(f"Rebuilding reports from stored results ({'rescore' if rescore else 'rerender'})...")
+    try:
+        rubric_config = load_rubric_config()
+    except Exception as e:
+        logging.critical(f"Initialization failed: {e}")
+        return []
 
-    logging.info("--- Processing Complete ---")
-    logging.info(
-        f"Total files found: {len(list(INPUT_FOLDER.iterdir()))}"
-    )  # This will count folders too, refine if needed
-    logging.info(f"Files attempted for processing: {processed_files}")
-    logging.info(f"Successfully graded: {successful_grades}")
-    logging.info(f"Reports saved in: {OUTPUT_FOLDER}")
-    logging.info(f"Log file saved at: {LOG_FILE}")
+    summary_entries = []
+    with RenderPool() as render_pool:
+        for record in iter_results(OUTPUT_FOLDER):
+            try:
+                summary_entries.append(
+                    rebuild_report(record, rubric_config, rescore=rescore, render_pool=render_pool)
+                )
+            except Exception as e:
+                logging.error(f"Failed to rebuild report for {record['student_identifier']}: {e}")
 
+    summary_entries = [
+        entry
+        for entry in summary_entries
+        if render_pool.rendered(OUTPUT_FOLDER / f"{entry[0]}_graded.docx")
+    ]
+    logging.info(f"Rebuilt {len(summary_entries)} report(s) in: {OUTPUT_FOLDER}")
+    if render_pool.failures:
+        logging.error(f"Report rendering failed for {render_pool.failures} stored result(s).")
     if summary_entries:
-        summary_path = OUTPUT_FOLDER / SUMMARY_FILE
-        try:
-            with open(summary_path, "w", encoding="utf-8") as sf:
-                sf.write("student,total_points\n")
-                for ident, points in summary_entries:
-                    sf.write(f"{ident},{points}\n")
-            logging.info(f"Summary saved to: {summary_path}")
-        except Exception as e:
-            logging.error(f"Failed to write summary file: {e}")
+        write_summary(summary_entries)
+    return summary_entries
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="AI Student Assessment Grader")
+    parser.add_argument(
+        "command",
+        nargs="?",
+        default="grade",
+        choices=["grade", "rescore", "rerender"],
+        help="grade submissions (default), or rebuild from stored results",
+    )
+    parser.add_argument("--concurrency", type=int, default=None, help="submissions in flight")
+    args = parser.parse_args(argv)
+
+    if args.command == "grade":
+        run_grading_process(max_concurrency=args.concurrency)
+    else:
+        rebuild_from_stored_results(rescore=args.command == "rescore")
 
 
 if __name__ == "__main__":
-    run_grading_process()
+    main()
@@ -0,0 +1,378 @@
+"""Per-run Gemini API metrics: requests, latency, tokens, retries and cost.
+
+``gemini_client`` and ``rate_limiter`` report every request attempt, retry and
+response-cache hit to the shared :class:`RunMetrics` (``get_metrics()``). Each
+record is labelled with the pipeline stage (``grade``, ``review``, ``repair``,
+``draft``...) and the submission set by :func:`labels` on the calling thread.
+Tokens come from the response ``usage_metadata``; the cost is estimated from
+``MODEL_PRICING``.
+
+At the end of a run the grading scripts log :meth:`RunMetrics.summary` and
+write a JSON run report plus a Prometheus textfile (for node_exporter's
+textfile collector) to the output folder.
+"""
+
+import copy
+import json
+import logging
+import os
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime, timezone
+from pathlib import Path
+
+RUN_REPORT_FILE = "run_metrics.json"
+PROMETHEUS_FILE = "grader_metrics.prom"
+# Upper bounds (seconds) of the request latency histogram buckets.
+LATENCY_BUCKETS = (0.5, 1, 2, 5, 10, 20, 30, 60, 120)
+# USD per million tokens for prompts up to 128k tokens. Unknown models cost 0.
+MODEL_PRICING = {
+    "gemini-1.5-flash-latest": {"input": 0.075, "cached_input": 0.01875, "output": 0.30},
+    "gemini-1.5-pro-latest": {"input": 1.25, "cached_input": 0.3125, "output": 5.00},
+}
+DEFAULT_STAGE = "other"
+_BUCKET_LABELS = [str(bound) for bound in LATENCY_BUCKETS] + ["+Inf"]
+
+_context = threading.local()
+
+
+@contextmanager
+def labels(**values):
+    """Label the API calls made by this thread inside the block.
+
+    Accepts ``stage`` and ``submission``; nested blocks override the outer
+    labels and restore them on exit.
+    """
+    previous = getattr(_context, "labels", {})
+    _context.labels = dict(previous, **values)
+    try:
+        yield
+    finally:
+        _context.labels = previous
+
+
+def current_labels():
+    """Return ``(stage, submission)`` for the calling thread."""
+    values = getattr(_context, "labels", {})
+    return values.get("stage") or DEFAULT_STAGE, values.get("submission")
+
+
+def usage_tokens(response):
+    """Return ``(prompt, output, cached)`` token counts from a response's usage metadata."""
+    usage = getattr(response, "usage_metadata", None)
+
+    def count(name):
+        value = getattr(usage, name, None)
+        return value if isinstance(value, int) and value > 0 else 0
+
+    return (
+        count("prompt_token_count"),
+        count("candidates_token_count"),
+        count("cached_content_token_count"),
+    )
+
+
+def estimate_cost(model_name, prompt_tokens, output_tokens, cached_tokens=0):
+    """Return the estimated USD cost of one request to ``model_name``."""
+    pricing = MODEL_PRICING.get(model_name)
+    if pricing is None:
+        return 0.0
+    uncached = max(0, prompt_tokens - cached_tokens)
+    return (
+        uncached * pricing["input"]
+        + cached_tokens * pricing["cached_input"]
+        + output_tokens * pricing["output"]
+    ) / 1_000_000
+
+
+def _new_stats():
+    return {
+        "requests": 0,
+        "outcomes": {},
+        "retries": 0,
+        "cache_hits": 0,
+        "prompt_tokens": 0,
+        "output_tokens": 0,
+        "cached_tokens": 0,
+        "cost_usd": 0.0,
+        "latency_seconds": 0.0,
+    }
+
+
+def _add_stats(total, stats):
+    for key, value in stats.items():
+        if key == "outcomes":
+            for outcome, n in value.items():
+                total["outcomes"][outcome] = total["outcomes"].get(outcome, 0) + n
+        else:
+            total[key] += value
+    return total
+
+
+def _escape_label(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _prom_labels(**values):
+    if not values:
+        return ""
+    return "{" + ",".join(f'{k}="{_escape_label(v)}"' for k, v in values.items()) + "}"
+
+
+def _write_atomic(path, text):
+    path = Path(path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp_path = path.with_suffix(path.suffix + ".tmp")
+    tmp_path.write_text(text, encoding="utf-8")
+    os.replace(tmp_path, path)
+
+
+class RunMetrics:
+    """Thread-safe API metrics for one grading run."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        """Start a new run, discarding everything recorded so far."""
+        with self._lock:
+            self.started_at = time.time()
+            self._stats = {}  # (stage, model) -> stats
+            self._histograms = {}  # (stage, model) -> per-bucket counts, last is +Inf
+            self._submissions = {}  # submission -> stats
+            self._cascade = {"graded": 0, "escalated": 0, "reasons": {}}
+
+    def _targets(self, model_name):
+        stage, submission = current_labels()
+        key = (stage, model_name)
+        targets = [self._stats.setdefault(key, _new_stats())]
+        if submission is not None:
+            targets.append(self._submissions.setdefault(submission, _new_stats()))
+        return key, targets
+
+    def record_request(self, model_name, latency, response=None, outcome="ok"):
+        """Record one API request attempt and its token usage."""
+        prompt_tokens, output_tokens, cached_tokens = usage_tokens(response)
+        cost = estimate_cost(model_name, prompt_tokens, output_tokens, cached_tokens)
+        with self._lock:
+            key, targets = self._targets(model_name)
+            for stats in targets:
+                stats["requests"] += 1
+                stats["outcomes"][outcome] = stats["outcomes"].get(outcome, 0) + 1
+                stats["prompt_tokens"] += prompt_tokens
+                stats["output_tokens"] += output_tokens
+                stats["cached_tokens"] += cached_tokens
+                stats["cost_usd"] += cost
+                stats["latency_seconds"] += latency
+            buckets = self._histograms.setdefault(key, [0] * (len(LATENCY_BUCKETS) + 1))
+            index = next(
+                (i for i, bound in enumerate(LATENCY_BUCKETS) if latency <= bound),
+                len(LATENCY_BUCKETS),
+            )
+            buckets[index] += 1
+
+    def record_retry(self, model_name):
+        """Record a request that is being retried after a 429/503."""
+        with self._lock:
+            for stats in self._targets(model_name)[1]:
+                stats["retries"] += 1
+
+    def record_cache_hit(self, model_name):
+        """Record a request answered from the response cache."""
+        with self._lock:
+            for stats in self._targets(model_name)[1]:
+                stats["cache_hits"] += 1
+
+    def record_escalation(self, reasons):
+        """Record one cascade decision; an empty ``reasons`` kept the first-tier grade."""
+        kinds = {reason.split(":", 1)[0] for reason in reasons}
+        with self._lock:
+            self._cascade["graded"] += 1
+            if kinds:
+                self._cascade["escalated"] += 1
+            for kind in kinds:
+                self._cascade["reasons"][kind] = self._cascade["reasons"].get(kind, 0) + 1
+
+    def snapshot(self):
+        """Return the run report as a JSON-serialisable dict."""
+        with self._lock:
+            stats = copy.deepcopy(self._stats)
+            histograms = copy.deepcopy(self._histograms)
+            submissions = copy.deepcopy(self._submissions)
+            cascade = copy.deepcopy(self._cascade)
+            started_at = self.started_at
+        totals, by_stage, by_model = _new_stats(), {}, {}
+        for (stage, model_name), value in stats.items():
+            _add_stats(totals, value)
+            _add_stats(by_stage.setdefault(stage, _new_stats()), value)
+            _add_stats(by_model.setdefault(model_name, _new_stats()), value)
+        finished_at = time.time()
+        return {
+            "started_at": datetime.fromtimestamp(started_at, timezone.utc).isoformat(),
+            "finished_at": datetime.fromtimestamp(finished_at, timezone.utc).isoformat(),
+            "duration_seconds": round(finished_at - started_at, 3),
+            "totals": totals,
+            "by_stage": by_stage,
+            "by_model": by_model,
+            "by_stage_and_model": [
+                dict(
+                    value,
+                    stage=stage,
+                    model=model_name,
+                    latency_buckets=dict(
+                        zip(_BUCKET_LABELS, histograms.get((stage, model_name), []))
+                    ),
+                )
+                for (stage, model_name), value in sorted(stats.items())
+            ],
+            "submissions": submissions,
+            "cascade": dict(
+                cascade,
+                escalation_rate=round(cascade["escalated"] / cascade["graded"], 4)
+                if cascade["graded"]
+                else 0.0,
+            ),
+        }
+
+    def summary(self):
+        """Return a short human-readable summary of the run."""
+        report = self.snapshot()
+        totals = report["totals"]
+        throttled = totals["outcomes"].get("throttled", 0)
+        mean_latency = totals["latency_seconds"] / totals["requests"] if totals["requests"] else 0.0
+        lines = [
+            f"API metrics: {totals['requests']} request(s), {totals['retries']} retr(ies), "
+            f"{throttled} throttled (429), {totals['cache_hits']} response cache hit(s); "
+            f"{totals['prompt_tokens']} prompt / {totals['output_tokens']} output tokens "
+            f"({totals['cached_tokens']} cached); est. cost ${totals['cost_usd']:.4f}; "
+            f"mean latency {mean_latency:.2f}s."
+        ]
+        for stage, stats in sorted(report["by_stage"].items()):
+            lines.append(
+                f"  {stage}: {stats['requests']} request(s), {stats['cache_hits']} cache hit(s), "
+                f"{stats['prompt_tokens'] + stats['output_tokens']} tokens, ${stats['cost_usd']:.4f}"
+            )
+        cascade = report["cascade"]
+        if cascade["graded"]:
+            reasons = ", ".join(f"{kind}: {n}" for kind, n in sorted(cascade["reasons"].items()))
+            lines.append(
+                f"  cascade: {cascade['escalated']}/{cascade['graded']} escalated "
+                f"({cascade['escalation_rate']:.0%})" + (f" - {reasons}" if reasons else "")
+            )
+        return "\n".join(lines)
+
+    def prometheus_text(self):
+        """Return the run's metrics in the Prometheus text exposition format."""
+        report = self.snapshot()
+        rows = report["by_stage_and_model"]
+        out = []
+
+        def metric(name, kind, help_text, samples):
+            out.append(f"# HELP {name} {help_text}")
+            out.append(f"# TYPE {name} {kind}")
+            out.extend(f"{name}{_prom_labels(**lbls)} {value}" for lbls, value in samples)
+
+        metric(
+            "grader_requests_total",
+            "counter",
+            "Gemini API request attempts by outcome.",
+            [
+                ({"stage": r["stage"], "model": r["model"], "outcome": outcome}, n)
+                for r in rows
+                for outcome, n in sorted(r["outcomes"].items())
+            ],
+        )
+        metric(
+            "grader_retries_total",
+            "counter",
+            "Requests retried after a 429/503.",
+            [({"stage": r["stage"], "model": r["model"]}, r["retries"]) for r in rows],
+        )
+        metric(
+            "grader_cache_hits_total",
+            "counter",
+            "Requests answered from the response cache.",
+            [({"stage": r["stage"], "model": r["model"]}, r["cache_hits"]) for r in rows],
+        )
+        metric(
+            "grader_tokens_total",
+            "counter",
+            "Tokens reported by the API usage metadata.",
+            [
+                ({"stage": r["stage"], "model": r["model"], "kind": kind}, r[f"{kind}_tokens"])
+                for r in rows
+                for kind in ("prompt", "output", "cached")
+            ],
+        )
+        metric(
+            "grader_estimated_cost_usd",
+            "gauge",
+            "Estimated API cost of the run in US dollars.",
+            [({"stage": r["stage"], "model": r["model"]}, round(r["cost_usd"], 6)) for r in rows],
+        )
+        out.append("# HELP grader_request_latency_seconds Gemini API request latency.")
+        out.append("# TYPE grader_request_latency_seconds histogram")
+        for r in rows:
+            cumulative = 0
+            for le, n in r["latency_buckets"].items():
+                cumulative += n
+                lbls = _prom_labels(stage=r["stage"], model=r["model"], le=le)
+                out.append(f"grader_request_latency_seconds_bucket{lbls} {cumulative}")
+            lbls = _prom_labels(stage=r["stage"], model=r["model"])
+            out.append(f"grader_request_latency_seconds_sum{lbls} {round(r['latency_seconds'], 6)}")
+            out.append(f"grader_request_latency_seconds_count{lbls} {r['requests']}")
+        cascade = report["cascade"]
+        if cascade["graded"]:
+            metric(
+                "grader_cascade_submissions_total",
+                "counter",
+                "Cascade-graded submissions by whether they were escalated.",
+                [
+                    ({"tier": "first"}, cascade["graded"] - cascade["escalated"]),
+                    ({"tier": "escalated"}, cascade["escalated"]),
+                ],
+            )
+            metric(
+                "grader_cascade_escalations_total",
+                "counter",
+                "Escalated submissions by reason kind.",
+                [({"reason": kind}, n) for kind, n in sorted(cascade["reasons"].items())],
+            )
+        metric(
+            "grader_run_duration_seconds",
+            "gauge",
+            "Wall-clock duration of the last grading run.",
+            [({}, report["duration_seconds"])],
+        )
+        return "\n".join(out) + "\n"
+
+    def export(self, output_folder):
+        """Write the JSON run report and the Prometheus textfile to ``output_folder``."""
+        output_folder = Path(output_folder)
+        try:
+            _write_atomic(
+                output_folder / RUN_REPORT_FILE, json.dumps(self.snapshot(), indent=2)
+            )
+            _write_atomic(output_folder / PROMETHEUS_FILE, self.prometheus_text())
+            logging.info(f"Run metrics saved to: {output_folder / RUN_REPORT_FILE}")
+        except Exception as e:
+            logging.error(f"Failed to write run metrics to {output_folder}: {e}")
+
+
+def load_run_report(output_folder):
+    """Return the last run report saved in ``output_folder``, or ``None``."""
+    try:
+        with open(Path(output_folder) / RUN_REPORT_FILE, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+_shared_metrics = RunMetrics()
+
+
+def get_metrics():
+    """Return the process-wide metrics shared by the grading scripts."""
+    return _shared_metrics
@@ -0,0 +1,113 @@
+"""Per-stage model routing with an ordered fallback chain.
+
+Each grading script declares ``MODEL_ROUTES``, mapping a stage (``grade``,
+``review``, ``repair``, ``draft``) to the models to try in order. A
+:class:`ModelRouter` sends each request to the first model of its stage's
+chain; when that model is throttled (429), times out or returns a 5xx after a
+short retry, the router fails over to the next model and puts the failed one
+on a cooldown, so later requests skip it instead of stalling on an exhausted
+quota. The last model of the chain, or the only one not cooling down, gets the
+client's full retry backoff instead of failing over. Other failures (blocked prompts, empty replies) are not retried on
+another model.
+
+The model that actually answered is recorded per stage: wrap a submission in
+:func:`track_models` to collect ``{stage: model}`` for its result record.
+"""
+
+import logging
+import threading
+import time
+from contextlib import contextmanager
+
+from gemini_client import ModelUnavailable, generate_text
+
+COOLDOWN_SECONDS = 60.0
+
+_context = threading.local()
+
+
+@contextmanager
+def track_models():
+    """Collect the models that serve routed requests on this thread.
+
+    Yields a dict that is filled with ``{stage: model_name}`` as requests
+    complete; nested blocks each get their own dict.
+    """
+    previous = getattr(_context, "served", None)
+    served = {}
+    _context.served = served
+    try:
+        yield served
+    finally:
+        _context.served = previous
+
+
+def served_models():
+    """Return the ``{stage: model}`` collected so far by the enclosing :func:`track_models`."""
+    return dict(getattr(_context, "served", None) or {})
+
+
+def _record_served(stage, model_name):
+    served = getattr(_context, "served", None)
+    if served is not None:
+        served[stage] = model_name
+
+
+class ModelRouter:
+    """Routes requests per stage through ``routes`` (``{stage: [model, ...]}``)."""
+
+    def __init__(self, routes, default_stage="grade", cooldown_seconds=COOLDOWN_SECONDS, clock=time.monotonic):
+        self.routes = {stage: list(models) for stage, models in routes.items()}
+        self.default_stage = default_stage
+        self.cooldown_seconds = cooldown_seconds
+        self._clock = clock
+        self._cooling = {}  # model -> time its cooldown ends
+        self._lock = threading.Lock()
+
+    def chain(self, stage):
+        """Return the models to try for ``stage``, available ones first."""
+        models = self.routes.get(stage) or self.routes[self.default_stage]
+        now = self._clock()
+        with self._lock:
+            ready = [m for m in models if self._cooling.get(m, 0) <= now]
+        # When every model is cooling down, still try them all in order.
+        return ready + [m for m in models if m not in ready] if ready else list(models)
+
+    def primary(self, stage):
+        """Return the first configured model for ``stage``."""
+        return (self.routes.get(stage) or self.routes[self.default_stage])[0]
+
+    def fingerprint(self, stages=None):
+        """Return a stable string describing the routes of ``stages`` (default: all)."""
+        stages = sorted(stages or self.routes)
+        return ";".join(f"{s}={'>'.join(self.routes.get(s, []))}" for s in stages)
+
+    def _cool_down(self, model_name):
+        with self._lock:
+            self._cooling[model_name] = self._clock() + self.cooldown_seconds
+
+    def generate(self, stage, prompt, api_key, **kwargs):
+        """Send ``prompt`` for ``stage``, failing over along the chain.
+
+        Keyword arguments are passed to :func:`gemini_client.generate_text`.
+        Returns the response text, or ``None`` if no model produced one.
+        """
+        chain = self.chain(stage)
+        now = self._clock()
+        with self._lock:
+            ready = [m for m in chain if self._cooling.get(m, 0) <= now]
+        for position, model_name in enumerate(chain):
+            # With nothing left to fail over to, use the client's full retry backoff.
+            failover = position + 1 < len(chain) and ready != [model_name]
+            try:
+                text = generate_text(prompt, api_key, model_name, failover=failover, **kwargs)
+            except ModelUnavailable as e:
+                self._cool_down(model_name)
+                logging.warning(
+                    f"{stage} request failed over from {model_name} to {chain[position + 1]}: {e.reason}"
+                )
+                continue
+            if text:
+                _record_served(stage, model_name)
+            return text
+        return None
@@ -0,0 +1,248 @@
+"""Prompt-prefix caching for the static part of the grading prompts.
+
+The text before ``{{STUDENT_SUBMISSION_TEXT_HERE}}`` in ``master_prompt.txt``
+and ``draft_feedback_prompt.txt`` is identical for every student. A
+:class:`PrefixCache` registers that prefix once per run through Gemini's
+cached-content API, refreshes its TTL while the run is going, and hands back a
+model bound to the cached prefix so each request only carries the
+student-specific parts. When cached content is unavailable (model alias not
+supported, prefix below the minimum size, quota, offline) the caller falls
+back to sending the full prompt.
+
+With the shipped configuration this does nothing: the Gemini 1.5 models in
+``MODEL_ROUTES`` only cache contents of at least 32,768 tokens, and the static
+part of ``master_prompt.txt`` is about 3,400, so every request carries the full
+prompt. The cache takes effect for models with a lower minimum (see
+``MIN_PREFIX_TOKENS_BY_MODEL``) or for a prefix above the model's minimum.
+
+:class:`LocalPrefixCacheBackend` implements the same backend interface in
+memory so the caching logic can be exercised without network access.
+"""
+
+import datetime
+import hashlib
+import logging
+import threading
+import time
+
+import google.generativeai as genai
+from google.generativeai import caching
+
+from rate_limiter import estimate_tokens
+
+PREFIX_CACHE_TTL_SECONDS = 60 * 60
+# Refresh the TTL once less than this much time is left on the cached prefix.
+PREFIX_CACHE_REFRESH_MARGIN_SECONDS = 5 * 60
+# Gemini rejects cached contents below a model-specific minimum token count;
+# prefixes shorter than the minimum of their model are sent in full instead.
+MIN_PREFIX_TOKENS_BY_MODEL = {
+    "gemini-1.5": 32768,
+    "gemini-2.0": 32768,
+    "gemini-2.5-flash": 1024,
+    "gemini-2.5-pro": 4096,
+}
+# Minimum assumed for models not listed above.
+MIN_PREFIX_TOKENS = 32768
+# Set to False to always send the full prompt.
+PREFIX_CACHE_ENABLED = True
+
+
+class GeminiContextCacheBackend:
+    """Backend that stores prefixes with ``google.generativeai.caching``."""
+
+    def create(self, model_name, prefix_text, ttl_seconds):
+        return caching.CachedContent.create(
+            model=model_name,
+            display_name="grader-prompt-prefix",
+            contents=[prefix_text],
+            ttl=datetime.timedelta(seconds=ttl_seconds),
+        )
+
+    def refresh(self, handle, ttl_seconds):
+        handle.update(ttl=datetime.timedelta(seconds=ttl_seconds))
+
+    def model_for(self, handle, safety_settings, generation_config=None):
+        return genai.GenerativeModel.from_cached_content(
+            handle,
+            generation_config=generation_config,
+            safety_settings=safety_settings,
+        )
+
+    def delete(self, handle):
+        handle.delete()
+
+
+class _StubResponse:
+    def __init__(self, text):
+        self.text = text
+        self.parts = [text] if text else []
+        self.prompt_feedback = None
+        self.usage_metadata = None
+
+
+class _StubHandle:
+    def __init__(self, name, model_name, prefix_text):
+        self.name = name
+        self.model = model_name
+        self.prefix_text = prefix_text
+
+
+class _StubModel:
+    def __init__(self, handle, responder):
+        self._handle = handle
+        self._responder = responder
+
+    def generate_content(self, contents):
+        if isinstance(contents, str):
+            contents = [contents]
+        return _StubResponse(self._responder([self._handle.prefix_text, *contents]))
+
+
+class LocalPrefixCacheBackend:
+    """In-memory backend for offline tests.
+
+    ``responder`` receives the full prompt parts (cached prefix first) and
+    returns the response text.
+    """
+
+    def __init__(self, responder=None):
+        self._responder = responder or (lambda parts: "")
+        self.created = []
+        self.refreshed = []
+        self.deleted = []
+
+    def create(self, model_name, prefix_text, ttl_seconds):
+        handle = _StubHandle(f"cachedContents/local-{len(self.created)}", model_name, prefix_text)
+        self.created.append(handle)
+        return handle
+
+    def refresh(self, handle, ttl_seconds):
+        self.refreshed.append(handle)
+
+    def model_for(self, handle, safety_settings, generation_config=None):
+        return _StubModel(handle, self._responder)
+
+    def delete(self, handle):
+        self.deleted.append(handle)
+
+
+class PrefixCache:
+    """Registers each distinct (model, prefix) once and reuses it for the run."""
+
+    def __init__(
+        self,
+        backend=None,
+        ttl_seconds=PREFIX_CACHE_TTL_SECONDS,
+        refresh_margin_seconds=PREFIX_CACHE_REFRESH_MARGIN_SECONDS,
+        min_prefix_tokens=None,
+        clock=time.monotonic,
+    ):
+        self.backend = backend or GeminiContextCacheBackend()
+        self.ttl_seconds = ttl_seconds
+        self.refresh_margin_seconds = refresh_margin_seconds
+        self.min_prefix_tokens = min_prefix_tokens
+        self._clock = clock
+        self._entries = {}
+        self._unavailable = set()
+        self._creating = {}  # key -> Event set once its cached content is created (or failed)
+        self._lock = threading.Lock()
+
+    def model_for(self, model_name, prefix_text, safety_settings, generation_config=None, settings_key=""):
+        """Return a model bound to the cached ``prefix_text``, or ``None`` to fall back.
+
+        ``min_prefix_tokens`` (default: the model's minimum, see
+        :func:`min_prefix_tokens_for`) decides whether a prefix is worth caching.
+        The cached content is created and refreshed outside the lock, so other
+        prefixes are served meanwhile; threads asking for the same prefix wait
+        for the one creating it.
+        """
+        if not PREFIX_CACHE_ENABLED:
+            return None
+        min_tokens = self.min_prefix_tokens
+        if min_tokens is None:
+            min_tokens = min_prefix_tokens_for(model_name)
+        if estimate_tokens(prefix_text) < min_tokens:
+            return None
+        key = (model_name, hashlib.sha256(prefix_text.encode("utf-8")).hexdigest())
+        creating = None
+        while True:
+            with self._lock:
+                if key in self._unavailable:
+                    return None
+                entry = self._entries.get(key)
+                if entry is not None:
+                    now = self._clock()
+                    refresh = entry["expires_at"] - now < self.refresh_margin_seconds
+                    if refresh:
+                        # Claim the refresh so concurrent callers do not repeat it.
+                        entry["expires_at"] = now + self.ttl_seconds
+                    break
+                pending = self._creating.get(key)
+                if pending is None:
+                    creating = self._creating[key] = threading.Event()
+                    break
+            pending.wait()
+
+        try:
+            if entry is None:
+                handle = self.backend.create(model_name, prefix_text, self.ttl_seconds)
+                entry = {"handle": handle, "expires_at": self._clock() + self.ttl_seconds, "models": {}}
+                with self._lock:
+                    self._entries[key] = entry
+                logging.info(f"Registered cached prompt prefix for {model_name}: {getattr(handle, 'name', handle)}")
+            elif refresh:
+                self.backend.refresh(entry["handle"], self.ttl_seconds)
+            with self._lock:
+                model = entry["models"].get(settings_key)
+                if model is None:
+                    model = self.backend.model_for(entry["handle"], safety_settings, generation_config)
+                    entry["models"][settings_key] = model
+            return model
+        except Exception as e:
+            logging.warning(
+                f"Prompt prefix caching unavailable for {model_name}; sending full prompts instead ({e})."
+            )
+            with self._lock:
+                self._unavailable.add(key)
+                self._entries.pop(key, None)
+            return None
+        finally:
+            if creating is not None:
+                with self._lock:
+                    self._creating.pop(key, None)
+                creating.set()
+
+    def invalidate(self, model_name, prefix_text):
+        """Forget a prefix whose cached content failed at request time."""
+        key = (model_name, hashlib.sha256(prefix_text.encode("utf-8")).hexdigest())
+        with self._lock:
+            self._entries.pop(key, None)
+            self._unavailable.add(key)
+
+    def release_all(self):
+        """Delete every cached prefix registered during this run."""
+        with self._lock:
+            entries = list(self._entries.values())
+            self._entries.clear()
+        for entry in entries:
+            try:
+                self.backend.delete(entry["handle"])
+            except Exception as e:
+                logging.warning(f"Could not delete cached prompt prefix: {e}")
+
+
+def min_prefix_tokens_for(model_name):
+    """Return the smallest prefix (in tokens) ``model_name`` accepts as cached content."""
+    name = model_name.split("/")[-1]
+    for prefix, minimum in MIN_PREFIX_TOKENS_BY_MODEL.items():
+        if name.startswith(prefix):
+            return minimum
+    return MIN_PREFIX_TOKENS
+
+
+_shared_prefix_cache = PrefixCache()
+
+
+def get_prefix_cache():
+    """Return the process-wide prefix cache."""
+    return _shared_prefix_cache
@@ -0,0 +1,230 @@
+"""Shared Gemini rate limiting for ``grader``, ``bigbraingrader`` and ``draft_grader``.
+
+Each model gets its own requests-per-minute (RPM) and tokens-per-minute (TPM)
+budget tracked over a sliding 60 second window. Calls that come back with a
+429/503 are retried with jittered exponential backoff, and the number of
+concurrent requests allowed per model is adjusted AIMD-style: it grows by one
+after a run of successful calls and is halved whenever the API throttles us.
+"""
+
+import logging
+import random
+import threading
+import time
+from collections import deque
+
+from metrics import get_metrics
+
+# Free-tier quotas per model. Paid tiers can raise these via ``set_model_limits``.
+DEFAULT_MODEL_LIMITS = {
+    "gemini-1.5-flash-latest": {"rpm": 15, "tpm": 1_000_000, "max_concurrency": 8},
+    "gemini-1.5-pro-latest": {"rpm": 2, "tpm": 32_000, "max_concurrency": 2},
+}
+FALLBACK_LIMITS = {"rpm": 15, "tpm": 1_000_000, "max_concurrency": 4}
+WINDOW_SECONDS = 60.0
+MAX_RETRIES = 5
+BACKOFF_BASE_SECONDS = 2.0
+BACKOFF_MAX_SECONDS = 60.0
+RETRYABLE_STATUS_CODES = {429, 503}
+# Errors after which a routed request moves on to the next model in its chain.
+FAILOVER_STATUS_CODES = {429, 500, 502, 503, 504}
+FAILOVER_MAX_RETRIES = 1
+
+
+def estimate_tokens(prompt):
+    """Roughly estimate the token count of a prompt (about 4 characters per token)."""
+    if prompt is None:
+        return 0
+    if isinstance(prompt, (list, tuple)):
+        return sum(estimate_tokens(part) for part in prompt)
+    return max(1, len(str(prompt)) // 4)
+
+
+def error_status(exc):
+    """Return the HTTP-style status of an API error (429, 503...), or ``None``.
+
+    Timeouts are reported as 504.
+    """
+    if isinstance(exc, TimeoutError):
+        return 504
+    code = getattr(exc, "code", None)
+    if callable(code):  # grpc errors expose ``code()`` rather than an attribute
+        try:
+            code = code()
+        except Exception:
+            code = None
+    code = getattr(code, "value", code)
+    if isinstance(code, tuple):  # grpc.StatusCode values are (int, str)
+        code = {4: 504, 8: 429, 13: 500, 14: 503}.get(code[0])
+    try:
+        code = int(code)
+    except (TypeError, ValueError):
+        code = None
+    if code in RETRYABLE_STATUS_CODES:
+        return code
+    message = str(exc).lower()
+    if any(marker in message for marker in ("429", "resource has been exhausted", "quota")):
+        return 429
+    if any(marker in message for marker in ("503", "unavailable")):
+        return 503
+    if code is None and any(marker in message for marker in ("deadline exceeded", "timed out")):
+        return 504
+    return code
+
+
+def is_retryable_error(exc):
+    """Return ``True`` for throttling (429) and unavailable (503) API errors."""
+    return error_status(exc) in RETRYABLE_STATUS_CODES
+
+
+def is_failover_error(exc):
+    """Return ``True`` for errors that should move a request to another model."""
+    return error_status(exc) in FAILOVER_STATUS_CODES
+
+
+def backoff_delay(attempt, base=BACKOFF_BASE_SECONDS, cap=BACKOFF_MAX_SECONDS):
+    """Full-jitter exponential backoff delay for a zero-based retry ``attempt``."""
+    return random.uniform(0, min(cap, base * (2 ** attempt)))
+
+
+def response_token_count(response):
+    """Return the total token count reported by a Gemini response, if any."""
+    usage = getattr(response, "usage_metadata", None)
+    total = getattr(usage, "total_token_count", None)
+    return total if isinstance(total, int) and total > 0 else None
+
+
+class ModelRateLimiter:
+    """Sliding-window RPM/TPM budget plus an AIMD concurrency limit for one model."""
+
+    def __init__(self, rpm, tpm, max_concurrency, clock=time.monotonic):
+        self.rpm = rpm
+        self.tpm = tpm
+        self.max_concurrency = max(1, max_concurrency)
+        self.concurrency_limit = self.max_concurrency
+        self.in_flight = 0
+        self._clock = clock
+        self._events = deque()  # [timestamp, tokens] for each request in the window
+        self._successes = 0
+        self._cond = threading.Condition()
+
+    def _purge(self, now):
+        while self._events and now - self._events[0][0] >= WINDOW_SECONDS:
+            self._events.popleft()
+
+    def _wait_time(self, tokens, now):
+        """Seconds to wait before a request of ``tokens`` fits, or 0 if it fits now."""
+        if self.in_flight >= self.concurrency_limit:
+            return None  # woken by ``release``
+        waits = [0.0]
+        if len(self._events) >= self.rpm:
+            waits.append(self._events[0][0] + WINDOW_SECONDS - now)
+        used = sum(event[1] for event in self._events)
+        # A single oversized request is still allowed through on an empty window.
+        if self._events and used + tokens > self.tpm:
+            freed = 0
+            for timestamp, event_tokens in self._events:
+                freed += event_tokens
+                if used - freed + tokens <= self.tpm:
+                    waits.append(timestamp + WINDOW_SECONDS - now)
+                    break
+            else:
+                waits.append(self._events[-1][0] + WINDOW_SECONDS - now)
+        return max(waits)
+
+    def acquire(self, tokens=0):
+        """Block until the request fits the budget and return its window entry."""
+        with self._cond:
+            while True:
+                now = self._clock()
+                self._purge(now)
+                wait = self._wait_time(tokens, now)
+                if wait == 0:
+                    entry = [now, tokens]
+                    self._events.append(entry)
+                    self.in_flight += 1
+                    return entry
+                self._cond.wait(timeout=wait)
+
+    def release(self, entry=None, *, throttled=False, actual_tokens=None):
+        """Finish a request, recording real token usage and adjusting concurrency."""
+        with self._cond:
+            self.in_flight = max(0, self.in_flight - 1)
+            if entry is not None and actual_tokens is not None:
+                entry[1] = actual_tokens
+            if throttled:
+                self.concurrency_limit = max(1, self.concurrency_limit // 2)
+                self._successes = 0
+            else:
+                self._successes += 1
+                if (
+                    self._successes >= self.concurrency_limit
+                    and self.concurrency_limit < self.max_concurrency
+                ):
+                    self.concurrency_limit += 1
+                    self._successes = 0
+            self._cond.notify_all()
+
+
+class RateLimiter:
+    """Registry of per-model limiters with a retrying ``call`` helper."""
+
+    def __init__(self, model_limits=None, sleep=time.sleep):
+        self._limits = {
+            name: dict(cfg) for name, cfg in (model_limits or DEFAULT_MODEL_LIMITS).items()
+        }
+        self._limiters = {}
+        self._lock = threading.Lock()
+        self._sleep = sleep
+
+    def set_model_limits(self, model_name, *, rpm=None, tpm=None, max_concurrency=None):
+        """Override the quota for ``model_name`` (e.g. for a paid tier)."""
+        with self._lock:
+            cfg = dict(self._limits.get(model_name, FALLBACK_LIMITS))
+            for key, value in (("rpm", rpm), ("tpm", tpm), ("max_concurrency", max_concurrency)):
+                if value is not None:
+                    cfg[key] = value
+            self._limits[model_name] = cfg
+            self._limiters.pop(model_name, None)
+
+    def for_model(self, model_name):
+        """Return the :class:`ModelRateLimiter` for ``model_name``."""
+        with self._lock:
+            limiter = self._limiters.get(model_name)
+            if limiter is None:
+                cfg = self._limits.get(model_name, FALLBACK_LIMITS)
+                limiter = ModelRateLimiter(cfg["rpm"], cfg["tpm"], cfg["max_concurrency"])
+                self._limiters[model_name] = limiter
+            return limiter
+
+    def call(self, model_name, fn, *, estimated_tokens=0, max_retries=MAX_RETRIES):
+        """Call ``fn()`` within the quota of ``model_name``, retrying on 429/503."""
+        limiter = self.for_model(model_name)
+        for attempt in range(max_retries + 1):
+            entry = limiter.acquire(estimated_tokens)
+            try:
+                result = fn()
+            except Exception as e:
+                retryable = is_retryable_error(e)
+                limiter.release(entry, throttled=retryable)
+                if not retryable or attempt >= max_retries:
+                    raise
+                get_metrics().record_retry(model_name)
+                delay = backoff_delay(attempt)
+                logging.warning(
+                    f"Gemini API throttled for {model_name} ({e}). "
+                    f"Retrying in {delay:.1f}s (attempt {attempt + 1}/{max_retries}); "
+                    f"concurrency limit now {limiter.concurrency_limit}."
+                )
+                self._sleep(delay)
+                continue
+            limiter.release(entry, actual_tokens=response_token_count(result))
+            return result
+
+
+_shared_limiter = RateLimiter()
+
+
+def get_rate_limiter():
+    """Return the process-wide limiter shared by all grading scripts."""
+    return _shared_limiter
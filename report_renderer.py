@@ -0,0 +1,326 @@
+"""Render feedback reports from a pre-styled DOCX template.
+
+Building a report through python-docx creates and serialises an object per
+paragraph, run and table cell. Here the template (``report_template.docx`` if
+present, otherwise python-docx's default template) is read once per process;
+each report's body is generated as one WordprocessingML string and written
+into a copy of the template's zip parts, keeping its styles, numbering,
+headers and footers. Paragraphs use the template's ``Heading 1``-``Heading 4``
+and ``List Bullet`` styles, so restyling the template restyles every report.
+
+:class:`RenderPool` renders reports in worker processes, so a cohort's
+reports are written while the API stage carries on.
+"""
+
+import logging
+import multiprocessing
+import os
+import re
+import threading
+import zipfile
+from concurrent.futures import ProcessPoolExecutor
+from functools import lru_cache
+from pathlib import Path
+from xml.sax.saxutils import escape
+
+REPORT_TEMPLATE_FILE = Path("report_template.docx")
+DOCUMENT_PART = "word/document.xml"
+# Characters XML 1.0 cannot carry; model output occasionally contains them.
+_INVALID_XML_CHARS = re.compile("[\x00-\x08\x0b\x0c\x0e-\x1f\ufffe\uffff]")
+BULLET_STYLES = ("ListBullet", "ListBullet2", "ListBullet3")
+
+
+def default_template_path():
+    """Return the template reports are rendered from."""
+    if REPORT_TEMPLATE_FILE.exists():
+        return REPORT_TEMPLATE_FILE
+    import docx  # only needed to locate its bundled template
+
+    return Path(docx.__file__).parent / "templates" / "default.docx"
+
+
+class ReportTemplate:
+    """The zip parts of a DOCX template, split around its body content."""
+
+    def __init__(self, path):
+        with zipfile.ZipFile(path) as archive:
+            self.parts = [(info, archive.read(info.filename)) for info in archive.infolist()]
+        document = dict((info.filename, data) for info, data in self.parts)[DOCUMENT_PART]
+        document = document.decode("utf-8")
+        # Report content goes after any template content, before the body's sectPr.
+        split = document.rfind("<w:sectPr")
+        if split == -1:
+            split = document.rfind("</w:body>")
+        self.head, self.tail = document[:split], document[split:]
+        self.text_width = _text_width(self.tail)
+
+    def write(self, body_xml, output_path):
+        """Write a document with ``body_xml`` as its content to ``output_path``."""
+        output_path = Path(output_path)
+        tmp_path = output_path.with_name(f".{output_path.name}.{os.getpid()}.tmp")
+        document = (self.head + body_xml + self.tail).encode("utf-8")
+        with zipfile.ZipFile(tmp_path, "w", zipfile.ZIP_DEFLATED) as archive:
+            for info, data in self.parts:
+                archive.writestr(info, document if info.filename == DOCUMENT_PART else data)
+        os.replace(tmp_path, output_path)
+
+
+def _text_width(section_xml):
+    """Return the printable width (twips) from a ``sectPr``, defaulting to 6 inches."""
+    page = re.search(r'<w:pgSz\b[^>]*\bw:w="(\d+)"', section_xml)
+    left = re.search(r'<w:pgMar\b[^>]*\bw:left="(\d+)"', section_xml)
+    right = re.search(r'<w:pgMar\b[^>]*\bw:right="(\d+)"', section_xml)
+    if not (page and left and right):
+        return 8640
+    return int(page.group(1)) - int(left.group(1)) - int(right.group(1))
+
+
+@lru_cache(maxsize=None)
+def load_template(path=None):
+    """Return the (per-process cached) :class:`ReportTemplate` for ``path``."""
+    return ReportTemplate(path or default_template_path())
+
+
+# --- WordprocessingML builders ---
+
+
+def _run(text, bold=False):
+    text = _INVALID_XML_CHARS.sub("", str(text))
+    pieces = []
+    for i, line in enumerate(text.split("\n")):
+        if i:
+            pieces.append("<w:br/>")
+        for j, chunk in enumerate(line.split("\t")):
+            if j:
+                pieces.append("<w:tab/>")
+            if chunk:
+                pieces.append(f'<w:t xml:space="preserve">{escape(chunk)}</w:t>')
+    props = "<w:rPr><w:b/></w:rPr>" if bold else ""
+    return f"<w:r>{props}{''.join(pieces)}</w:r>" if pieces else ""
+
+
+def paragraph(text="", style=None, runs=None):
+    """Return a ``w:p`` with ``text`` (or ``(text, bold)`` ``runs``) in ``style``."""
+    props = f'<w:pPr><w:pStyle w:val="{style}"/></w:pPr>' if style else ""
+    content = "".join(_run(t, bold) for t, bold in runs) if runs is not None else _run(text)
+    return f"<w:p>{props}{content}</w:p>"
+
+
+def heading(text, level):
+    return paragraph(text, f"Heading{level}")
+
+
+def table(rows, text_width):
+    """Return a ``w:tbl`` with one row per list of cell texts."""
+    cols = max(len(row) for row in rows)
+    width = text_width // cols
+    grid = "".join(f'<w:gridCol w:w="{width}"/>' for _ in range(cols))
+    body = "".join(
+        "<w:tr>"
+        + "".join(
+            f'<w:tc><w:tcPr><w:tcW w:type="dxa" w:w="{width}"/></w:tcPr>{paragraph(cell)}</w:tc>'
+            for cell in row
+        )
+        + "</w:tr>"
+        for row in rows
+    )
+    return (
+        '<w:tbl><w:tblPr><w:tblW w:type="auto" w:w="0"/>'
+        '<w:tblLook w:firstColumn="1" w:firstRow="1" w:lastColumn="0" w:lastRow="0" '
+        'w:noHBand="0" w:noVBand="1" w:val="04A0"/></w:tblPr>'
+        f"<w:tblGrid>{grid}</w:tblGrid>{body}</w:tbl>"
+    )
+
+
+def _bold_runs(text):
+    """Split ``text`` into ``(text, bold)`` runs, interpreting **bold** markdown."""
+    runs = []
+    for part in re.split(r"(\*\*[^*]+\*\*)", text):
+        if part.startswith("**") and part.endswith("**") and len(part) > 4:
+            runs.append((part[2:-2], True))
+        elif part:
+            runs.append((part, False))
+    return runs
+
+
+# --- Reports ---
+
+
+def feedback_report_xml(yaml_data, student_identifier, rubric_config, text_width, doc_author=None):
+    """Return the body of a grading feedback report."""
+    out = [heading(f"Feedback Report for: {student_identifier}", 1)]
+    if doc_author:
+        out.append(paragraph(f"Author (from file metadata): {doc_author}"))
+
+    grade_info = yaml_data.get("assistant_grade", {})
+    breakdown = grade_info.get("breakdown", {})
+    rubric_criteria_details = {
+        cid: {"name": cfg.get("name", cid), "max_points": cfg.get("max_points", 0)}
+        for cid, cfg in rubric_config.get("criteria", {}).items()
+    }
+
+    out.append(heading("Summary of Points", 2))
+    rows = [["Criterion", "Points Achieved", "Max Points"]]
+    for cid, details in rubric_criteria_details.items():
+        rows.append(
+            [
+                details["name"],
+                str(breakdown.get(cid, {}).get("points", "N/A")),
+                str(details["max_points"]),
+            ]
+        )
+    out.append(table(rows, text_width))
+    out.append(paragraph())
+    try:
+        total_points = sum(int(item.get("points", 0)) for item in breakdown.values())
+    except Exception:
+        total_points = grade_info.get("total_points", "N/A")
+    max_total_points = rubric_config.get("total_points_possible", 0)
+
+    out.append(heading("Overall Assessment", 2))
+    out.append(paragraph(f"Total Points: {total_points} / {max_total_points}"))
+    out.append(paragraph())
+
+    out.append(heading("Detailed Breakdown by Criterion", 2))
+    for idx, reason_item in enumerate(yaml_data.get("assistant_reasons", []), start=1):
+        criterion_id = reason_item.get("criterion", "Unknown Criterion")
+        band = reason_item.get("band", "N/A")
+        rationale = reason_item.get("rationale", "No rationale provided.")
+        evidence = reason_item.get("evidence", "No evidence quoted.")
+        improvements = reason_item.get("improvements", [])
+
+        criterion_details = rubric_criteria_details.get(
+            criterion_id,
+            {"name": criterion_id.replace("_", " ").title(), "max_points": "N/A"},
+        )
+        points_achieved = breakdown.get(criterion_id, {}).get("points", "N/A")
+
+        out.append(heading(f"{idx}. {criterion_details['name']}", 3))
+        out.append(
+            paragraph(
+                f"Points: {points_achieved} / {criterion_details['max_points']} (Band Achieved: {band})"
+            )
+        )
+
+        out.append(heading("AI's Rationale:", 4))
+        out.append(paragraph(rationale))
+
+        out.append(heading("Evidence from Student's Work:", 4))
+        if "\n" in evidence:
+            out.extend(
+                paragraph(line.strip(), "ListBullet") for line in evidence.splitlines() if line.strip()
+            )
+        else:
+            out.append(paragraph(evidence if evidence else "N/A"))
+
+        out.append(heading("Suggested Improvements:", 4))
+        if isinstance(improvements, list):
+            out.extend(paragraph(imp, "ListBullet") for imp in improvements if imp)
+        elif improvements:
+            out.append(paragraph(str(improvements)))
+
+        out.append(paragraph())
+    return "".join(out)
+
+
+def draft_report_xml(feedback_prose, student_identifier):
+    """Return the body of a draft feedback report from the model's prose."""
+    out = [heading(f"Draft Feedback Report for: {student_identifier}", 1)]
+    for raw_line in feedback_prose.splitlines():
+        line = raw_line.rstrip()
+        if not line.strip():
+            out.append(paragraph())
+            continue
+
+        if line.startswith("**") and line.endswith("**") and len(line) > 4:
+            out.append(heading(line.strip("*"), 2))
+            continue
+
+        bullet_match = re.match(r"^(\s*)\*\s+(.*)", line)
+        if bullet_match:
+            indent, bullet_text = bullet_match.groups()
+            level = min(len(indent) // 4, 2)
+            out.append(paragraph(style=BULLET_STYLES[level], runs=_bold_runs(bullet_text.strip())))
+            continue
+
+        out.append(paragraph(runs=_bold_runs(line.strip())))
+    return "".join(out)
+
+
+def render_feedback_report(
+    yaml_data, output_path, student_identifier, rubric_config, doc_author=None, template=None
+):
+    """Render a grading feedback report to ``output_path``."""
+    report = load_template(template)
+    report.write(
+        feedback_report_xml(
+            yaml_data, student_identifier, rubric_config, report.text_width, doc_author=doc_author
+        ),
+        output_path,
+    )
+    return str(output_path)
+
+
+def render_draft_report(feedback_prose, output_path, student_identifier, template=None):
+    """Render a draft feedback report to ``output_path``."""
+    load_template(template).write(draft_report_xml(feedback_prose, student_identifier), output_path)
+    return str(output_path)
+
+
+class RenderPool:
+    """Render reports in worker processes.
+
+    :meth:`submit` queues one of the ``render_*`` functions and returns its
+    future; failures are logged when they happen and their output paths are
+    collected in :attr:`failed_paths`. Leaving the ``with`` block waits for
+    every queued report.
+    """
+
+    def __init__(self, max_workers=None):
+        # The parent holds API client threads, so workers are not plain forks.
+        context = multiprocessing.get_context(
+            "forkserver" if "forkserver" in multiprocessing.get_all_start_methods() else "spawn"
+        )
+        self._executor = ProcessPoolExecutor(
+            max_workers=max_workers or os.cpu_count() or 1, mp_context=context
+        )
+        self.failed_paths = set()
+        self._lock = threading.Lock()
+
+    def submit(self, render, *args, **kwargs):
+        """Queue ``render(*args, **kwargs)`` and return its future.
+
+        ``render`` is a ``render_*`` function; its second argument is the
+        output path.
+        """
+        future = self._executor.submit(render, *args, **kwargs)
+        output_path = args[1] if len(args) > 1 else kwargs.get("output_path")
+        future.add_done_callback(lambda done: self._log_result(done, output_path))
+        return future
+
+    def _log_result(self, future, output_path):
+        try:
+            future.result()
+            logging.info(f"Report saved to: {output_path}")
+        except Exception as e:
+            with self._lock:
+                self.failed_paths.add(str(output_path))
+            logging.error(f"Failed to render report {output_path}: {e}")
+
+    @property
+    def failures(self):
+        """Number of reports that failed to render."""
+        return len(self.failed_paths)
+
+    def rendered(self, output_path):
+        """Return ``False`` if rendering ``output_path`` failed (call after :meth:`shutdown`)."""
+        return str(output_path) not in self.failed_paths
+
+    def shutdown(self):
+        self._executor.shutdown(wait=True)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.shutdown()
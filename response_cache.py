@@ -0,0 +1,181 @@
+"""Persistent, content-addressed cache for Gemini responses.
+
+Responses are stored on disk under a SHA-256 of everything that determines
+them: the model name, the generation config, the full prompt (template plus
+extracted student text) and any extra context such as the rubric. Re-running
+after a crash or a rendering tweak therefore never pays for the same request
+twice. Entries older than ``MAX_AGE_SECONDS`` are dropped and, once the cache
+grows past ``MAX_CACHE_BYTES``, the least recently used entries are evicted.
+"""
+
+import hashlib
+import json
+import logging
+import os
+import threading
+import time
+from pathlib import Path
+
+CACHE_DIR = Path(".llm_cache")
+MAX_CACHE_BYTES = 200 * 1024 * 1024
+MAX_AGE_SECONDS = 30 * 24 * 60 * 60
+# Set to False to always call the API (e.g. when comparing model runs).
+RESPONSE_CACHE_ENABLED = True
+
+_fingerprint_lock = threading.Lock()
+_fingerprints = {}
+
+
+def file_fingerprint(path):
+    """Return the SHA-256 of a file's bytes, memoised on its size and mtime."""
+    path = Path(path)
+    try:
+        stat = path.stat()
+    except OSError:
+        return None
+    memo_key = (str(path.resolve()), stat.st_size, stat.st_mtime_ns)
+    with _fingerprint_lock:
+        digest = _fingerprints.get(memo_key)
+    if digest is None:
+        digest = hashlib.sha256(path.read_bytes()).hexdigest()
+        with _fingerprint_lock:
+            _fingerprints[memo_key] = digest
+    return digest
+
+
+def make_cache_key(model_name, prompt, generation_config=None, context=None):
+    """Hash the request inputs into a stable cache key."""
+    if isinstance(prompt, (list, tuple)):
+        prompt = [str(part) for part in prompt]
+    payload = {
+        "model": model_name,
+        "generation_config": generation_config or {},
+        "prompt": prompt,
+        "context": context or {},
+    }
+    encoded = json.dumps(payload, sort_keys=True, default=str).encode("utf-8")
+    return hashlib.sha256(encoded).hexdigest()
+
+
+class ResponseCache:
+    """On-disk response store with age- and size-based eviction."""
+
+    def __init__(self, directory=CACHE_DIR, max_bytes=MAX_CACHE_BYTES, max_age_seconds=MAX_AGE_SECONDS):
+        self.directory = Path(directory)
+        self.max_bytes = max_bytes
+        self.max_age_seconds = max_age_seconds
+        self.hits = 0
+        self.misses = 0
+        self.writes = 0
+        self.evictions = 0
+        self._total_bytes = None
+        self._lock = threading.Lock()
+
+    def _path_for(self, key):
+        return self.directory / key[:2] / f"{key}.json"
+
+    def get(self, key):
+        """Return the cached response text for ``key`` or ``None``."""
+        path = self._path_for(key)
+        try:
+            entry = json.loads(path.read_text(encoding="utf-8"))
+        except FileNotFoundError:
+            entry = None
+        except Exception as e:
+            logging.warning(f"Discarding unreadable cache entry {path}: {e}")
+            self._remove(path)
+            entry = None
+
+        if entry is not None and time.time() - entry.get("created", 0) > self.max_age_seconds:
+            self._remove(path)
+            entry = None
+
+        with self._lock:
+            if entry is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+        try:
+            os.utime(path)  # mark as recently used for LRU eviction
+        except OSError:
+            pass
+        return entry.get("text")
+
+    def put(self, key, text, **metadata):
+        """Store ``text`` under ``key`` and evict old entries if needed."""
+        path = self._path_for(key)
+        entry = dict(metadata, created=time.time(), text=text)
+        try:
+            path.parent.mkdir(parents=True, exist_ok=True)
+            tmp_path = path.with_suffix(f".{threading.get_ident()}.tmp")
+            tmp_path.write_text(json.dumps(entry), encoding="utf-8")
+            os.replace(tmp_path, path)
+        except Exception as e:
+            logging.warning(f"Could not write response cache entry {path}: {e}")
+            return
+
+        with self._lock:
+            self.writes += 1
+            if self._total_bytes is not None:
+                self._total_bytes += path.stat().st_size
+            over_budget = self._total_bytes is None or self._total_bytes > self.max_bytes
+        if over_budget:
+            self.evict()
+
+    def _remove(self, path):
+        try:
+            path.unlink()
+        except FileNotFoundError:
+            pass
+        except OSError as e:
+            logging.warning(f"Could not remove cache entry {path}: {e}")
+
+    def evict(self):
+        """Drop expired entries, then least recently used ones over the size budget."""
+        if not self.directory.exists():
+            with self._lock:
+                self._total_bytes = 0
+            return
+        now = time.time()
+        entries = []
+        for path in self.directory.glob("*/*.json"):
+            try:
+                stat = path.stat()
+            except OSError:
+                continue
+            if now - stat.st_mtime > self.max_age_seconds:
+                self._remove(path)
+                with self._lock:
+                    self.evictions += 1
+                continue
+            entries.append((stat.st_mtime, stat.st_size, path))
+
+        total = sum(size for _, size, _ in entries)
+        entries.sort()
+        for _, size, path in entries:
+            if total <= self.max_bytes:
+                break
+            self._remove(path)
+            total -= size
+            with self._lock:
+                self.evictions += 1
+        with self._lock:
+            self._total_bytes = total
+
+    def stats_summary(self):
+        """Return a one-line description of hit/miss statistics."""
+        with self._lock:
+            lookups = self.hits + self.misses
+            rate = (self.hits / lookups * 100) if lookups else 0.0
+            return (
+                f"Response cache: {self.hits} hit(s), {self.misses} miss(es) "
+                f"({rate:.0f}% hit rate), {self.writes} write(s), {self.evictions} eviction(s)."
+            )
+
+
+_shared_cache = ResponseCache()
+
+
+def get_response_cache():
+    """Return the process-wide response cache."""
+    return _shared_cache
@@ -0,0 +1,240 @@
+"""Local repair of grading replies that fail to parse.
+
+:func:`repair_grading_response` runs a sequence of cheap, local fixes and
+returns the first result that parses into a complete grade, together with the
+name of the strategy that produced it:
+
+``strip_fences``
+    Cut the reply down to the fenced block, or to the text from
+    ``assistant_reasons`` / the first ``{`` onwards, dropping any preamble.
+``indentation``
+    Re-indent list items and fields to the layout of the prompt example.
+``quotes``
+    Escape stray double quotes and quote plain values containing ``: ``.
+``truncated_tail``
+    Drop trailing lines of a cut-off reply (or close an unterminated JSON
+    object) until the remainder parses.
+``criterion_salvage``
+    Parse each ``- criterion:`` block on its own and keep the ones that work.
+
+The text fixes are cumulative. A result only counts when every expected
+criterion has a band, so a repair never silently gives a student band 1 for
+a criterion the model did assess. Only when all of them fail should the caller
+send :func:`build_fix_prompt`, which contains the broken reply but not the
+student's text.
+"""
+
+import json
+import logging
+import re
+
+import yaml
+
+from rubric_engine import normalize_criterion_key
+from structured_output import load_yaml, parse_grading_json, validate_grading_data
+
+FIX_PROMPT = (
+    "The following grading output is meant to be YAML (or JSON) with a top-level "
+    "`assistant_reasons` list; each item has criterion, thinking_process, evidence, "
+    "band (1-5), rationale and improvements. It does not parse. Correct the syntax "
+    "only: do not change any wording, band or criterion. Return only the corrected "
+    "output.\n\nBROKEN OUTPUT\n"
+)
+
+_ITEM_KEYS = ("criterion", "thinking_process", "evidence", "band", "rationale", "improvements")
+_ITEM_KEY_RE = re.compile(r"^(-\s*)?(%s)\s*:(.*)$" % "|".join(_ITEM_KEYS))
+_FENCE_RE = re.compile(r"```(?:ya?ml|json)?\s*\n(.*?)(?:```|\Z)", re.DOTALL | re.IGNORECASE)
+_BLOCK_SPLIT_RE = re.compile(r"^\s*-\s*criterion\s*:", re.MULTILINE)
+_MAX_TAIL_LINES = 40
+
+
+def _parse(text):
+    """Parse ``text`` as a grading reply (JSON or YAML), or return ``None``."""
+    parsed = parse_grading_json(text)
+    if parsed is not None:
+        return parsed
+    try:
+        return validate_grading_data(load_yaml(text))
+    except yaml.YAMLError:
+        return None
+    except Exception:
+        return None
+
+
+def _is_complete(parsed, rubric):
+    """Return ``True`` if ``parsed`` has a band for every criterion of ``rubric``."""
+    if parsed is None or not parsed.get("assistant_reasons"):
+        return False
+    if rubric is None:
+        return True
+    found = {
+        rubric.key_lookup.get(normalize_criterion_key(item["criterion"]))
+        for item in parsed["assistant_reasons"]
+    }
+    return set(rubric.criteria) <= found
+
+
+def strip_fences(text):
+    """Return the grading payload without code fences or chatty preamble."""
+    match = _FENCE_RE.search(text)
+    if match:
+        text = match.group(1)
+    start = text.find("assistant_reasons")
+    brace = text.find("{")
+    if brace != -1 and (start == -1 or brace < start):
+        try:
+            _, end = json.JSONDecoder().raw_decode(text, brace)
+        except ValueError:
+            return text[brace:].strip()  # malformed or cut off; later steps handle it
+        return text[brace:end]
+    if start != -1:
+        line_start = text.rfind("\n", 0, start) + 1
+        return text[line_start:].strip("\n")
+    return text.strip()
+
+
+def fix_indentation(text):
+    """Re-indent YAML items to the layout used in the prompt example."""
+    if text.lstrip().startswith("{"):
+        return text
+    lines = []
+    in_improvements = False
+    for raw in text.replace("\t", "    ").splitlines():
+        line = raw.strip()
+        if not line:
+            continue
+        match = _ITEM_KEY_RE.match(line)
+        if line.startswith("assistant_reasons"):
+            lines.append("assistant_reasons:")
+        elif match and match.group(2) == "criterion":
+            lines.append(f"  - criterion:{match.group(3)}")
+            in_improvements = False
+        elif match:
+            lines.append(f"    {match.group(2)}:{match.group(3)}")
+            in_improvements = match.group(2) == "improvements"
+        elif in_improvements and line.startswith("-"):
+            lines.append(f"      {line}")
+        else:
+            # Continuation of a block scalar or a wrapped value.
+            lines.append(f"      {line}")
+    return "\n".join(lines)
+
+
+def _quote_value(value):
+    return '"' + value.replace("\\", "\\\\").replace('"', '\\"') + '"'
+
+
+def fix_quotes(text):
+    """Escape stray double quotes and quote plain values that contain ``: ``."""
+    if text.lstrip().startswith("{"):
+        return text
+    fixed = []
+    for line in text.splitlines():
+        indent = line[: len(line) - len(line.lstrip())]
+        match = _ITEM_KEY_RE.match(line.strip())
+        if match and match.group(2) not in ("band", "improvements"):
+            value = match.group(3).strip()
+            if value and value[0] not in "|>":
+                if len(value) >= 2 and value[0] == value[-1] and value[0] in "\"'":
+                    value = value[1:-1]
+                line = f"{indent}{match.group(1) or ''}{match.group(2)}: {_quote_value(value)}"
+        elif line.strip().startswith("- ") and not match:
+            value = line.strip()[2:].strip()
+            if len(value) >= 2 and value[0] == value[-1] == '"':
+                value = value[1:-1]
+            line = f"{indent}- {_quote_value(value)}"
+        fixed.append(line)
+    return "\n".join(fixed)
+
+
+def recover_truncated_tail(text, rubric=None):
+    """Return the longest parseable prefix of a reply that was cut off."""
+    if text.lstrip().startswith("{"):
+        for closing in ('"}]}', '"]}]}', "}]}", "]}]}", "]}", "}"):
+            parsed = _parse(text.rstrip().rstrip(",") + closing)
+            if _is_complete(parsed, rubric):
+                return parsed
+        return None
+    lines = text.splitlines()
+    for cut in range(1, min(_MAX_TAIL_LINES, len(lines) - 1) + 1):
+        parsed = _parse("\n".join(lines[:-cut]))
+        if parsed is not None:
+            return parsed if _is_complete(parsed, rubric) else None
+    return None
+
+
+def _salvage_fields(block):
+    """Rebuild one criterion item from the fields that parse on their own."""
+    item = {}
+    for line in block.splitlines():
+        match = _ITEM_KEY_RE.match(line.strip())
+        if not match or match.group(2) in item:
+            continue
+        try:
+            value = load_yaml(f"{match.group(2)}: {match.group(3).strip()}")[match.group(2)]
+        except Exception:
+            continue
+        if value is not None:
+            item[match.group(2)] = value
+    return validate_grading_data({"assistant_reasons": [item]})
+
+
+def salvage_criterion_blocks(text):
+    """Parse each ``- criterion:`` block independently and keep the good ones.
+
+    A block that still fails keeps whichever single-line fields parse, as long
+    as its criterion and band survive.
+    """
+    starts = [m.start() for m in _BLOCK_SPLIT_RE.finditer(text)]
+    reasons = {}
+    for i, start in enumerate(starts):
+        block = text[start : starts[i + 1] if i + 1 < len(starts) else len(text)]
+        parsed = _parse(fix_quotes(fix_indentation("assistant_reasons:\n" + block)))
+        if parsed is None:
+            parsed = _salvage_fields(block)
+        for item in (parsed or {}).get("assistant_reasons", []):
+            reasons.setdefault(item["criterion"], item)
+    return {"assistant_reasons": list(reasons.values())} if reasons else None
+
+
+def repair_grading_response(response_text, rubric=None):
+    """Try each local repair in turn.
+
+    ``rubric`` is a :class:`rubric_engine.CompiledRubric`; when given, only a
+    result with a band for each of its criteria is accepted. Returns
+    ``(parsed_data, strategy_name)``, or ``(None, None)`` if nothing worked.
+    """
+    if not response_text:
+        return None, None
+    text = response_text
+    for name, fix in (
+        ("strip_fences", strip_fences),
+        ("indentation", fix_indentation),
+        ("quotes", fix_quotes),
+    ):
+        try:
+            text = fix(text)
+        except Exception as e:
+            logging.warning(f"Response repair step '{name}' failed: {e}")
+            continue
+        parsed = _parse(text)
+        if _is_complete(parsed, rubric):
+            return parsed, name
+
+    for name, fix in (
+        ("truncated_tail", lambda t: recover_truncated_tail(t, rubric)),
+        ("criterion_salvage", salvage_criterion_blocks),
+    ):
+        try:
+            parsed = fix(text)
+        except Exception as e:
+            logging.warning(f"Response repair step '{name}' failed: {e}")
+            continue
+        if _is_complete(parsed, rubric):
+            return parsed, name
+    return None, None
+
+
+def build_fix_prompt(response_text):
+    """Return a small prompt asking the model to fix the syntax of its own reply."""
+    return FIX_PROMPT + response_text
@@ -0,0 +1,122 @@
+"""Per-submission store of parsed grading results.
+
+Every graded submission gets a JSON record in ``<output folder>/results/``
+holding the raw and parsed model output, the review text, the word count and
+the final grade. ``python grader.py rescore`` and ``python grader.py rerender``
+rebuild grades and reports from these records alone, so iterating on
+``rubric.yml`` or the report layout costs no API calls.
+"""
+
+import copy
+import json
+import logging
+import os
+import threading
+import time
+from pathlib import Path
+
+RESULTS_SUBFOLDER = "results"
+RESULT_FORMAT_VERSION = 1
+
+
+def results_folder(output_folder):
+    """Return the folder holding stored results for ``output_folder``."""
+    return Path(output_folder) / RESULTS_SUBFOLDER
+
+
+def result_path(output_folder, student_identifier):
+    """Return the stored-result path for one submission."""
+    return results_folder(output_folder) / f"{student_identifier}.json"
+
+
+def save_result(
+    output_folder,
+    student_identifier,
+    *,
+    source_path,
+    model_response,
+    parsed_response,
+    word_count,
+    doc_author=None,
+    review_text=None,
+    final_grade=None,
+    model_name=None,
+    repair_strategy=None,
+    review_status=None,
+    stage_models=None,
+    escalation=None,
+):
+    """Persist one submission's grading result.
+
+    ``parsed_response`` is the model output as parsed, before rubric rules
+    were applied; it is copied so later mutation by the caller is not saved.
+    ``repair_strategy`` names the ``response_repair`` step (or
+    ``"fix_request"``) that made an unparseable reply usable, and
+    ``review_status`` records whether the review call ran and why.
+    ``model_name`` is the model that produced the grade and ``stage_models``
+    maps each stage (grade, review, repair) to the model that served it.
+    ``escalation`` lists why a cascade-graded submission went to the stronger
+    model (empty when the first-tier grade was kept).
+    """
+    record = {
+        "format_version": RESULT_FORMAT_VERSION,
+        "student_identifier": student_identifier,
+        "source_path": str(source_path),
+        "doc_author": doc_author,
+        "word_count": word_count,
+        "model_name": model_name,
+        "stage_models": dict(stage_models or {}),
+        "escalation": escalation,
+        "repair_strategy": repair_strategy,
+        "model_response": model_response,
+        "parsed_response": copy.deepcopy(parsed_response),
+        "review_text": review_text,
+        "review_status": review_status,
+        "final_grade": final_grade,
+        "saved_at": time.time(),
+    }
+    path = result_path(output_folder, student_identifier)
+    try:
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = path.with_suffix(f".{threading.get_ident()}.tmp")
+        tmp_path.write_text(json.dumps(record, indent=2, default=str), encoding="utf-8")
+        os.replace(tmp_path, path)
+        logging.info(f"Grading result saved to: {path}")
+    except Exception as e:
+        logging.error(f"Failed to save grading result for {student_identifier}: {e}")
+    return record
+
+
+def load_result(path):
+    """Load a stored result, returning ``None`` if it is unreadable."""
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            record = json.load(f)
+    except Exception as e:
+        logging.warning(f"Could not read stored result {path}: {e}")
+        return None
+    if not isinstance(record, dict) or not isinstance(record.get("parsed_response"), dict):
+        logging.warning(f"Stored result {path} has an unexpected structure.")
+        return None
+    return record
+
+
+def iter_results(output_folder):
+    """Yield every readable stored result, ordered by student identifier."""
+    folder = results_folder(output_folder)
+    if not folder.exists():
+        return
+    for path in sorted(folder.glob("*.json")):
+        record = load_result(path)
+        if record is not None:
+            yield record
+
+
+def update_final_grade(output_folder, record, final_grade):
+    """Rewrite a stored record with a recomputed ``final_grade``."""
+    record = dict(record, final_grade=final_grade, rescored_at=time.time())
+    path = result_path(output_folder, record["student_identifier"])
+    tmp_path = path.with_suffix(f".{threading.get_ident()}.tmp")
+    tmp_path.write_text(json.dumps(record, indent=2, default=str), encoding="utf-8")
+    os.replace(tmp_path, path)
+    return record
@@ -0,0 +1,115 @@
+"""Decide which graded submissions get the moderation review call.
+
+Reviewing every submission doubles the API calls for a cohort, and most
+reviews come back with "No issues found." :func:`review_triggers` returns the
+reasons a submission should be reviewed; an empty list means the review is
+skipped. The triggers are:
+
+``boundary``
+    A criterion's band sits next to a threshold in a ``rubric.yml`` rule
+    (e.g. ``diagnostic_primary`` at 2 or 3 for ``diagnostic_primary_band < 3``),
+    or in a band listed under ``review_policy.boundary_bands``.
+``rule``
+    A ``rubric.yml`` rule fired and changed the grade.
+``low_confidence``
+    The model reported a ``confidence`` below ``min_confidence`` for a
+    criterion.
+``audit``
+    A deterministic sample of ``audit_rate`` of all submissions, so a quality
+    signal remains for the rest.
+
+The policy is read from the optional ``review_policy`` section of
+``rubric.yml``; ``gate_reviews: false`` reviews every submission.
+"""
+
+import hashlib
+
+from rubric_engine import compile_rubric
+
+DEFAULT_REVIEW_POLICY = {
+    "gate_reviews": True,
+    "review_on_boundary": True,
+    "review_on_rule": True,
+    "min_confidence": 0.6,
+    "audit_rate": 0.1,
+    "boundary_bands": {},
+}
+
+
+def load_review_policy(rubric_config):
+    """Return the review policy from ``rubric_config`` merged over the defaults."""
+    policy = dict(DEFAULT_REVIEW_POLICY)
+    policy.update(rubric_config.get("review_policy") or {})
+    return policy
+
+
+def audit_sampled(audit_key, rate):
+    """Return ``True`` for a stable ``rate`` fraction of ``audit_key`` values."""
+    if rate <= 0:
+        return False
+    digest = hashlib.sha256(str(audit_key).encode("utf-8")).digest()
+    return int.from_bytes(digest[:8], "big") / 2**64 < rate
+
+
+def parsed_bands(parsed_data):
+    """Return ``{criterion: band}`` as the model reported it in ``parsed_data``."""
+    reasons = parsed_data.get("assistant_reasons") or []
+    return {
+        item.get("criterion"): int(item.get("band", 1))
+        for item in reasons
+        if isinstance(item, dict) and item.get("criterion")
+    }
+
+
+def boundary_hits(bands, rubric, extra_boundaries=None):
+    """Return ``boundary:<criterion>=<band>`` for resolved ``bands`` next to a threshold.
+
+    Thresholds come from the rubric rules plus ``extra_boundaries``
+    (``{criterion: [band, ...]}``).
+    """
+    boundaries = {cid: set(b) for cid, b in rubric.boundary_bands.items()}
+    for cid, extra in (extra_boundaries or {}).items():
+        boundaries.setdefault(cid, set()).update(int(b) for b in extra)
+    return [
+        f"boundary:{cid}={bands[cid]}"
+        for cid in rubric.criteria
+        if bands[cid] in boundaries.get(cid, ())
+    ]
+
+
+def review_triggers(parsed_data, word_count, rubric_config, audit_key):
+    """Return the reasons to review a grade (empty if the review can be skipped).
+
+    ``parsed_data`` is the parsed model reply; ``audit_key`` identifies the
+    submission for audit sampling (e.g. its content hash), so re-runs sample
+    the same submissions.
+    """
+    policy = load_review_policy(rubric_config)
+    if not policy["gate_reviews"]:
+        return ["always"]
+
+    rubric = compile_rubric(rubric_config)
+    reasons = parsed_data.get("assistant_reasons") or []
+    raw_bands = parsed_bands(parsed_data)
+    bands = rubric.resolve_bands(raw_bands)
+    triggers = []
+
+    if policy["review_on_boundary"]:
+        triggers.extend(boundary_hits(bands, rubric, policy.get("boundary_bands")))
+
+    if policy["review_on_rule"]:
+        triggers.extend(f"rule:{name}" for name in rubric.fired_rules(raw_bands, word_count))
+
+    min_confidence = policy.get("min_confidence")
+    if min_confidence is not None:
+        for item in reasons:
+            try:
+                confidence = float(item.get("confidence"))
+            except (AttributeError, TypeError, ValueError):
+                continue
+            if confidence < float(min_confidence):
+                triggers.append(f"low_confidence:{item.get('criterion')}")
+
+    if audit_sampled(audit_key, float(policy.get("audit_rate") or 0)):
+        triggers.append("audit")
+    return triggers
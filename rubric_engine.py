@@ -0,0 +1,364 @@
+"""Compiled rubric rules for ``calculate_final_grade``.
+
+``rubric.yml`` rules are validated and compiled once into a
+:class:`CompiledRubric`. Conditions are parsed into an AST and only
+comparisons, boolean logic, numeric literals and the ``<criterion>_band`` /
+``word_count`` variables are accepted, so a typo or an unsafe expression
+raises :class:`RubricError` when the rubric is loaded rather than logging a
+warning half-way through a batch. Criterion-key normalisation is precomputed
+into a lookup table, leaving scoring as a handful of dictionary lookups.
+
+:meth:`CompiledRubric.score_cohort` applies the same rules to a whole class
+at once as NumPy array operations over a students x criteria band matrix.
+"""
+
+import ast
+import logging
+import re
+import threading
+
+RULE_ACTIONS = ("set_band", "cap_points")
+
+_ALLOWED_NODES = (
+    ast.Expression,
+    ast.BoolOp,
+    ast.And,
+    ast.Or,
+    ast.UnaryOp,
+    ast.Not,
+    ast.USub,
+    ast.Compare,
+    ast.Lt,
+    ast.LtE,
+    ast.Gt,
+    ast.GtE,
+    ast.Eq,
+    ast.NotEq,
+    ast.Name,
+    ast.Load,
+    ast.Constant,
+)
+
+
+class RubricError(ValueError):
+    """Raised when ``rubric.yml`` contains an invalid criterion or rule."""
+
+
+class _VectorizeCondition(ast.NodeTransformer):
+    """Rewrite ``and``/``or``/``not`` and chained comparisons for NumPy arrays."""
+
+    def visit_BoolOp(self, node):
+        self.generic_visit(node)
+        func = "_and" if isinstance(node.op, ast.And) else "_or"
+        return ast.Call(func=ast.Name(id=func, ctx=ast.Load()), args=node.values, keywords=[])
+
+    def visit_UnaryOp(self, node):
+        self.generic_visit(node)
+        if isinstance(node.op, ast.Not):
+            return ast.Call(func=ast.Name(id="_not", ctx=ast.Load()), args=[node.operand], keywords=[])
+        return node
+
+    def visit_Compare(self, node):
+        self.generic_visit(node)
+        if len(node.ops) == 1:
+            return node
+        operands = [node.left, *node.comparators]
+        pairs = [
+            ast.Compare(left=operands[i], ops=[op], comparators=[operands[i + 1]])
+            for i, op in enumerate(node.ops)
+        ]
+        return ast.Call(func=ast.Name(id="_and", ctx=ast.Load()), args=pairs, keywords=[])
+
+
+def normalize_criterion_key(key):
+    """Normalize keys for robust matching."""
+    return re.sub(r"\s+", "", str(key)).lower()
+
+
+def compile_condition(condition, allowed_names, rule_name="rule"):
+    """Validate ``condition`` against the whitelist and return a code object."""
+    try:
+        tree = ast.parse(str(condition), mode="eval")
+    except SyntaxError as e:
+        raise RubricError(f"Rule '{rule_name}' has invalid syntax: {condition!r} ({e.msg})") from e
+    for node in ast.walk(tree):
+        if not isinstance(node, _ALLOWED_NODES):
+            raise RubricError(
+                f"Rule '{rule_name}' uses unsupported syntax '{type(node).__name__}': {condition!r}"
+            )
+        if isinstance(node, ast.Name) and node.id not in allowed_names:
+            raise RubricError(f"Rule '{rule_name}' refers to unknown variable '{node.id}'")
+        if isinstance(node, ast.Constant) and (
+            isinstance(node.value, bool) or not isinstance(node.value, (int, float))
+        ):
+            raise RubricError(f"Rule '{rule_name}' may only compare numbers: {condition!r}")
+    return compile(tree, f"<rubric rule {rule_name}>", "eval")
+
+
+def condition_boundary_bands(condition):
+    """Return ``{criterion: {bands}}`` on either side of each band threshold.
+
+    ``diagnostic_primary_band < 3`` gives ``{"diagnostic_primary": {2, 3}}``:
+    the bands where a one-band change flips the rule.
+    """
+    boundaries = {}
+    for node in ast.walk(ast.parse(str(condition), mode="eval")):
+        if not isinstance(node, ast.Compare):
+            continue
+        operands = [node.left, *node.comparators]
+        for i, op in enumerate(node.ops):
+            left, right = operands[i], operands[i + 1]
+            if isinstance(right, ast.Name) and isinstance(left, ast.Constant):
+                # ``3 > x`` is ``x < 3``
+                left, right = right, left
+                op = {ast.Lt: ast.Gt(), ast.LtE: ast.GtE(), ast.Gt: ast.Lt(), ast.GtE: ast.LtE()}.get(
+                    type(op), op
+                )
+            if not (
+                isinstance(left, ast.Name)
+                and left.id.endswith("_band")
+                and isinstance(right, ast.Constant)
+            ):
+                continue
+            value = int(right.value)
+            if isinstance(op, (ast.Lt, ast.GtE)):
+                bands = {value - 1, value}
+            elif isinstance(op, (ast.LtE, ast.Gt)):
+                bands = {value, value + 1}
+            else:
+                bands = {value - 1, value, value + 1}
+            boundaries.setdefault(left.id[: -len("_band")], set()).update(bands)
+    return boundaries
+
+
+def _vectorized_condition(code_source, rule_name):
+    """Compile a validated condition so it evaluates element-wise on arrays."""
+    tree = _VectorizeCondition().visit(ast.parse(code_source, mode="eval"))
+    ast.fix_missing_locations(tree)
+    return compile(tree, f"<rubric rule {rule_name} (vectorized)>", "eval")
+
+
+def _vector_helpers():
+    import numpy as np
+
+    return {
+        "__builtins__": {},
+        "_and": lambda *values: np.logical_and.reduce(values),
+        "_or": lambda *values: np.logical_or.reduce(values),
+        "_not": np.logical_not,
+    }
+
+
+class CompiledRubric:
+    """A validated rubric whose rules and key lookups are precomputed."""
+
+    def __init__(self, rubric_config):
+        criteria_cfg = rubric_config.get("criteria") or {}
+        if not isinstance(criteria_cfg, dict) or not criteria_cfg:
+            raise RubricError("Rubric must define at least one criterion.")
+
+        self.criteria = list(criteria_cfg)
+        self.max_points = {}
+        self.key_lookup = {}
+        for cid, cfg in criteria_cfg.items():
+            cfg = cfg or {}
+            if "max_points" in cfg:
+                try:
+                    self.max_points[cid] = int(cfg["max_points"])
+                except (TypeError, ValueError) as e:
+                    raise RubricError(f"Criterion '{cid}' has a non-numeric max_points.") from e
+            # Criterion names are aliases; an ID always wins over a name.
+            self.key_lookup.setdefault(normalize_criterion_key(cfg.get("name", "")), cid)
+        for cid in self.criteria:
+            self.key_lookup[normalize_criterion_key(cid)] = cid
+        self.key_lookup.pop("", None)
+
+        allowed_names = {f"{cid}_band" for cid in self.criteria} | {"word_count"}
+        self.rules = []
+        self._vector_rules = []
+        self.boundary_bands = {}
+        for index, rule in enumerate(rubric_config.get("rules") or [], start=1):
+            name = rule.get("name") or f"rule {index}"
+            action = rule.get("action")
+            if action not in RULE_ACTIONS:
+                raise RubricError(f"Rule '{name}' has unknown action {action!r}.")
+            target = rule.get("target")
+            if target not in criteria_cfg:
+                raise RubricError(f"Rule '{name}' targets unknown criterion {target!r}.")
+            value_key = "band" if action == "set_band" else "points"
+            try:
+                value = int(rule[value_key])
+            except (KeyError, TypeError, ValueError) as e:
+                raise RubricError(f"Rule '{name}' needs a numeric '{value_key}'.") from e
+            condition = str(rule.get("condition", ""))
+            code = compile_condition(condition, allowed_names, name)
+            self.rules.append((name, code, action, target, value))
+            for cid, bands in condition_boundary_bands(condition).items():
+                self.boundary_bands.setdefault(cid, set()).update(bands)
+            self._vector_rules.append(
+                (name, _vectorized_condition(condition, name), action, target, value)
+            )
+
+        self.grade_thresholds = self._parse_grade_bands(rubric_config)
+
+    @staticmethod
+    def _parse_grade_bands(rubric_config):
+        """Return ``[(min_points, letter), ...]`` from highest to lowest."""
+        total_possible = rubric_config.get("total_points_possible") or 0
+        thresholds = []
+        for key, value in (rubric_config.get("grade_bands") or {}).items():
+            letter = key[: -len("_ratio")] if key.endswith("_ratio") else key
+            try:
+                threshold = float(value) * total_possible if key.endswith("_ratio") else float(value)
+            except (TypeError, ValueError) as e:
+                raise RubricError(f"Grade band '{key}' must be numeric.") from e
+            thresholds.append((threshold, letter))
+        return sorted(thresholds, reverse=True)
+
+    def grade_letter(self, total_points):
+        """Map a total onto the ``grade_bands`` letters (lowest letter as the floor)."""
+        for threshold, letter in self.grade_thresholds:
+            if total_points >= threshold:
+                return letter
+        return self.grade_thresholds[-1][1] if self.grade_thresholds else None
+
+    def resolve_bands(self, bands_data):
+        """Map model-supplied criterion keys onto rubric IDs (missing bands are 1)."""
+        bands = dict.fromkeys(self.criteria, 1)
+        resolved = set()
+        for key, band in bands_data.items():
+            cid = self.key_lookup.get(normalize_criterion_key(key))
+            # Exact criterion IDs take precedence over name or case variants.
+            if cid is not None and (cid not in resolved or key == cid):
+                bands[cid] = int(band)
+                resolved.add(cid)
+        return bands
+
+    def _apply_rules(self, bands, word_count):
+        """Apply the rules to resolved ``bands`` in place; return the fired rule names."""
+        fired_names = []
+        variables = {f"{cid}_band": band for cid, band in bands.items()}
+        variables["word_count"] = word_count
+        for name, code, action, target, value in self.rules:
+            try:
+                fired = eval(code, {"__builtins__": {}}, variables)
+            except Exception as e:
+                logging.warning(f"Failed to evaluate rule '{name}': {e}")
+                continue
+            if fired:
+                fired_names.append(name)
+                if action == "set_band":
+                    bands[target] = value
+                else:
+                    bands[target] = min(bands[target], value)
+                # Later rules see the changed band.
+                variables[f"{target}_band"] = bands[target]
+        return fired_names
+
+    def fired_rules(self, bands_data, word_count):
+        """Return the names of the rules that fire for one student's bands."""
+        return self._apply_rules(self.resolve_bands(bands_data), word_count)
+
+    def score(self, bands_data, word_count):
+        """Apply the rules and ``max_points`` clamps to one student's bands."""
+        bands = self.resolve_bands(bands_data)
+        self._apply_rules(bands, word_count)
+
+        breakdown = {}
+        total_points = 0
+        for cid in self.criteria:
+            band = int(bands[cid])
+            points = min(band, self.max_points.get(cid, band))
+            breakdown[cid] = {"band": band, "points": points}
+            total_points += points
+        return {"total_points": total_points, "breakdown": breakdown}
+
+
+    def score_cohort(self, band_matrix, word_counts):
+        """Score a whole cohort at once.
+
+        ``band_matrix`` is either a ``students x criteria`` array in
+        ``self.criteria`` order or a DataFrame whose columns are criterion IDs
+        (missing columns and NaN bands count as band 1). ``word_counts`` is a
+        matching vector; rules that read ``word_count`` do not fire for rows whose
+        word count is NaN, like :meth:`score` skipping them for ``None``.
+        Returns a DataFrame with ``<criterion>_band``, ``<criterion>_pts``,
+        ``total_points`` and ``grade`` columns.
+        """
+        import numpy as np
+        import pandas as pd
+
+        index = None
+        if isinstance(band_matrix, pd.DataFrame):
+            index = band_matrix.index
+            band_matrix = band_matrix.reindex(columns=self.criteria).to_numpy(dtype=float)
+        bands = np.asarray(band_matrix, dtype=float).reshape(-1, len(self.criteria))
+        bands = np.where(np.isnan(bands), 1, bands).astype(np.int64)
+        word_counts = np.asarray(word_counts, dtype=float).reshape(-1)
+        if word_counts.shape[0] != bands.shape[0]:
+            raise ValueError("word_counts must have one entry per student.")
+
+        columns = {cid: j for j, cid in enumerate(self.criteria)}
+        helpers = _vector_helpers()
+        word_count_known = ~np.isnan(word_counts)
+        for name, code, action, target, value in self._vector_rules:
+            variables = {f"{cid}_band": bands[:, j] for cid, j in columns.items()}
+            variables["word_count"] = word_counts
+            with np.errstate(invalid="ignore"):
+                fired = eval(code, helpers, variables)
+            fired = np.broadcast_to(np.asarray(fired, dtype=bool), (bands.shape[0],))
+            if "word_count" in code.co_names:
+                fired = fired & word_count_known
+            col = columns[target]
+            if action == "set_band":
+                bands[fired, col] = value
+            else:
+                bands[fired, col] = np.minimum(bands[fired, col], value)
+
+        caps = np.array([self.max_points.get(cid, np.iinfo(np.int64).max) for cid in self.criteria])
+        points = np.minimum(bands, caps)
+        totals = points.sum(axis=1)
+
+        result = pd.DataFrame(index=index if index is not None else pd.RangeIndex(bands.shape[0]))
+        for cid, j in columns.items():
+            result[f"{cid}_band"] = bands[:, j]
+            result[f"{cid}_pts"] = points[:, j]
+        result["total_points"] = totals
+        result["grade"] = self.grade_letters(totals)
+        return result
+
+    def grade_letters(self, totals):
+        """Vectorised :meth:`grade_letter` over an array of totals."""
+        import numpy as np
+
+        totals = np.asarray(totals, dtype=float)
+        if not self.grade_thresholds:
+            return np.full(totals.shape, None, dtype=object)
+        letters = np.full(totals.shape, self.grade_thresholds[-1][1], dtype=object)
+        for threshold, letter in reversed(self.grade_thresholds):
+            letters[totals >= threshold] = letter
+        return letters
+
+
+_compiled_lock = threading.Lock()
+_compiled = {}
+
+
+def compile_rubric(rubric_config):
+    """Return the :class:`CompiledRubric` for ``rubric_config``.
+
+    The result is memoised per config object, so repeated scoring against the
+    same loaded rubric does not recompile it. Recompile after mutating a
+    config in place by passing a fresh copy.
+    """
+    with _compiled_lock:
+        cached = _compiled.get(id(rubric_config))
+        if cached is not None and cached[0] is rubric_config:
+            return cached[1]
+    compiled = CompiledRubric(rubric_config)
+    with _compiled_lock:
+        if len(_compiled) >= 32:
+            _compiled.clear()
+        # Holding a reference to the config keeps its id from being reused.
+        _compiled[id(rubric_config)] = (rubric_config, compiled)
+    return compiled
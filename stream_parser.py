@@ -0,0 +1,193 @@
+"""Incremental parsing of streamed grading replies.
+
+:class:`IncrementalGradeParser` is fed the text chunks of a streamed
+``generate_content(stream=True)`` reply and parses each ``assistant_reasons``
+entry as soon as it is complete, for both schema-constrained JSON and the YAML
+format of the prompt example. Completed entries are passed to an
+``on_criterion`` callback so callers can show results while the rest of the
+reply is still being generated.
+
+When the reply goes off the rails the parser raises :class:`StreamAborted`
+from ``feed``, which stops the stream so no more output tokens are paid for.
+It aborts when no ``assistant_reasons`` list has started after
+``MAX_PREAMBLE_CHARS``, when an entry names an unknown or repeated criterion,
+when there are more entries than rubric criteria, or when the reply grows past
+``MAX_STREAM_CHARS``. A single malformed entry does not abort the stream; the
+complete reply still goes through the normal parse and repair path.
+"""
+
+import json
+import logging
+import re
+
+import yaml
+
+from rubric_engine import normalize_criterion_key
+from structured_output import load_yaml, validate_grading_data
+
+MAX_PREAMBLE_CHARS = 2000
+MAX_STREAM_CHARS = 80_000
+
+_JSON_LIST_RE = re.compile(r'"assistant_reasons"\s*:\s*\[')
+_YAML_LIST_RE = re.compile(r"^\s*assistant_reasons\s*:", re.MULTILINE)
+_YAML_ITEM_RE = re.compile(r"^\s*-\s*criterion\s*:", re.MULTILINE)
+
+
+class StreamAborted(RuntimeError):
+    """Raised to stop a streamed reply early; ``partial_text`` is what arrived."""
+
+    def __init__(self, reason, partial_text=""):
+        super().__init__(reason)
+        self.reason = reason
+        self.partial_text = partial_text
+
+
+class IncrementalGradeParser:
+    """Parse ``assistant_reasons`` entries from a reply as it streams in.
+
+    ``rubric`` is an optional :class:`rubric_engine.CompiledRubric` used to
+    check criteria; ``on_criterion(item)`` is called once per parsed entry.
+    """
+
+    def __init__(self, rubric=None, on_criterion=None, max_chars=MAX_STREAM_CHARS):
+        self.rubric = rubric
+        self.on_criterion = on_criterion
+        self.max_chars = max_chars
+        self.text = ""
+        self.items = []
+        self._seen = set()
+        self._mode = None
+        # JSON scanner state
+        self._pos = 0
+        self._depth = 0
+        self._in_string = False
+        self._escaped = False
+        self._item_start = None
+        self._list_closed = False
+        # YAML scanner state
+        self._block_start = None
+
+    def feed(self, chunk):
+        """Consume ``chunk`` and return the entries it completed."""
+        self.text += chunk
+        if len(self.text) > self.max_chars:
+            self._abort(f"reply exceeded {self.max_chars} characters")
+        if self._mode is None:
+            self._detect_mode()
+        if self._mode == "json":
+            return self._scan_json()
+        if self._mode == "yaml":
+            return self._scan_yaml(final=False)
+        return []
+
+    def finish(self, full_text=None):
+        """Flush the last entry once the reply is complete.
+
+        ``full_text`` is the whole reply; any part of it not yet fed (e.g. a
+        non-streaming fallback) is fed first.
+        """
+        new_items = []
+        if full_text and full_text.startswith(self.text) and len(full_text) > len(self.text):
+            new_items.extend(self.feed(full_text[len(self.text) :]))
+        if self._mode == "yaml":
+            new_items.extend(self._scan_yaml(final=True))
+        return new_items
+
+    def _abort(self, reason):
+        logging.warning(f"Aborting streamed grading reply: {reason}.")
+        raise StreamAborted(reason, self.text)
+
+    def _detect_mode(self):
+        json_match = _JSON_LIST_RE.search(self.text)
+        yaml_match = _YAML_LIST_RE.search(self.text)
+        if json_match and (not yaml_match or json_match.start() < yaml_match.start()):
+            self._mode = "json"
+            self._pos = json_match.end()
+        elif yaml_match:
+            self._mode = "yaml"
+            self._pos = yaml_match.end()
+        elif len(self.text) > MAX_PREAMBLE_CHARS:
+            self._abort(f"no assistant_reasons list within {MAX_PREAMBLE_CHARS} characters")
+
+    def _accept(self, item):
+        """Validate one parsed entry and hand it to the callback."""
+        data = validate_grading_data({"assistant_reasons": [item]})
+        if data is None:
+            logging.warning("Streamed grading entry is malformed; leaving it to the final parse.")
+            return []
+        item = data["assistant_reasons"][0]
+        key = normalize_criterion_key(item["criterion"])
+        if self.rubric is not None:
+            cid = self.rubric.key_lookup.get(key)
+            if cid is None:
+                self._abort(f"unknown criterion {item['criterion']!r}")
+            key = cid
+        if key in self._seen:
+            self._abort(f"criterion {item['criterion']!r} graded twice")
+        self._seen.add(key)
+        if self.rubric is not None and len(self._seen) > len(self.rubric.criteria):
+            self._abort("more entries than rubric criteria")
+        self.items.append(item)
+        if self.on_criterion is not None:
+            self.on_criterion(item)
+        return [item]
+
+    def _scan_json(self):
+        completed = []
+        text = self.text
+        while self._pos < len(text) and not self._list_closed:
+            ch = text[self._pos]
+            if self._in_string:
+                if self._escaped:
+                    self._escaped = False
+                elif ch == "\\":
+                    self._escaped = True
+                elif ch == '"':
+                    self._in_string = False
+            elif ch == '"':
+                self._in_string = True
+            elif ch in "{[":
+                if self._depth == 0:
+                    self._item_start = self._pos
+                self._depth += 1
+            elif ch in "}]":
+                if self._depth == 0:
+                    self._list_closed = ch == "]"
+                else:
+                    self._depth -= 1
+                    if self._depth == 0 and self._item_start is not None:
+                        raw = text[self._item_start : self._pos + 1]
+                        self._item_start = None
+                        try:
+                            item = json.loads(raw)
+                        except ValueError:
+                            item = None
+                        completed.extend(self._accept(item))
+            self._pos += 1
+        return completed
+
+    def _scan_yaml(self, final):
+        completed = []
+        # Only look at whole lines so a half-streamed "- criterion:" is not missed.
+        end = len(self.text) if final else self.text.rfind("\n") + 1
+        for match in _YAML_ITEM_RE.finditer(self.text, self._pos, end):
+            if self._block_start is not None:
+                completed.extend(self._parse_yaml_block(self._block_start, match.start()))
+            self._block_start = match.start()
+        if end > self._pos:
+            self._pos = end
+        if final and self._block_start is not None:
+            block_end = self.text.find("```", self._block_start)
+            completed.extend(
+                self._parse_yaml_block(self._block_start, block_end if block_end != -1 else len(self.text))
+            )
+            self._block_start = None
+        return completed
+
+    def _parse_yaml_block(self, start, end):
+        try:
+            data = load_yaml("assistant_reasons:\n" + self.text[start:end])
+            item = data["assistant_reasons"][0]
+        except (yaml.YAMLError, TypeError, KeyError, IndexError):
+            item = None
+        return self._accept(item)
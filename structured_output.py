@@ -0,0 +1,161 @@
+"""Schema-constrained JSON output for the grade and review calls.
+
+With ``STRUCTURED_OUTPUT_ENABLED`` the grading scripts ask Gemini for
+``application/json`` constrained by a response schema built from the
+``rubric.yml`` criteria, so the reply is compact JSON that ``json.loads``
+parses directly. :func:`parse_grading_json` validates it on that fast path;
+anything that is not valid JSON of the expected shape falls through to the
+YAML parser, which uses the libyaml C loader when PyYAML was built with it.
+
+The review call gets the same treatment: band changes come back as an
+``adjustments`` list rather than ``ADJUSTMENT:`` lines scraped from prose.
+"""
+
+import json
+import logging
+
+import yaml
+
+STRUCTURED_OUTPUT_ENABLED = True
+MIN_BAND = 1
+MAX_BAND = 5
+
+# libyaml's loader is several times faster than the pure-Python one.
+YAML_LOADER = getattr(yaml, "CSafeLoader", yaml.SafeLoader)
+
+_STRING = {"type": "string"}
+_STRING_LIST = {"type": "array", "items": _STRING}
+
+
+def _criterion_enum(rubric_config):
+    return {"type": "string", "format": "enum", "enum": [str(c) for c in rubric_config["criteria"]]}
+
+
+def grading_response_schema(rubric_config):
+    """Return the response schema for a grading reply under ``rubric_config``."""
+    reason = {
+        "type": "object",
+        "properties": {
+            "criterion": _criterion_enum(rubric_config),
+            "thinking_process": _STRING,
+            "evidence": _STRING,
+            "band": {"type": "integer"},
+            "rationale": _STRING,
+            "improvements": _STRING_LIST,
+            "confidence": {
+                "type": "number",
+                "description": "How certain you are of this band, from 0 to 1.",
+            },
+        },
+        "required": ["criterion", "band", "rationale"],
+    }
+    return {
+        "type": "object",
+        "properties": {"assistant_reasons": {"type": "array", "items": reason}},
+        "required": ["assistant_reasons"],
+    }
+
+
+def review_response_schema(rubric_config):
+    """Return the response schema for a moderation review reply."""
+    adjustment = {
+        "type": "object",
+        "properties": {
+            "criterion": _criterion_enum(rubric_config),
+            "band": {"type": "integer"},
+            "reason": _STRING,
+        },
+        "required": ["criterion", "band"],
+    }
+    return {
+        "type": "object",
+        "properties": {
+            "issues": _STRING_LIST,
+            "adjustments": {"type": "array", "items": adjustment},
+            "recommended_total": {"type": "integer"},
+        },
+        "required": ["issues", "adjustments"],
+    }
+
+
+def json_generation_config(schema):
+    """Return a ``generation_config`` requesting JSON that matches ``schema``."""
+    return {"response_mime_type": "application/json", "response_schema": schema}
+
+
+def _strip_code_fence(text):
+    text = text.strip()
+    if text.startswith("```"):
+        text = text.split("\n", 1)[1] if "\n" in text else ""
+        if text.rstrip().endswith("```"):
+            text = text.rstrip()[:-3]
+    return text.strip()
+
+
+def _load_json_object(text):
+    """Return ``text`` parsed as a JSON object, or ``None``."""
+    if not text:
+        return None
+    text = _strip_code_fence(text)
+    if not text.startswith("{"):
+        return None
+    try:
+        data = json.loads(text)
+    except ValueError:
+        return None
+    return data if isinstance(data, dict) else None
+
+
+def _valid_band(value):
+    """Return ``value`` as a band clamped to the rubric range, or ``None``."""
+    try:
+        band = int(value)
+    except (TypeError, ValueError):
+        return None
+    if not MIN_BAND <= band <= MAX_BAND:
+        logging.warning(f"Clamping out-of-range band {band} to {MIN_BAND}-{MAX_BAND}.")
+        band = min(max(band, MIN_BAND), MAX_BAND)
+    return band
+
+
+def validate_grading_data(data):
+    """Return ``data`` if it has the grading structure, else ``None``.
+
+    Bands are coerced to integers in place.
+    """
+    reasons = data.get("assistant_reasons") if isinstance(data, dict) else None
+    if not isinstance(reasons, list):
+        return None
+    for item in reasons:
+        if not isinstance(item, dict) or not isinstance(item.get("criterion"), str):
+            return None
+        band = _valid_band(item.get("band"))
+        if band is None:
+            return None
+        item["band"] = band
+    return data
+
+
+def parse_grading_json(response_text):
+    """Fast path: parse and validate a JSON grading reply, or return ``None``."""
+    return validate_grading_data(_load_json_object(response_text))
+
+
+def load_yaml(text):
+    """``yaml.safe_load`` using the C loader when available."""
+    return yaml.load(text, Loader=YAML_LOADER)
+
+
+def parse_review_json(review_text):
+    """Return ``{criterion: band}`` from a JSON review, or ``None`` if it is not one."""
+    data = _load_json_object(review_text)
+    if data is None or not isinstance(data.get("adjustments"), list):
+        return None
+    adjustments = {}
+    for item in data["adjustments"]:
+        if not isinstance(item, dict) or not isinstance(item.get("criterion"), str):
+            continue
+        band = _valid_band(item.get("band"))
+        if band is not None:
+            adjustments[item["criterion"]] = band
+    return adjustments
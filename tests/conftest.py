@@ -0,0 +1,41 @@
+import logging
+
+import pytest
+
+import response_cache
+import text_extraction
+
+
+@pytest.fixture(autouse=True)
+def isolated_caches(monkeypatch, tmp_path):
+    """Keep the on-disk caches out of the repository during tests."""
+    monkeypatch.setattr(
+        response_cache, "_shared_cache", response_cache.ResponseCache(tmp_path / "llm_cache")
+    )
+    monkeypatch.setattr(
+        text_extraction,
+        "_shared_cache",
+        text_extraction.ExtractionCache(tmp_path / "extraction_cache"),
+    )
+
+
+@pytest.fixture(autouse=True, scope="session")
+def isolated_log_file(tmp_path_factory):
+    """Send log-file output to a temporary file instead of the repository's log.
+
+    The grading scripts attach a ``FileHandler`` when imported; with a handler
+    already on the root logger, later imports leave logging alone.
+    """
+    root = logging.getLogger()
+    formatter = None
+    for handler in list(root.handlers):
+        if isinstance(handler, logging.FileHandler):
+            formatter = handler.formatter
+            root.removeHandler(handler)
+            handler.close()
+    replacement = logging.FileHandler(tmp_path_factory.mktemp("logs") / "grading_process.log")
+    replacement.setFormatter(formatter)
+    root.addHandler(replacement)
+    yield
+    root.removeHandler(replacement)
+    replacement.close()
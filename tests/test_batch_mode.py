@@ -0,0 +1,105 @@
+import json
+
+import batch_mode
+import build_manifest
+import grader
+import result_store
+
+
+GRADE_YAML = """assistant_reasons:
+  - criterion: symptom_analysis
+    band: 4
+  - criterion: diagnostic_primary
+    band: 2
+"""
+
+
+def test_prepare_and_ingest_round_trip(monkeypatch, tmp_path):
+    input_dir = tmp_path / "in"
+    output_dir = tmp_path / "out"
+    input_dir.mkdir()
+    (input_dir / "alice.txt").write_text("the same essay " * 300)
+    (input_dir / "bob.txt").write_text("the same essay " * 300)
+    (input_dir / "cara.txt").write_text("a different essay " * 300)
+    monkeypatch.setattr(grader, "INPUT_FOLDER", input_dir)
+    monkeypatch.setattr(grader, "OUTPUT_FOLDER", output_dir)
+    monkeypatch.setattr(
+        grader, "load_master_prompt", lambda: "Rubric\n{{STUDENT_SUBMISSION_TEXT_HERE}}"
+    )
+    monkeypatch.setattr(batch_mode, "BATCH_STATE_FILE", tmp_path / "batch" / "job.json")
+    requests_path = tmp_path / "batch" / "requests.jsonl"
+    output_dir.mkdir()
+    (output_dir / grader.SUMMARY_FILE).write_text("student,total_points,review\ndan,20,reviewed\n")
+
+    assert batch_mode.prepare_batch(requests_path) == 2
+
+    lines = [json.loads(line) for line in requests_path.read_text().splitlines()]
+    parts = lines[0]["request"]["contents"][0]["parts"]
+    assert parts[0]["text"] == "Rubric"
+    manifest = json.loads(batch_mode.manifest_path_for(requests_path).read_text())
+    assert sorted(len(entry["submissions"]) for entry in manifest.values()) == [1, 2]
+
+    results_path = tmp_path / "batch" / "results.jsonl"
+    with open(results_path, "w") as f:
+        for line in lines:
+            f.write(json.dumps({
+                "key": line["key"],
+                "response": {"candidates": [{"content": {"parts": [{"text": GRADE_YAML}]}}]},
+            }) + "\n")
+
+    entries = batch_mode.ingest_batch_results(results_path, requests_path)
+
+    assert sorted(name for name, _, _ in entries) == ["alice", "bob", "cara"]
+    # criteria missing from the response default to band 1
+    assert {points for _, points, _ in entries} == {4 + 2 + 4 * 1}
+    assert len(list(output_dir.glob("*_graded.docx"))) == 3
+    # Rows for submissions outside the batch are kept.
+    assert grader.read_summary() == [("dan", "20", "reviewed")] + [
+        (name, "10", "skipped (batch)") for name in ("alice", "bob", "cara")
+    ]
+
+    # The build manifest now knows about the batch, so nothing is graded again.
+    assert batch_mode.prepare_batch(requests_path) == 0
+    (input_dir / "cara.txt").write_text("a revised essay " * 300)
+    assert batch_mode.prepare_batch(requests_path) == 1
+
+
+def test_ingest_records_the_submitted_model(monkeypatch, tmp_path):
+    input_dir = tmp_path / "in"
+    output_dir = tmp_path / "out"
+    input_dir.mkdir()
+    (input_dir / "alice.txt").write_text("an essay " * 300)
+    monkeypatch.setattr(grader, "INPUT_FOLDER", input_dir)
+    monkeypatch.setattr(grader, "OUTPUT_FOLDER", output_dir)
+    monkeypatch.setattr(grader, "load_master_prompt", lambda: "Rubric\n{{STUDENT_SUBMISSION_TEXT_HERE}}")
+    state_path = tmp_path / "batch" / "job.json"
+    monkeypatch.setattr(batch_mode, "BATCH_STATE_FILE", state_path)
+    requests_path = tmp_path / "batch" / "requests.jsonl"
+
+    assert batch_mode.prepare_batch(requests_path, model_name="gemini-1.5-pro-002") == 1
+    # As written by submit_batch(requests_path, "gemini-1.5-pro-002").
+    state_path.write_text(json.dumps({
+        "job_name": "batches/1", "requests_path": str(requests_path), "model": "gemini-1.5-pro-002",
+    }))
+    [line] = [json.loads(line) for line in requests_path.read_text().splitlines()]
+    results_path = tmp_path / "batch" / "results.jsonl"
+    results_path.write_text(json.dumps({
+        "key": line["key"],
+        "response": {"candidates": [{"content": {"parts": [{"text": GRADE_YAML}]}}]},
+    }) + "\n")
+
+    batch_mode.ingest_batch_results(results_path, requests_path)
+
+    manifest = build_manifest.BuildManifest(output_dir / build_manifest.MANIFEST_FILE)
+    assert manifest.entries["alice.txt"]["inputs"]["model"] == "batch=gemini-1.5-pro-002"
+    [record] = result_store.iter_results(output_dir)
+    assert record["model_name"] == "gemini-1.5-pro-002"
+    # Up to date for that model, but not for the default batch model.
+    assert batch_mode.prepare_batch(requests_path, model_name="gemini-1.5-pro-002") == 0
+    assert batch_mode.prepare_batch(requests_path) == 1
+    assert "latest" not in batch_mode.BATCH_MODEL
+
+
+def test_failed_results_are_skipped():
+    assert batch_mode.response_text_from_result({"key": "k", "error": {"code": 500}}) is None
+    assert batch_mode.response_text_from_result({"key": "k", "response": {"candidates": []}}) is None
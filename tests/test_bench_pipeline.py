@@ -0,0 +1,73 @@
+import pytest
+
+import grader
+import text_extraction
+from benchmarks import bench_pipeline
+from benchmarks.fake_gemini import FakeGeminiBackend
+
+
+def test_synthetic_cohort_is_extractable(tmp_path):
+    paths = bench_pipeline.generate_cohort(tmp_path, 6, pdf_share=0.5, words=(80, 120), seed=1)
+
+    assert {p.suffix for p in paths} == {".docx", ".pdf"}
+    for path in paths:
+        text, _ = text_extraction.extract_text_from_file(path)
+        assert len(text.split()) >= 80
+
+
+def test_grader_runs_end_to_end_against_the_fake_backend(tmp_path, caplog):
+    cohort = tmp_path / "cohort"
+    bench_pipeline.generate_cohort(cohort, 4, pdf_share=0.25, words=(80, 120))
+    backend = FakeGeminiBackend(
+        grader.load_rubric_config(),
+        latency_median=0,
+        error_rate=0.3,
+        error_codes=(429,),
+        seed=3,
+    )
+
+    row = bench_pipeline.run_script("grader", cohort, tmp_path / "out", backend)
+
+    assert row["completed"] == row["files"] == 4
+    assert row["files_per_minute"] > 0
+    assert {"extract", "grade_call", "parse", "render"} <= set(row["stages"])
+    # Every injected 429 was retried or failed over rather than failing a submission.
+    failovers = sum("failed over" in record.getMessage() for record in caplog.records)
+    retries = sum(stage["retries"] for stage in row["api"].values())
+    assert row["backend"]["errors"] == retries + failovers
+    assert grader.OUTPUT_FOLDER.name == "output_feedback"
+
+
+def test_throughput_drops_beyond_the_threshold_are_regressions():
+    baseline = [{"script": "grader", "cohort_size": 10, "files_per_minute": 100.0}]
+    ok = [{"script": "grader", "cohort_size": 10, "files_per_minute": 85.0}]
+    slow = [{"script": "grader", "cohort_size": 10, "files_per_minute": 70.0}]
+
+    assert bench_pipeline.find_regressions(ok, baseline, 0.2) == []
+    assert len(bench_pipeline.find_regressions(slow, baseline, 0.2)) == 1
+    assert bench_pipeline.find_regressions(slow, [], 0.2) == []
+
+
+@pytest.mark.parametrize("stream", [False, True])
+def test_fake_backend_reports_usage_metadata(stream):
+    backend = FakeGeminiBackend({"criteria": {"a": {}, "b": {}}}, latency_median=0)
+    model_stub = type("M", (), {"generation_config": {}, "prefix_text": "P" * 400})()
+    response = backend.respond(model_stub, ["assistant_reasons please"], stream=stream)
+    if stream:
+        assert "".join(chunk.text for chunk in response) == response.text
+    assert response.usage_metadata.cached_content_token_count == 100
+    assert "assistant_reasons" in response.text
+
+
+def test_bench_runs_do_not_touch_the_extraction_cache(tmp_path, monkeypatch):
+    cohort = tmp_path / "cohort"
+    bench_pipeline.generate_cohort(cohort, 2, pdf_share=0, words=(80, 120))
+    cache = text_extraction.ExtractionCache(tmp_path / "extraction_cache")
+    monkeypatch.setattr(text_extraction, "_shared_cache", cache)
+    backend = FakeGeminiBackend(grader.load_rubric_config(), latency_median=0)
+
+    bench_pipeline.run_script("grader", cohort, tmp_path / "out", backend)
+
+    assert cache.hits == 0
+    assert not cache.directory.exists()
+    assert text_extraction.EXTRACTION_CACHE_ENABLED
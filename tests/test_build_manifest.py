@@ -0,0 +1,99 @@
+from pathlib import Path
+
+import build_manifest
+import grader
+
+
+GRADE_YAML = """
+assistant_reasons:
+  - criterion: symptom_analysis
+    band: 4
+    rationale: ok
+"""
+
+
+def test_shared_identifiers_get_unique_suffixes():
+    paths = [Path("b/Jane Doe.docx"), Path("a/Jane Doe.txt"), Path("c/Sam.txt")]
+    identifiers = build_manifest.assign_student_identifiers(paths, lambda p: p.stem)
+    assert identifiers == {
+        Path("a/Jane Doe.txt"): "Jane Doe",
+        Path("b/Jane Doe.docx"): "Jane Doe_2",
+        Path("c/Sam.txt"): "Sam",
+    }
+
+
+def test_runs_redo_only_the_stages_whose_inputs_changed(monkeypatch, tmp_path):
+    input_dir = tmp_path / "in"
+    output_dir = tmp_path / "out"
+    input_dir.mkdir()
+    (input_dir / "student0.txt").write_text("word " * 800)
+    master_prompt = tmp_path / "master_prompt.txt"
+    master_prompt.write_text("Grade:\n{{STUDENT_SUBMISSION_TEXT_HERE}}")
+    rubric = tmp_path / "rubric.yml"
+    rubric.write_text(Path("rubric.yml").read_text())
+
+    monkeypatch.setattr(grader, "INPUT_FOLDER", input_dir)
+    monkeypatch.setattr(grader, "OUTPUT_FOLDER", output_dir)
+    monkeypatch.setattr(grader, "MASTER_PROMPT_FILE", master_prompt)
+    monkeypatch.setattr(grader, "RUBRIC_FILE", rubric)
+    monkeypatch.setattr(grader, "load_api_key", lambda: "test-key")
+    monkeypatch.setattr(grader, "review_grade", lambda *a, **k: "No issues found.")
+    calls = []
+
+    def fake_call(prompt, api_key, **kwargs):
+        calls.append(prompt)
+        return GRADE_YAML
+
+    monkeypatch.setattr(grader, "call_gemini_api", fake_call)
+    summary_path = output_dir / grader.SUMMARY_FILE
+
+    grader.run_grading_process()
+    assert len(calls) == 1
+    assert summary_path.read_text().splitlines()[1].startswith("student0,9,")
+
+    # Nothing changed: no API call, and the summary still lists the student.
+    grader.run_grading_process()
+    assert len(calls) == 1
+    assert summary_path.read_text().splitlines()[1].startswith("student0,9,")
+
+    # A rubric edit is re-scored from the stored result.
+    rubric.write_text(rubric.read_text().replace("max_points: 5", "max_points: 3", 1))
+    grader.run_grading_process()
+    assert len(calls) == 1
+    assert summary_path.read_text().splitlines()[1].startswith("student0,8,")
+
+    # A missing report is re-rendered.
+    (output_dir / "student0_graded.docx").unlink()
+    grader.run_grading_process()
+    assert len(calls) == 1
+    assert (output_dir / "student0_graded.docx").exists()
+
+    # A prompt edit needs fresh model output.
+    master_prompt.write_text("Grade carefully:\n{{STUDENT_SUBMISSION_TEXT_HERE}}")
+    grader.run_grading_process()
+    assert len(calls) == 2
+
+
+def test_failed_renders_are_left_out_of_the_manifest_and_summary(monkeypatch, tmp_path, caplog):
+    input_dir = tmp_path / "in"
+    output_dir = tmp_path / "out"
+    input_dir.mkdir()
+    (input_dir / "student0.txt").write_text("word " * 800)
+    (input_dir / "student1.txt").write_text("other " * 800)
+    # A directory in place of the report makes its render fail.
+    (output_dir / "student1_graded.docx").mkdir(parents=True)
+
+    monkeypatch.setattr(grader, "INPUT_FOLDER", input_dir)
+    monkeypatch.setattr(grader, "OUTPUT_FOLDER", output_dir)
+    monkeypatch.setattr(grader, "load_api_key", lambda: "test-key")
+    monkeypatch.setattr(grader, "review_triggers", lambda *a, **k: [])
+    monkeypatch.setattr(grader, "call_gemini_api", lambda prompt, api_key, **k: GRADE_YAML)
+
+    grader.run_grading_process()
+
+    manifest = build_manifest.BuildManifest(output_dir / build_manifest.MANIFEST_FILE)
+    assert list(manifest.entries) == ["student0.txt"]
+    summary = (output_dir / grader.SUMMARY_FILE).read_text().splitlines()[1:]
+    assert [row.split(",")[0] for row in summary] == ["student0"]
+    messages = [record.getMessage() for record in caplog.records]
+    assert any("rendering failed for 1 submission" in message for message in messages)
@@ -0,0 +1,96 @@
+import json
+
+import bigbraingrader
+import cascade_policy
+import metrics
+
+
+def _reply(**bands):
+    return {
+        "assistant_reasons": [
+            {"criterion": cid, "band": band, "confidence": 0.9} for cid, band in bands.items()
+        ]
+    }
+
+
+CLEAR = dict(
+    symptom_analysis=4,
+    bps_factors=4,
+    diagnostic_primary=5,
+    diagnostic_diff=4,
+    treatment=4,
+    communication=4,
+)
+
+
+def _rubric(**policy):
+    return dict(
+        bigbraingrader.load_rubric_config(),
+        review_policy={"audit_rate": 0},
+        cascade_policy=policy,
+    )
+
+
+def test_clear_cut_flash_grades_are_kept():
+    rubric = _rubric()
+    assert cascade_policy.escalation_reasons(_reply(**CLEAR), rubric, samples=[_reply(**CLEAR)]) == []
+
+
+def test_parse_failures_and_boundary_bands_escalate():
+    rubric = _rubric()
+    assert cascade_policy.escalation_reasons(None, rubric) == ["parse"]
+    assert cascade_policy.escalation_reasons(
+        _reply(**dict(CLEAR, diagnostic_primary=3)), rubric
+    ) == ["boundary:diagnostic_primary=3"]
+    assert cascade_policy.escalation_reasons(
+        _reply(**dict(CLEAR, diagnostic_primary=3)), _rubric(escalate_on_boundary=False)
+    ) == []
+
+
+def test_disagreeing_samples_and_review_changes_escalate():
+    rubric = _rubric()
+    drifted = _reply(**dict(CLEAR, symptom_analysis=2, bps_factors=3))
+    assert cascade_policy.band_agreement([_reply(**CLEAR), drifted], rubric) == 4 / 6
+    assert cascade_policy.escalation_reasons(_reply(**CLEAR), rubric, samples=[drifted]) == [
+        "inconsistent:0.67"
+    ]
+
+    # Only adjustments that actually change a band count.
+    assert cascade_policy.escalation_reasons(
+        _reply(**CLEAR), rubric, review_adjustments={"Treatment Selection & Justification": 4}
+    ) == []
+    assert cascade_policy.escalation_reasons(
+        _reply(**CLEAR), rubric, review_adjustments={"treatment": 3}
+    ) == ["review:treatment=4->3"]
+
+
+def test_flash_grade_records_the_escalation_rate(monkeypatch):
+    drifted = _reply(**dict(CLEAR, treatment=2, bps_factors=2))
+    replies = {"flash_grade": [_reply(**CLEAR), _reply(**CLEAR), drifted]}
+    calls = []
+
+    def fake_call(prompt, api_key, generation_config=None, on_chunk=None, stage="grade", sample=None):
+        calls.append((stage, sample))
+        return json.dumps(replies[stage].pop(0))
+
+    monkeypatch.setattr(bigbraingrader, "call_gemini_api", fake_call)
+    run = metrics.RunMetrics()
+    monkeypatch.setattr(metrics, "_shared_metrics", run)
+    rubric = _rubric()
+
+    kept = bigbraingrader.flash_grade("text", ["prompt"], "key", rubric, 1000, "a")
+    assert kept["escalation"] == [] and kept["parsed"] == _reply(**CLEAR)
+    assert calls == [("flash_grade", None), ("flash_grade", 0)]
+
+    replies["flash_grade"].append(_reply(**CLEAR))
+    escalated = bigbraingrader.flash_grade("text", ["prompt"], "key", rubric, 1000, "b")
+    assert escalated["escalation"] == ["inconsistent:0.67"]
+
+    cascade = run.snapshot()["cascade"]
+    assert cascade == {
+        "graded": 2,
+        "escalated": 1,
+        "reasons": {"inconsistent": 1},
+        "escalation_rate": 0.5,
+    }
+    assert "1/2 escalated (50%)" in run.summary()
@@ -0,0 +1,86 @@
+import threading
+import time
+
+import grader
+
+
+GRADE_YAML = """
+assistant_reasons:
+  - criterion: symptom_analysis
+    band: 4
+    rationale: ok
+  - criterion: diagnostic_primary
+    band: 4
+    rationale: ok
+"""
+
+
+def _setup(monkeypatch, tmp_path, n_files):
+    input_dir = tmp_path / "in"
+    output_dir = tmp_path / "out"
+    input_dir.mkdir()
+    for i in range(n_files):
+        (input_dir / f"student{i}.txt").write_text(f"student{i} " + "word " * 800)
+
+    monkeypatch.setattr(grader, "INPUT_FOLDER", input_dir)
+    monkeypatch.setattr(grader, "OUTPUT_FOLDER", output_dir)
+    monkeypatch.setattr(grader, "load_api_key", lambda: "test-key")
+    monkeypatch.setattr(
+        grader, "load_master_prompt", lambda: "Grade:\n{{STUDENT_SUBMISSION_TEXT_HERE}}"
+    )
+    monkeypatch.setattr(grader, "review_grade", lambda *a, **k: "No issues found.")
+    monkeypatch.setattr(grader, "review_triggers", lambda *a, **k: ["audit"])
+    return output_dir
+
+
+def test_submissions_are_graded_concurrently(monkeypatch, tmp_path):
+    output_dir = _setup(monkeypatch, tmp_path, 6)
+    in_flight = 0
+    peak = 0
+    lock = threading.Lock()
+
+    def fake_call(prompt, api_key, **kwargs):
+        nonlocal in_flight, peak
+        with lock:
+            in_flight += 1
+            peak = max(peak, in_flight)
+        # Hold the slot until a second request overlaps (or give up after 2s).
+        deadline = time.monotonic() + 2
+        while peak < 2 and time.monotonic() < deadline:
+            time.sleep(0.01)
+        with lock:
+            in_flight -= 1
+        return GRADE_YAML
+
+    monkeypatch.setattr(grader, "call_gemini_api", fake_call)
+
+    grader.run_grading_process(max_concurrency=3)
+
+    assert peak > 1
+    summary = (output_dir / grader.SUMMARY_FILE).read_text().splitlines()
+    assert summary[0] == "student,total_points,review"
+    assert [line.split(",")[0] for line in summary[1:]] == [
+        f"student{i}" for i in range(6)
+    ]
+    assert len(list(output_dir.glob("*_graded.docx"))) == 6
+    assert len(list(output_dir.glob("*_grade_review.txt"))) == 6
+
+
+def test_one_failing_submission_does_not_stop_the_batch(monkeypatch, tmp_path):
+    output_dir = _setup(monkeypatch, tmp_path, 4)
+
+    def fake_call(prompt, api_key, **kwargs):
+        if "student2" in str(prompt):
+            raise RuntimeError("boom")
+        return GRADE_YAML
+
+    monkeypatch.setattr(grader, "call_gemini_api", fake_call)
+
+    grader.run_grading_process(max_concurrency=2)
+
+    summary = (output_dir / grader.SUMMARY_FILE).read_text().splitlines()
+    assert [line.split(",")[0] for line in summary[1:]] == [
+        "student0",
+        "student1",
+        "student3",
+    ]
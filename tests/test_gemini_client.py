@@ -0,0 +1,30 @@
+from concurrent.futures import ThreadPoolExecutor
+
+import gemini_client
+
+
+def test_models_are_reused_per_name_and_settings(monkeypatch):
+    configure_calls = []
+    created = []
+
+    class FakeModel:
+        def __init__(self, name, safety_settings=None, generation_config=None):
+            created.append((name, generation_config))
+
+    monkeypatch.setattr(gemini_client.genai, "configure", lambda api_key: configure_calls.append(api_key))
+    monkeypatch.setattr(gemini_client.genai, "GenerativeModel", FakeModel)
+    gemini_client.clear_models()
+
+    with ThreadPoolExecutor(max_workers=8) as pool:
+        models = list(
+            pool.map(lambda _: gemini_client.get_model("flash", "key"), range(32))
+        )
+
+    assert len({id(m) for m in models}) == 1
+    assert configure_calls == ["key"]
+
+    low_temp = gemini_client.get_model("flash", "key", {"temperature": 0.1})
+    assert low_temp is not models[0]
+    assert gemini_client.get_model("flash", "key", {"temperature": 0.1}) is low_temp
+    assert len(created) == 2
+    gemini_client.clear_models()
@@ -0,0 +1,39 @@
+import grader
+
+STUDENT_TEXT = "The client presents with persistent low mood and anhedonia."
+REVIEW_TEMPLATE = (
+    "Review this grade.\nSubmission:\n{{STUDENT_SUBMISSION_TEXT_HERE}}\n"
+    "Grade:\n{{AI_GRADE_YAML_HERE}}\n"
+)
+
+
+def test_review_fills_the_template(monkeypatch):
+    sent = []
+    monkeypatch.setattr(grader, "call_gemini_api", lambda prompt, api_key, **k: sent.append(prompt))
+
+    grader.review_grade(STUDENT_TEXT, "grade", "key", review_prompt_template=REVIEW_TEMPLATE)
+
+    assert isinstance(sent[0], str)
+    assert STUDENT_TEXT in sent[0] and "Grade:\ngrade" in sent[0]
+
+
+def test_grading_sends_the_review_prompt(monkeypatch, tmp_path):
+    input_dir = tmp_path / "in"
+    input_dir.mkdir()
+    (input_dir / "student.txt").write_text(STUDENT_TEXT)
+    monkeypatch.setattr(grader, "INPUT_FOLDER", input_dir)
+    monkeypatch.setattr(grader, "OUTPUT_FOLDER", tmp_path / "out")
+    monkeypatch.setattr(grader, "load_api_key", lambda: "key")
+    monkeypatch.setattr(grader, "load_master_prompt", lambda: "Grade:\n{{STUDENT_SUBMISSION_TEXT_HERE}}")
+    monkeypatch.setattr(grader, "load_grade_review_prompt_template", lambda: REVIEW_TEMPLATE)
+    monkeypatch.setattr(grader, "review_triggers", lambda *a, **k: ["audit"])
+    sent = {}
+
+    def fake_call(prompt, api_key, stage="grade", **kwargs):
+        sent[stage] = prompt
+        return "assistant_reasons: []" if stage == "grade" else "No issues found."
+
+    monkeypatch.setattr(grader, "call_gemini_api", fake_call)
+    grader.run_grading_process(max_concurrency=1)
+
+    assert isinstance(sent["review"], str) and STUDENT_TEXT in sent["review"]
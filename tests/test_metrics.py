@@ -0,0 +1,84 @@
+import json
+from types import SimpleNamespace
+
+import gemini_client
+import metrics
+from metrics import RunMetrics
+from rate_limiter import RateLimiter
+
+
+class FakeApiError(Exception):
+    def __init__(self, code):
+        super().__init__(f"{code} error")
+        self.code = code
+
+
+def _response(prompt, output, cached=0):
+    usage = SimpleNamespace(
+        prompt_token_count=prompt,
+        candidates_token_count=output,
+        cached_content_token_count=cached,
+    )
+    return SimpleNamespace(usage_metadata=usage)
+
+
+def test_requests_are_aggregated_by_stage_model_and_submission():
+    run = RunMetrics()
+    with metrics.labels(submission="alice"):
+        with metrics.labels(stage="grade"):
+            run.record_request("gemini-1.5-flash-latest", 1.5, _response(1000, 200, cached=600))
+        with metrics.labels(stage="review"):
+            run.record_request("gemini-1.5-flash-latest", 0.4, outcome="throttled")
+            run.record_cache_hit("gemini-1.5-flash-latest")
+    run.record_request("other-model", 3.0, _response(10, 10))
+
+    report = run.snapshot()
+    assert report["totals"]["requests"] == 3
+    assert report["by_stage"]["grade"]["prompt_tokens"] == 1000
+    assert report["by_stage"]["review"]["outcomes"] == {"throttled": 1}
+    assert report["by_stage"]["other"]["cost_usd"] == 0.0
+    assert report["submissions"]["alice"]["requests"] == 2
+    assert report["submissions"]["alice"]["cache_hits"] == 1
+    expected_cost = (400 * 0.075 + 600 * 0.01875 + 200 * 0.30) / 1_000_000
+    assert abs(report["by_model"]["gemini-1.5-flash-latest"]["cost_usd"] - expected_cost) < 1e-12
+
+
+def test_export_writes_json_report_and_prometheus_textfile(tmp_path):
+    run = RunMetrics()
+    with metrics.labels(stage="grade"):
+        run.record_request("flash", 1.5, _response(100, 50))
+        run.record_request("flash", 45.0, _response(100, 50))
+
+    run.export(tmp_path)
+
+    report = json.loads((tmp_path / metrics.RUN_REPORT_FILE).read_text())
+    assert report == metrics.load_run_report(tmp_path)
+    assert report["totals"]["output_tokens"] == 100
+    text = (tmp_path / metrics.PROMETHEUS_FILE).read_text()
+    assert 'grader_requests_total{stage="grade",model="flash",outcome="ok"} 2' in text
+    assert 'grader_request_latency_seconds_bucket{stage="grade",model="flash",le="2"} 1' in text
+    assert 'grader_request_latency_seconds_bucket{stage="grade",model="flash",le="+Inf"} 2' in text
+    assert 'grader_tokens_total{stage="grade",model="flash",kind="prompt"} 200' in text
+
+
+def test_retries_and_throttled_attempts_are_counted(monkeypatch):
+    run = RunMetrics()
+    monkeypatch.setattr(metrics, "_shared_metrics", run)
+    limiter = RateLimiter(
+        {"m": {"rpm": 100, "tpm": 10_000, "max_concurrency": 4}}, sleep=lambda s: None
+    )
+    attempts = iter([FakeApiError(429), FakeApiError(503), _response(5, 5)])
+
+    def flaky():
+        outcome = next(attempts)
+        if isinstance(outcome, Exception):
+            raise outcome
+        return outcome
+
+    with metrics.labels(stage="grade"):
+        limiter.call("m", gemini_client._timed("m", flaky))
+
+    stats = run.snapshot()["by_stage"]["grade"]
+    assert stats["retries"] == 2
+    assert stats["outcomes"] == {"throttled": 1, "unavailable": 1, "ok": 1}
+    assert stats["output_tokens"] == 5
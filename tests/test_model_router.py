@@ -0,0 +1,126 @@
+import pytest
+
+import gemini_client
+import model_router
+import rate_limiter
+import response_cache
+from model_router import ModelRouter
+from rate_limiter import RateLimiter, error_status
+
+
+class ApiError(Exception):
+    def __init__(self, code):
+        super().__init__(f"{code} fake error")
+        self.code = code
+
+
+class Response:
+    def __init__(self, text):
+        self.text = text
+        self.parts = [text]
+        self.prompt_feedback = None
+        self.usage_metadata = None
+
+
+@pytest.fixture
+def models(monkeypatch):
+    """Fake models by name: an int fails with that status, a string is the reply."""
+    behaviour = {}
+    calls = []
+
+    class FakeModel:
+        def __init__(self, name):
+            self.name = name
+
+        def generate_content(self, contents, stream=False):
+            calls.append(self.name)
+            outcome = behaviour[self.name]
+            if isinstance(outcome, BaseException):
+                raise outcome
+            if isinstance(outcome, int):
+                raise ApiError(outcome)
+            return Response(outcome)
+
+    monkeypatch.setattr(response_cache, "RESPONSE_CACHE_ENABLED", False)
+    monkeypatch.setattr(gemini_client, "get_model", lambda name, *a, **k: FakeModel(name))
+    monkeypatch.setattr(rate_limiter, "_shared_limiter", RateLimiter(sleep=lambda seconds: None))
+    return behaviour, calls
+
+
+def test_throttled_model_fails_over_and_cools_down(models):
+    behaviour, calls = models
+    behaviour.update({"flash": 429, "pro": "graded by pro"})
+    now = [0.0]
+    router = ModelRouter({"grade": ["flash", "pro"]}, cooldown_seconds=60, clock=lambda: now[0])
+
+    with model_router.track_models() as served:
+        assert router.generate("grade", "prompt", "key") == "graded by pro"
+    assert served == {"grade": "pro"}
+    assert calls == ["flash", "flash", "pro"]  # one retry, then failover
+
+    # While cooling down the throttled model is tried last.
+    assert router.chain("grade") == ["pro", "flash"]
+    now[0] = 61
+    assert router.chain("grade") == ["flash", "pro"]
+
+
+@pytest.mark.parametrize("failure", [500, 503, TimeoutError("read timed out")])
+def test_server_errors_and_timeouts_fail_over(models, failure):
+    behaviour, calls = models
+    behaviour.update({"flash": failure, "pro": "ok"})
+    router = ModelRouter({"grade": ["flash", "pro"]})
+
+    assert router.generate("review", "prompt", "key") == "ok"
+    assert calls[-1] == "pro"
+
+
+def test_other_failures_do_not_fail_over(models):
+    behaviour, calls = models
+    behaviour.update({"flash": 400, "pro": "ok"})
+    router = ModelRouter({"grade": ["flash", "pro"]})
+
+    with model_router.track_models() as served:
+        assert router.generate("grade", "prompt", "key") is None
+    assert calls == ["flash"]
+    assert served == {}
+
+
+def test_the_last_model_gets_the_full_backoff(models):
+    behaviour, calls = models
+    behaviour.update({"flash": 429, "pro": 429})
+    now = [0.0]
+    router = ModelRouter({"grade": ["flash", "pro"]}, clock=lambda: now[0])
+
+    assert router.generate("grade", "prompt", "key") is None
+    assert calls == ["flash"] * 2 + ["pro"] * (1 + rate_limiter.MAX_RETRIES)
+
+    # While flash cools down, pro is the only model left and is not failed over.
+    calls.clear()
+    behaviour["pro"] = "ok"
+    assert router.chain("grade") == ["pro", "flash"]
+    assert router.generate("grade", "prompt", "key") == "ok"
+    assert calls == ["pro"]
+
+
+def test_an_exhausted_chain_returns_none(models):
+    behaviour, _ = models
+    behaviour.update({"flash": 429, "pro": 503})
+    router = ModelRouter({"grade": ["flash", "pro"]})
+
+    assert router.generate("grade", "prompt", "key") is None
+    # Without failover the client keeps its old contract of returning None.
+    assert gemini_client.generate_text("prompt", "key", "pro", failover=False) is None
+
+
+def test_timeouts_and_grpc_server_errors_have_a_status():
+    class GrpcError(Exception):
+        def __init__(self, code):
+            self._code = code
+
+        def code(self):
+            return self._code
+
+    assert error_status(TimeoutError()) == 504
+    assert error_status(GrpcError((4, "deadline exceeded"))) == 504
+    assert error_status(GrpcError((13, "internal"))) == 500
+    assert ModelRouter({"grade": ["a", "b"], "review": ["b"]}).fingerprint() == "grade=a>b;review=b"
@@ -0,0 +1,110 @@
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import gemini_client
+import prompt_cache
+import response_cache
+from prompt_cache import LocalPrefixCacheBackend, PrefixCache
+
+
+class FullPromptModel:
+    def __init__(self):
+        self.calls = []
+
+    def generate_content(self, contents):
+        self.calls.append(contents)
+        return prompt_cache._StubResponse("full prompt answer")
+
+
+def _install(monkeypatch, cache):
+    full_model = FullPromptModel()
+    monkeypatch.setattr(response_cache, "RESPONSE_CACHE_ENABLED", False)
+    monkeypatch.setattr(gemini_client, "get_prefix_cache", lambda: cache)
+    monkeypatch.setattr(gemini_client, "get_model", lambda *a, **k: full_model)
+    return full_model
+
+
+def test_prefix_is_registered_once_and_only_suffix_is_sent(monkeypatch):
+    seen = []
+    backend = LocalPrefixCacheBackend(lambda parts: seen.append(parts) or "graded")
+    cache = PrefixCache(backend, min_prefix_tokens=1)
+    full_model = _install(monkeypatch, cache)
+
+    for student in ("essay one", "essay two"):
+        text = gemini_client.generate_text(["RUBRIC PREFIX", student, "grade it"], "key", "flash")
+        assert text == "graded"
+
+    assert len(backend.created) == 1
+    assert seen[1] == ["RUBRIC PREFIX", "essay two", "grade it"]
+    assert full_model.calls == []
+    cache.release_all()
+    assert backend.deleted == backend.created
+
+
+def test_ttl_is_refreshed_near_expiry():
+    now = [0.0]
+    backend = LocalPrefixCacheBackend()
+    cache = PrefixCache(backend, ttl_seconds=600, refresh_margin_seconds=60, min_prefix_tokens=1, clock=lambda: now[0])
+
+    cache.model_for("flash", "prefix", [])
+    now[0] = 500.0
+    cache.model_for("flash", "prefix", [])
+    assert backend.refreshed == []
+    now[0] = 560.0
+    cache.model_for("flash", "prefix", [])
+    assert len(backend.refreshed) == 1
+
+
+def test_falls_back_to_full_prompt_when_caching_fails(monkeypatch):
+    def broken(parts):
+        raise RuntimeError("cached content expired")
+
+    backend = LocalPrefixCacheBackend(broken)
+    cache = PrefixCache(backend, min_prefix_tokens=1)
+    full_model = _install(monkeypatch, cache)
+    prompt = ["RUBRIC PREFIX", "essay", "grade it"]
+
+    assert gemini_client.generate_text(prompt, "key", "flash") == "full prompt answer"
+    assert gemini_client.generate_text(prompt, "key", "flash") == "full prompt answer"
+    assert full_model.calls == [prompt, prompt]
+    assert len(backend.created) == 1
+
+    class Unavailable(LocalPrefixCacheBackend):
+        def create(self, *args):
+            raise RuntimeError("model does not support caching")
+
+    assert PrefixCache(Unavailable(), min_prefix_tokens=1).model_for("flash", "p", []) is None
+    assert PrefixCache(LocalPrefixCacheBackend()).model_for("flash", "short prefix", []) is None
+
+
+def test_prefixes_below_the_model_minimum_are_not_cached():
+    backend = LocalPrefixCacheBackend()
+    cache = PrefixCache(backend)
+    prefix = "word " * 8000  # ~10k tokens
+
+    assert prompt_cache.min_prefix_tokens_for("gemini-1.5-flash-latest") == 32768
+    assert cache.model_for("gemini-1.5-flash-latest", prefix, []) is None
+    assert cache.model_for("models/gemini-2.5-flash", prefix, []) is not None
+    assert [h.model for h in backend.created] == ["models/gemini-2.5-flash"]
+
+
+def test_creation_runs_outside_the_lock():
+    release = threading.Event()
+
+    class SlowBackend(LocalPrefixCacheBackend):
+        def create(self, model_name, prefix_text, ttl_seconds):
+            if prefix_text == "slow":
+                assert release.wait(5)
+            return super().create(model_name, prefix_text, ttl_seconds)
+
+    backend = SlowBackend()
+    cache = PrefixCache(backend, min_prefix_tokens=1)
+    with ThreadPoolExecutor(max_workers=3) as pool:
+        slow = [pool.submit(cache.model_for, "flash", "slow", []) for _ in range(2)]
+        # Another prefix is served while the slow one is still being created.
+        assert cache.model_for("flash", "fast", []) is not None
+        release.set()
+        models = [f.result(timeout=5) for f in slow]
+
+    assert models[0] is models[1] is not None
+    assert [h.prefix_text for h in backend.created] == ["fast", "slow"]
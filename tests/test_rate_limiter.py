@@ -0,0 +1,53 @@
+import pytest
+
+from rate_limiter import ModelRateLimiter, RateLimiter, is_retryable_error
+
+
+class FakeApiError(Exception):
+    def __init__(self, code):
+        super().__init__(f"{code} error")
+        self.code = code
+
+
+def test_throttled_calls_are_retried_and_concurrency_halved():
+    sleeps = []
+    limiter = RateLimiter(
+        {"m": {"rpm": 100, "tpm": 10_000, "max_concurrency": 8}}, sleep=sleeps.append
+    )
+    attempts = iter([FakeApiError(429), FakeApiError(503), "ok"])
+
+    def flaky():
+        outcome = next(attempts)
+        if isinstance(outcome, Exception):
+            raise outcome
+        return outcome
+
+    assert limiter.call("m", flaky, estimated_tokens=10) == "ok"
+    assert len(sleeps) == 2
+    assert limiter.for_model("m").concurrency_limit == 2
+
+
+def test_non_retryable_errors_are_raised_immediately():
+    limiter = RateLimiter(sleep=lambda s: pytest.fail("should not back off"))
+
+    def bad_request():
+        raise FakeApiError(400)
+
+    with pytest.raises(FakeApiError):
+        limiter.call("gemini-1.5-flash-latest", bad_request)
+    assert not is_retryable_error(FakeApiError(400))
+
+
+def test_rpm_and_tpm_budgets_delay_requests():
+    now = [0.0]
+    limiter = ModelRateLimiter(rpm=2, tpm=1_000, max_concurrency=4, clock=lambda: now[0])
+
+    first = limiter.acquire(100)
+    limiter.release(first)
+    limiter.acquire(100)
+    assert limiter._wait_time(100, now[0]) == pytest.approx(60.0)
+
+    now[0] = 61.0
+    limiter._purge(now[0])
+    limiter.acquire(900)
+    assert limiter._wait_time(200, 61.0) == pytest.approx(60.0)
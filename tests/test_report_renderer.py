@@ -0,0 +1,101 @@
+import docx
+
+import report_renderer
+from report_renderer import RenderPool, render_draft_report, render_feedback_report
+
+RUBRIC = {
+    "total_points_possible": 10,
+    "criteria": {
+        "analysis": {"name": "Analysis", "max_points": 6},
+        "writing": {"name": "Writing", "max_points": 4},
+    },
+}
+
+REPLY = {
+    "assistant_grade": {"breakdown": {"analysis": {"points": 5}, "writing": {"points": 3}}},
+    "assistant_reasons": [
+        {
+            "criterion": "analysis",
+            "band": 4,
+            "rationale": "Sound <analysis> & clear\x0b reasoning.",
+            "evidence": "first quote\nsecond quote",
+            "improvements": ["Cite more sources."],
+        }
+    ],
+}
+
+
+def _styled(path):
+    return [(p.style.name, p.text) for p in docx.Document(path).paragraphs if p.text]
+
+
+def test_feedback_report_uses_template_styles(tmp_path):
+    path = tmp_path / "report.docx"
+    render_feedback_report(REPLY, path, "Student A", RUBRIC, doc_author="Author A")
+
+    document = docx.Document(path)
+    paragraphs = _styled(path)
+    assert paragraphs[0] == ("Heading 1", "Feedback Report for: Student A")
+    assert ("Normal", "Total Points: 8 / 10") in paragraphs
+    assert ("Heading 3", "1. Analysis") in paragraphs
+    # Markup is escaped and characters XML cannot carry are dropped.
+    assert ("Normal", "Sound <analysis> & clear reasoning.") in paragraphs
+    assert ("List Bullet", "second quote") in paragraphs
+
+    rows = [[cell.text for cell in row.cells] for row in document.tables[0].rows]
+    assert rows == [
+        ["Criterion", "Points Achieved", "Max Points"],
+        ["Analysis", "5", "6"],
+        ["Writing", "3", "4"],
+    ]
+    assert not list(tmp_path.glob(".*.tmp"))
+
+
+def test_draft_report_keeps_bullets_and_bold(tmp_path):
+    path = tmp_path / "draft.docx"
+    prose = "**Strengths**\n* Clear **thesis** here\n    * nested point\nClosing line."
+    render_draft_report(prose, path, "Student B")
+
+    paragraphs = docx.Document(path).paragraphs
+    assert _styled(path) == [
+        ("Heading 1", "Draft Feedback Report for: Student B"),
+        ("Heading 2", "Strengths"),
+        ("List Bullet", "Clear thesis here"),
+        ("List Bullet 2", "nested point"),
+        ("Normal", "Closing line."),
+    ]
+    assert [(run.text, run.bold) for run in paragraphs[2].runs] == [
+        ("Clear ", None),
+        ("thesis", True),
+        (" here", None),
+    ]
+
+
+def test_render_pool_writes_every_report(tmp_path):
+    paths = [tmp_path / f"report_{i}.docx" for i in range(4)]
+    with RenderPool(max_workers=2) as pool:
+        futures = [
+            pool.submit(render_feedback_report, REPLY, path, f"S{i}", RUBRIC)
+            for i, path in enumerate(paths)
+        ]
+        failing = pool.submit(render_feedback_report, REPLY, tmp_path / "missing" / "x.docx", "S", RUBRIC)
+
+    assert [f.result() for f in futures] == [str(p) for p in paths]
+    assert all(docx.Document(p).tables for p in paths)
+    assert failing.exception() is not None and pool.failures == 1
+
+
+def test_a_custom_template_is_picked_up(tmp_path, monkeypatch):
+    template = tmp_path / "report_template.docx"
+    styled = docx.Document()
+    styled.add_paragraph("School letterhead")
+    styled.save(template)
+    monkeypatch.setattr(report_renderer, "REPORT_TEMPLATE_FILE", template)
+
+    path = tmp_path / "report.docx"
+    render_draft_report("Body text.", path, "Student C", template=report_renderer.default_template_path())
+    assert [p.text for p in docx.Document(path).paragraphs if p.text] == [
+        "School letterhead",
+        "Draft Feedback Report for: Student C",
+        "Body text.",
+    ]
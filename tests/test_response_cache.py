@@ -0,0 +1,72 @@
+import os
+import time
+
+import gemini_client
+import response_cache
+from response_cache import ResponseCache, make_cache_key
+
+
+def test_identical_requests_hit_the_cache(monkeypatch, tmp_path):
+    cache = ResponseCache(tmp_path)
+    monkeypatch.setattr(response_cache, "_shared_cache", cache)
+    calls = []
+
+    def fake_request(prompt, api_key, model_name, generation_config, on_chunk=None, failover=False):
+        calls.append(prompt)
+        return "assistant_reasons: []"
+
+    monkeypatch.setattr(gemini_client, "_request_text", fake_request)
+
+    for _ in range(3):
+        text = gemini_client.generate_text(["rubric", "essay"], "key", "flash", cache_context={"rubric": "abc"})
+        assert text == "assistant_reasons: []"
+    gemini_client.generate_text(["rubric", "essay"], "key", "flash", cache_context={"rubric": "changed"})
+
+    assert len(calls) == 2
+    assert (cache.hits, cache.misses, cache.writes) == (2, 2, 2)
+    assert "2 hit(s)" in cache.stats_summary()
+
+
+def test_cache_key_depends_on_every_input():
+    base = make_cache_key("flash", ["a", "b"], {"temperature": 0}, {"rubric": "x"})
+    assert base == make_cache_key("flash", ["a", "b"], {"temperature": 0}, {"rubric": "x"})
+    assert base != make_cache_key("pro", ["a", "b"], {"temperature": 0}, {"rubric": "x"})
+    assert base != make_cache_key("flash", ["a", "c"], {"temperature": 0}, {"rubric": "x"})
+    assert base != make_cache_key("flash", ["a", "b"], {"temperature": 1}, {"rubric": "x"})
+    assert base != make_cache_key("flash", ["a", "b"], {"temperature": 0}, {"rubric": "y"})
+
+
+def test_expired_and_oversized_entries_are_evicted(tmp_path):
+    cache = ResponseCache(tmp_path, max_bytes=10_000, max_age_seconds=60)
+    cache.put("aa01", "old")
+    old_path = cache._path_for("aa01")
+    stale = time.time() - 120
+    os.utime(old_path, (stale, stale))
+    cache.evict()
+    assert not old_path.exists()
+
+    for i in range(5):
+        cache.put(f"bb{i:02d}", "x" * 3_000)
+    remaining = list(tmp_path.glob("*/*.json"))
+    assert sum(p.stat().st_size for p in remaining) <= 10_000
+    assert cache.get("bb04") == "x" * 3_000
+
+
+def test_unusable_grading_replies_are_not_replayed(monkeypatch, tmp_path):
+    import grader
+
+    cache = ResponseCache(tmp_path)
+    monkeypatch.setattr(response_cache, "_shared_cache", cache)
+    replies = ["I cannot grade this essay.", "assistant_reasons: []"]
+
+    def fake_request(prompt, api_key, model_name, generation_config, on_chunk=None, failover=False):
+        return replies.pop(0)
+
+    monkeypatch.setattr(gemini_client, "_request_text", fake_request)
+
+    assert grader.call_gemini_api(["rubric", "essay"], "key") == "I cannot grade this essay."
+    assert cache.writes == 0
+    # The rerun asks again instead of replaying the bad reply, and keeps the good one.
+    assert grader.call_gemini_api(["rubric", "essay"], "key") == "assistant_reasons: []"
+    assert grader.call_gemini_api(["rubric", "essay"], "key") == "assistant_reasons: []"
+    assert (cache.writes, cache.hits) == (1, 1)
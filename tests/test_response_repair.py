@@ -0,0 +1,65 @@
+import pytest
+
+import grader
+import response_repair
+from rubric_engine import CompiledRubric
+
+RUBRIC = CompiledRubric({"criteria": {"a": {"max_points": 5}, "b": {"max_points": 5}}})
+
+
+@pytest.mark.parametrize(
+    "reply, strategy",
+    [
+        (
+            "Sure! Here is the grade:\n```yaml\nassistant_reasons:\n  - criterion: a\n    band: 4\n"
+            "  - criterion: b\n    band: 3\n```\nHope this helps.",
+            "strip_fences",
+        ),
+        (
+            "assistant_reasons:\n- criterion: a\n  band: 4\n   rationale: ok\n - criterion: b\n    band: 3",
+            "indentation",
+        ),
+        (
+            'assistant_reasons:\n  - criterion: a\n    band: 4\n    rationale: Note: the "key" idea\n'
+            '  - criterion: b\n    band: 3\n    rationale: "He said "hi""',
+            "quotes",
+        ),
+        (
+            '{"assistant_reasons": [{"criterion": "a", "band": 4}, {"criterion": "b", "band": 2, '
+            '"rationale": "cut off her',
+            "truncated_tail",
+        ),
+        (
+            "assistant_reasons:\n  - criterion: a\n    band: 4\n    improvements: [unclosed\n"
+            "  - criterion: b\n    band: 3\n  - criterion: a\n    band: {",
+            "criterion_salvage",
+        ),
+    ],
+)
+def test_each_strategy_recovers_its_kind_of_damage(reply, strategy):
+    parsed, used = response_repair.repair_grading_response(reply, RUBRIC)
+    assert used == strategy
+    bands = {item["criterion"]: item["band"] for item in parsed["assistant_reasons"]}
+    assert set(bands) == {"a", "b"}
+    assert bands["a"] == 4
+
+
+def test_incomplete_repairs_are_rejected():
+    reply = "assistant_reasons:\n  - criterion: a\n    band: 4\n  - criterion: b\n    band: {"
+    assert response_repair.repair_grading_response(reply, RUBRIC) == (None, None)
+
+
+def test_fix_request_sends_only_the_broken_output(monkeypatch):
+    rubric_config = grader.load_rubric_config()
+    broken = "I could not produce YAML, sorry."
+    sent = []
+
+    def fake_call(prompt, api_key, **kwargs):
+        sent.append(prompt)
+        return '{"assistant_reasons": [{"criterion": "treatment", "band": 3, "rationale": "ok"}]}'
+
+    monkeypatch.setattr(grader, "call_gemini_api", fake_call)
+    parsed, strategy = grader.parse_or_repair_response(broken, "key", rubric_config)
+    assert strategy == "fix_request"
+    assert parsed["assistant_reasons"][0]["band"] == 3
+    assert sent == [response_repair.build_fix_prompt(broken)]
@@ -0,0 +1,78 @@
+import copy
+
+import grader
+import result_store
+
+
+GRADE_YAML = """
+assistant_reasons:
+  - criterion: symptom_analysis
+    band: 4
+    rationale: ok
+  - criterion: diagnostic_primary
+    band: 4
+    rationale: ok
+"""
+
+
+def test_rescore_uses_stored_results_without_api_calls(monkeypatch, tmp_path):
+    input_dir = tmp_path / "in"
+    output_dir = tmp_path / "out"
+    input_dir.mkdir()
+    (input_dir / "student0.txt").write_text("word " * 800)
+    rubric = grader.load_rubric_config()
+
+    monkeypatch.setattr(grader, "INPUT_FOLDER", input_dir)
+    monkeypatch.setattr(grader, "OUTPUT_FOLDER", output_dir)
+    monkeypatch.setattr(grader, "load_api_key", lambda: "test-key")
+    monkeypatch.setattr(
+        grader, "load_master_prompt", lambda: "Grade:\n{{STUDENT_SUBMISSION_TEXT_HERE}}"
+    )
+    monkeypatch.setattr(grader, "load_rubric_config", lambda: rubric)
+    monkeypatch.setattr(grader, "review_grade", lambda *a, **k: "No issues found.")
+    monkeypatch.setattr(grader, "call_gemini_api", lambda prompt, api_key, **kwargs: GRADE_YAML)
+
+    grader.run_grading_process(max_concurrency=1)
+
+    [record] = result_store.iter_results(output_dir)
+    assert record["word_count"] == 800
+    assert record["model_response"] == GRADE_YAML
+    assert "assistant_grade" not in record["parsed_response"]
+    assert record["final_grade"]["total_points"] == 4 + 4 + 4 * 1
+
+    def no_api(*args, **kwargs):
+        raise AssertionError("rescoring must not call the API")
+
+    monkeypatch.setattr(grader, "call_gemini_api", no_api)
+    monkeypatch.setattr(grader, "review_grade", no_api)
+    edited = copy.deepcopy(rubric)
+    edited["criteria"]["symptom_analysis"]["max_points"] = 2
+    monkeypatch.setattr(grader, "load_rubric_config", lambda: edited)
+
+    assert grader.rebuild_from_stored_results(rescore=True) == [("student0", 2 + 4 + 4 * 1, "skipped")]
+    [record] = result_store.iter_results(output_dir)
+    assert record["final_grade"]["total_points"] == 10
+
+    # Re-rendering keeps the stored grade even though the rubric changed again.
+    monkeypatch.setattr(grader, "load_rubric_config", lambda: rubric)
+    assert grader.rebuild_from_stored_results(rescore=False) == [("student0", 10, "skipped")]
+
+
+def test_bigbraingrader_takes_the_rebuild_commands(monkeypatch):
+    import bigbraingrader
+
+    calls = []
+    monkeypatch.setattr(bigbraingrader, "run_grading_process", lambda **k: calls.append(("grade", k)))
+    monkeypatch.setattr(
+        bigbraingrader, "rebuild_from_stored_results", lambda **k: calls.append(("rebuild", k))
+    )
+
+    bigbraingrader.main([])
+    bigbraingrader.main(["rescore"])
+    bigbraingrader.main(["rerender"])
+
+    assert calls == [
+        ("grade", {"max_concurrency": None}),
+        ("rebuild", {"rescore": True}),
+        ("rebuild", {"rescore": False}),
+    ]
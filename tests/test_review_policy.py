@@ -0,0 +1,49 @@
+import grader
+import review_policy
+
+
+def _reply(**bands):
+    return {
+        "assistant_reasons": [
+            {"criterion": cid, "band": band, "confidence": 0.9} for cid, band in bands.items()
+        ]
+    }
+
+
+CLEAR = dict(
+    symptom_analysis=4,
+    bps_factors=4,
+    diagnostic_primary=5,
+    diagnostic_diff=4,
+    treatment=4,
+    communication=4,
+)
+
+
+def test_clear_cut_grades_skip_the_review():
+    rubric = dict(grader.load_rubric_config(), review_policy={"audit_rate": 0})
+    assert review_policy.review_triggers(_reply(**CLEAR), 1000, rubric, "key") == []
+
+
+def test_boundary_rule_and_confidence_trigger_a_review():
+    rubric = dict(grader.load_rubric_config(), review_policy={"audit_rate": 0})
+    triggers = review_policy.review_triggers(
+        _reply(**dict(CLEAR, diagnostic_primary=2)), 1000, rubric, "key"
+    )
+    assert triggers == ["boundary:diagnostic_primary=2", "rule:Primary diagnosis incorrect"]
+
+    assert review_policy.review_triggers(_reply(**CLEAR), 600, rubric, "key") == [
+        "rule:Word-count ceiling"
+    ]
+
+    unsure = _reply(**CLEAR)
+    unsure["assistant_reasons"][0]["confidence"] = 0.3
+    assert review_policy.review_triggers(unsure, 1000, rubric, "key") == [
+        "low_confidence:symptom_analysis"
+    ]
+
+
+def test_audit_sampling_is_stable_and_close_to_the_rate():
+    sampled = [review_policy.audit_sampled(f"submission-{i}", 0.1) for i in range(2000)]
+    assert 150 < sum(sampled) < 250
+    assert sampled == [review_policy.audit_sampled(f"submission-{i}", 0.1) for i in range(2000)]
@@ -0,0 +1,128 @@
+import copy
+
+import pytest
+import yaml
+
+import grader
+from rubric_engine import RubricError, compile_rubric
+
+
+def _rubric():
+    with open('rubric.yml') as f:
+        return yaml.safe_load(f)
+
+
+@pytest.mark.parametrize(
+    "condition",
+    [
+        "__import__('os').system('true')",
+        "word_count.bit_length() > 3",
+        "unknown_band < 3",
+        "diagnostic_primary_band <",
+        "[x for x in ()]",
+    ],
+)
+def test_unsafe_or_invalid_conditions_fail_at_load(condition):
+    rubric = _rubric()
+    rubric['rules'][0]['condition'] = condition
+    with pytest.raises(RubricError):
+        compile_rubric(rubric)
+
+
+def test_rules_must_target_known_criteria():
+    rubric = _rubric()
+    rubric['rules'][1]['target'] = 'treatmnet'
+    with pytest.raises(RubricError, match="treatmnet"):
+        compile_rubric(rubric)
+
+
+def test_load_rubric_config_rejects_bad_rules(monkeypatch, tmp_path):
+    rubric = _rubric()
+    rubric['rules'][0]['action'] = 'delete_band'
+    bad_path = tmp_path / 'rubric.yml'
+    bad_path.write_text(yaml.safe_dump(rubric))
+    monkeypatch.setattr(grader, 'RUBRIC_FILE', bad_path)
+    with pytest.raises(RubricError):
+        grader.load_rubric_config()
+
+
+def test_compiled_rubric_is_reused_and_rules_apply():
+    rubric = _rubric()
+    assert compile_rubric(rubric) is compile_rubric(rubric)
+
+    bands = dict.fromkeys(rubric['criteria'], 5)
+    bands['diagnostic_primary'] = 2
+    result = grader.calculate_final_grade(bands, 600, rubric)
+    assert result['breakdown']['communication'] == {'band': 2, 'points': 2}
+    assert result['breakdown']['treatment'] == {'band': 3, 'points': 3}
+    assert result['total_points'] == 5 + 5 + 2 + 5 + 3 + 2
+
+    # A fresh copy picks up rubric edits.
+    edited = copy.deepcopy(rubric)
+    edited['criteria']['treatment']['max_points'] = 2
+    assert grader.calculate_final_grade(bands, 600, edited)['breakdown']['treatment']['points'] == 2
+
+
+def test_cohort_scoring_matches_per_student_scoring():
+    import numpy as np
+
+    rubric = _rubric()
+    compiled = compile_rubric(rubric)
+    rng = np.random.default_rng(7)
+    band_matrix = rng.integers(1, 6, size=(200, len(compiled.criteria)))
+    word_counts = rng.integers(500, 1500, size=200)
+
+    cohort = compiled.score_cohort(band_matrix, word_counts)
+
+    for row, bands, word_count in zip(cohort.itertuples(), band_matrix.tolist(), word_counts.tolist()):
+        expected = compiled.score(dict(zip(compiled.criteria, bands)), word_count)
+        assert row.total_points == expected['total_points']
+        for cid in compiled.criteria:
+            assert getattr(row, f"{cid}_pts") == expected['breakdown'][cid]['points']
+        assert row.grade == compiled.grade_letter(expected['total_points'])
+
+    assert list(compiled.grade_letters([30, 24, 23, 14, 12, 11, 0])) == ['A', 'A', 'B', 'C', 'D', 'E', 'E']
+
+
+def test_later_rules_see_bands_changed_by_earlier_rules():
+    rubric = _rubric()
+    rubric['rules'].append(
+        {
+            "name": "Poor communication",
+            "condition": "communication_band < 3",
+            "action": "cap_points",
+            "target": "bps_factors",
+            "points": 2,
+        }
+    )
+    compiled = compile_rubric(rubric)
+    bands = dict.fromkeys(rubric['criteria'], 5)
+
+    assert compiled.fired_rules(bands, 600) == ["Word-count ceiling", "Poor communication"]
+    assert compiled.score(bands, 600)['breakdown']['bps_factors']['band'] == 2
+    assert compiled.fired_rules(bands, 1000) == []
+    cohort = compiled.score_cohort([[bands[cid] for cid in compiled.criteria]] * 2, [600, 1000])
+    assert list(cohort['bps_factors_pts']) == [2, 5]
+
+
+def test_missing_word_counts_do_not_fire_word_count_rules():
+    rubric = _rubric()
+    rubric['rules'].append(
+        {
+            "name": "Not long enough",
+            "condition": "not (word_count >= 750)",
+            "action": "cap_points",
+            "target": "communication",
+            "points": 1,
+        }
+    )
+    compiled = compile_rubric(rubric)
+    bands = dict.fromkeys(rubric['criteria'], 5)
+    row = [bands[cid] for cid in compiled.criteria]
+
+    cohort = compiled.score_cohort([row] * 2, [float('nan'), 500])
+
+    expected = compiled.score(bands, None)
+    assert cohort['total_points'][0] == expected['total_points']
+    assert cohort['communication_pts'][0] == expected['breakdown']['communication']['points'] == 5
+    assert cohort['communication_pts'][1] == 1
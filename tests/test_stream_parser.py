@@ -0,0 +1,86 @@
+import json
+
+import pytest
+
+import gemini_client
+import response_cache
+from rubric_engine import CompiledRubric
+from stream_parser import IncrementalGradeParser, StreamAborted
+
+RUBRIC = CompiledRubric({"criteria": {"a": {"name": "Alpha"}, "b": {"name": "Beta"}}})
+
+
+def _chunks(text, size=7):
+    return [text[i : i + size] for i in range(0, len(text), size)]
+
+
+def test_json_entries_are_emitted_as_they_complete():
+    reply = json.dumps(
+        {
+            "assistant_reasons": [
+                {"criterion": "a", "band": 4, "rationale": 'says "}" here'},
+                {"criterion": "b", "band": 2, "rationale": "ok"},
+            ]
+        }
+    )
+    seen = []
+    parser = IncrementalGradeParser(RUBRIC, on_criterion=seen.append)
+    first_seen_at = None
+    for i, chunk in enumerate(_chunks(reply)):
+        parser.feed(chunk)
+        if seen and first_seen_at is None:
+            first_seen_at = i
+    parser.finish(reply)
+    assert [(item["criterion"], item["band"]) for item in seen] == [("a", 4), ("b", 2)]
+    assert first_seen_at < len(_chunks(reply)) - 5  # well before the reply ended
+
+
+def test_yaml_entries_are_emitted_with_the_last_one_on_finish():
+    reply = (
+        "```yaml\nassistant_reasons:\n  - criterion: Alpha\n    band: 5\n    rationale: ok\n"
+        "  - criterion: b\n    band: 3\n    rationale: fine\n```"
+    )
+    parser = IncrementalGradeParser(RUBRIC)
+    emitted = []
+    for chunk in _chunks(reply):
+        emitted.extend(parser.feed(chunk))
+    assert [item["band"] for item in emitted] == [5]
+    assert [item["band"] for item in parser.finish()] == [3]
+
+
+@pytest.mark.parametrize(
+    "reply, reason",
+    [
+        ("I am sorry, " * 300, "no assistant_reasons"),
+        ("assistant_reasons:\n  - criterion: zeta\n    band: 3\n  - criterion: a\n", "unknown criterion"),
+        ("assistant_reasons:\n  - criterion: a\n    band: 3\n  - criterion: a\n    band: 2\n  - criterion: b\n", "twice"),
+    ],
+)
+def test_off_the_rails_replies_abort(reply, reason):
+    parser = IncrementalGradeParser(RUBRIC)
+    with pytest.raises(StreamAborted, match=reason):
+        for chunk in _chunks(reply):
+            parser.feed(chunk)
+
+
+def test_abort_stops_consuming_the_stream(monkeypatch):
+    monkeypatch.setattr(response_cache, "RESPONSE_CACHE_ENABLED", False)
+    consumed = []
+
+    class Chunk:
+        def __init__(self, text):
+            self.text = text
+
+    class FakeModel:
+        def generate_content(self, contents, stream=False):
+            assert stream
+            for piece in ["assistant_reasons:\n", "  - criterion: zeta\n    band: 1\n", "  - criterion: a\n"]:
+                consumed.append(piece)
+                yield Chunk(piece)
+            raise AssertionError("stream should have been abandoned")
+
+    monkeypatch.setattr(gemini_client, "get_model", lambda *a, **k: FakeModel())
+    parser = IncrementalGradeParser(RUBRIC)
+    with pytest.raises(StreamAborted):
+        gemini_client.generate_text("grade this", "key", "flash", on_chunk=parser.feed)
+    assert len(consumed) == 3
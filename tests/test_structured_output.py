@@ -0,0 +1,43 @@
+import json
+
+import grader
+import structured_output
+
+
+def test_schema_lists_rubric_criteria():
+    rubric = grader.load_rubric_config()
+    schema = structured_output.grading_response_schema(rubric)
+    reason = schema["properties"]["assistant_reasons"]["items"]
+    assert reason["properties"]["criterion"]["enum"] == list(rubric["criteria"])
+    config = structured_output.json_generation_config(schema)
+    assert config["response_mime_type"] == "application/json"
+
+
+def test_json_reply_is_parsed_on_the_fast_path(monkeypatch):
+    reply = json.dumps(
+        {"assistant_reasons": [{"criterion": "treatment", "band": "4", "rationale": "ok"}]}
+    )
+
+    def no_yaml(text):
+        raise AssertionError("JSON replies should not reach the YAML parser")
+
+    monkeypatch.setattr(grader, "load_yaml", no_yaml)
+    parsed = grader.parse_gemini_yaml_response(reply)
+    assert parsed["assistant_reasons"][0]["band"] == 4
+
+
+def test_yaml_fallback_still_parses_fenced_replies():
+    reply = '```yaml\nassistant_reasons:\n  - criterion: treatment\n    band: 3\n    rationale: "A "quoted" word"\n```'
+    parsed = grader.parse_gemini_yaml_response(reply)
+    assert parsed["assistant_reasons"][0]["rationale"] == 'A "quoted" word'
+
+
+def test_structured_review_adjustments_replace_the_regex():
+    review = json.dumps(
+        {
+            "issues": ["Treatment graded too harshly."],
+            "adjustments": [{"criterion": "treatment", "band": 4, "reason": "CBTp is evidence-based"}],
+        }
+    )
+    assert grader.extract_criteria_adjustments(review) == {"treatment": 4}
+    assert grader.extract_criteria_adjustments("ADJUSTMENT: treatment -> 2") == {"treatment": 2}
@@ -0,0 +1,183 @@
+import os
+
+import pytest
+from docx import Document as DocxDocument
+
+import text_extraction
+
+
+def test_warm_extraction_skips_parsing(monkeypatch, tmp_path):
+    path = tmp_path / "essay.docx"
+    doc = DocxDocument()
+    doc.core_properties.author = "A. Student"
+    doc.add_paragraph("Sam shows symptoms of psychosis.")
+    doc.save(path)
+
+    first = text_extraction.extract_submission(path)
+    assert first == {
+        "text": "Sam shows symptoms of psychosis.",
+        "author": "A. Student",
+        "word_count": 5,
+    }
+
+    def fail(_):
+        raise AssertionError("should have used the extraction cache")
+
+    monkeypatch.setattr(text_extraction, "_parse_file", fail)
+    assert text_extraction.extract_text_from_file(path) == (first["text"], "A. Student")
+    assert text_extraction.get_extraction_cache().hits == 1
+
+
+def test_cache_is_keyed_by_content_and_version(tmp_path):
+    path = tmp_path / "essay.txt"
+    path.write_text("first draft")
+    assert text_extraction.extract_text_from_file(path) == ("first draft", None)
+
+    path.write_text("second draft, longer")
+    assert text_extraction.extract_text_from_file(path)[0] == "second draft, longer"
+
+    newer = text_extraction.ExtractionCache(tmp_path / "extraction_cache", version=99)
+    assert newer.get(text_extraction.file_fingerprint(path)) is None
+
+
+def test_pool_times_out_stuck_files_without_blocking_others(monkeypatch, tmp_path):
+    monkeypatch.setattr(text_extraction, "EXTRACTION_CACHE_ENABLED", False)
+    stuck = tmp_path / "stuck.txt"
+    os.mkfifo(stuck)  # reading a FIFO with no writer blocks forever
+    ok = tmp_path / "ok.txt"
+    ok.write_text("a normal essay")
+
+    with text_extraction.ExtractionPool(max_workers=2, timeout=2) as pool:
+        stuck_future = pool.submit(stuck)
+        ok_future = pool.submit(ok)
+        assert ok_future.result() == ("a normal essay", None)
+        assert stuck_future.result() == (None, None)
+
+
+def test_pool_reuses_worker_processes(monkeypatch, tmp_path):
+    monkeypatch.setattr(text_extraction, "EXTRACTION_CACHE_ENABLED", False)
+    started = []
+
+    class CountingWorker(text_extraction._ExtractionWorker):
+        def __init__(self, *args):
+            super().__init__(*args)
+            started.append(self.process.pid)
+
+    monkeypatch.setattr(text_extraction, "_ExtractionWorker", CountingWorker)
+    paths = []
+    for i in range(4):
+        paths.append(tmp_path / f"essay{i}.txt")
+        paths[-1].write_text(f"essay number {i}")
+
+    with text_extraction.ExtractionPool(max_workers=1) as pool:
+        results = [pool.submit(path).result() for path in paths]
+    assert results == [(f"essay number {i}", None) for i in range(4)]
+    assert len(started) == 1
+
+
+def test_worker_log_messages_reach_the_parent_log(monkeypatch, tmp_path, caplog):
+    monkeypatch.setattr(text_extraction, "EXTRACTION_CACHE_ENABLED", False)
+    broken = tmp_path / "broken.docx"
+    broken.write_text("not a zip archive")
+
+    with text_extraction.ExtractionPool(max_workers=1) as pool:
+        assert pool.submit(broken).result() == (None, None)
+
+    messages = [(record.levelname, record.getMessage()) for record in caplog.records]
+    assert any(level == "WARNING" and "Fast DOCX extraction failed" in m for level, m in messages)
+    assert any(level == "ERROR" and f"Error extracting text from {broken}" in m for level, m in messages)
+
+
+def test_memory_errors_reach_the_worker(monkeypatch, tmp_path):
+    path = tmp_path / "huge.txt"
+    path.write_text("text")
+
+    def exhausted(text):
+        raise MemoryError
+
+    monkeypatch.setattr(text_extraction, "normalize_whitespace", exhausted)
+    with pytest.raises(MemoryError):
+        text_extraction._parse_file(path)
+
+
+def _write_text_pdf(path, pages):
+    """Write a minimal PDF with one line of Helvetica text per page."""
+    objects = ["<< /Type /Catalog /Pages 2 0 R >>", None]
+    page_ids = []
+    for text in pages:
+        stream = f"BT /F1 12 Tf 72 720 Td ({text}) Tj ET".encode()
+        content_id = len(objects) + 1
+        objects.append(b"<< /Length %d >>\nstream\n" % len(stream) + stream + b"\nendstream")
+        page_ids.append(len(objects) + 1)
+        objects.append(
+            f"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 612 792] /Contents {content_id} 0 R "
+            "/Resources << /Font << /F1 << /Type /Font /Subtype /Type1 /BaseFont /Helvetica >> >> >> >>"
+        )
+    kids = " ".join(f"{i} 0 R" for i in page_ids)
+    objects[1] = f"<< /Type /Pages /Kids [{kids}] /Count {len(page_ids)} >>"
+
+    out = bytearray(b"%PDF-1.4\n")
+    offsets = []
+    for number, body in enumerate(objects, start=1):
+        offsets.append(len(out))
+        body = body.encode() if isinstance(body, str) else body
+        out += b"%d 0 obj\n" % number + body + b"\nendobj\n"
+    xref = len(out)
+    out += b"xref\n0 %d\n0000000000 65535 f \n" % (len(objects) + 1)
+    for offset in offsets:
+        out += b"%010d 00000 n \n" % offset
+    out += b"trailer\n<< /Size %d /Root 1 0 R >>\nstartxref\n%d\n%%%%EOF\n" % (len(objects) + 1, xref)
+    path.write_bytes(bytes(out))
+
+
+def test_pdf_pages_stream_with_page_cap_and_word_budget(monkeypatch, tmp_path):
+    path = tmp_path / "portfolio.pdf"
+    _write_text_pdf(path, ["page one text", "page two text", "page three text"])
+
+    assert list(text_extraction.iter_pdf_pages(path)) == [
+        "page one text",
+        "page two text",
+        "page three text",
+    ]
+    assert text_extraction.extract_text_from_pdf(path, max_pages=2) == "page one text\npage two text"
+    assert text_extraction.extract_text_from_pdf(path, word_budget=4) == "page one text\npage two text"
+
+    normalized = []
+    real_normalize = text_extraction.normalize_whitespace
+    monkeypatch.setattr(
+        text_extraction, "normalize_whitespace", lambda text: normalized.append(text) or real_normalize(text)
+    )
+    assert text_extraction.extract_text_from_file(path) == (
+        "page one text\npage two text\npage three text",
+        None,
+    )
+    # Each page is normalised once; the joined document is not re-scanned.
+    assert len(normalized) == 3
+
+
+def test_docx_text_keeps_document_order_and_merged_cells_once(tmp_path):
+    path = tmp_path / "tables.docx"
+    doc = DocxDocument()
+    doc.core_properties.author = "A. Student"
+    doc.add_paragraph("Before the table")
+    table = doc.add_table(rows=2, cols=3)
+    merged = table.cell(0, 0).merge(table.cell(0, 2))
+    merged.text = "Merged header"
+    table.cell(1, 0).text = "Symptom"
+    table.cell(1, 2).text = "Evidence"
+    doc.add_paragraph("After the table")
+    doc.save(path)
+
+    # python-docx repeats merged cells and appends tables after the body text
+    legacy = text_extraction.extract_text_from_docx(DocxDocument(path))
+    assert legacy.count("Merged header") == 3
+
+    text, author = text_extraction.extract_docx_fast(path)
+    assert text.split("\n") == [
+        "Before the table",
+        "Merged header",
+        "Symptom",
+        "Evidence",
+        "After the table",
+    ]
+    assert author == "A. Student"
@@ -0,0 +1,67 @@
+import json
+import pstats
+
+import pytest
+
+import tracing
+from tracing import Tracer, percentile
+
+
+def _spans(folder):
+    lines = (folder / tracing.TRACE_FILE).read_text().splitlines()
+    return [json.loads(line) for line in lines]
+
+
+def test_stage_spans_nest_under_the_submission_span(tmp_path):
+    tracer = Tracer()
+    trace_id = tracer.start_run(tmp_path, profile=False)
+    with tracer.span("submission", submission="alice"):
+        with tracer.span("parse"):
+            pass
+        with pytest.raises(ValueError):
+            with tracer.span("render", pages=2):
+                raise ValueError("boom")
+    tracer.close()
+
+    spans = {span["name"]: span for span in _spans(tmp_path)}
+    assert {span["trace_id"] for span in spans.values()} == {trace_id}
+    root = spans["submission"]
+    assert root["parent_id"] is None
+    assert spans["parse"]["parent_id"] == root["span_id"]
+    assert spans["parse"]["submission"] == "alice"
+    assert spans["render"]["status"] == "error: ValueError"
+    assert spans["render"]["attributes"] == {"pages": 2}
+
+
+def test_summary_reports_p50_and_p95_per_stage(tmp_path):
+    tracer = Tracer()
+    tracer.start_run(tmp_path, profile=False)
+    tracer.durations = {"grade_call": [float(n) for n in range(1, 21)]}
+
+    stats = tracer.stage_latencies()["grade_call"]
+    assert (stats["count"], stats["p50"], stats["p95"], stats["max"]) == (20, 10.0, 19.0, 20.0)
+    assert "grade_call" in tracer.summary()
+    assert percentile([], 95) == 0.0
+    tracer.close()
+
+
+def test_profiled_stages_are_dumped_per_stage(tmp_path):
+    tracer = Tracer()
+    tracer.start_run(tmp_path, profile=True)
+    for _ in range(2):
+        with tracer.span("score"):
+            sum(i * i for i in range(1000))
+    with tracer.span("grade_call"):
+        pass
+    tracer.close()
+
+    profile_dir = tmp_path / tracing.PROFILE_DIR
+    assert [p.name for p in profile_dir.iterdir()] == ["score.prof"]
+    assert pstats.Stats(str(profile_dir / "score.prof")).total_calls > 0
+
+
+def test_spans_are_no_ops_outside_a_run():
+    tracer = Tracer()
+    with tracer.span("parse") as attributes:
+        attributes["ignored"] = True
+    assert tracer.durations == {}
@@ -0,0 +1,489 @@
+"""Submission text extraction shared by the graders, draft grader and app.
+
+``extract_text_from_file`` parses DOCX, PDF and plain-text submissions. Results
+are stored in a persistent cache keyed by the SHA-256 of the file's contents
+and ``EXTRACTOR_VERSION``, together with the author metadata and word count,
+so the draft, grade and review passes reuse one extraction and warm reruns
+never touch python-docx or PyPDF2. Bump ``EXTRACTOR_VERSION`` whenever the
+extraction output changes so stale entries are ignored.
+"""
+
+import json
+import logging
+import mmap
+import multiprocessing
+import os
+import queue
+import re
+import threading
+import xml.etree.ElementTree as ET
+import zipfile
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+from docx import Document as DocxDocument
+
+from response_cache import file_fingerprint
+
+try:
+    import PyPDF2
+except ImportError:  # PDF support is optional
+    PyPDF2 = None
+
+try:
+    import resource
+except ImportError:  # Not available on Windows; the memory ceiling is skipped
+    resource = None
+
+EXTRACTOR_VERSION = 3
+EXTRACTION_CACHE_DIR = Path(".extraction_cache")
+# Set to False to always re-parse submissions.
+EXTRACTION_CACHE_ENABLED = True
+# Optional limits for long PDFs: stop after this many pages or once this many
+# words have been extracted. ``None`` reads the whole document.
+PDF_MAX_PAGES = None
+PDF_WORD_BUDGET = None
+# Limits applied to each extraction worker process by ``ExtractionPool``.
+EXTRACTION_TIMEOUT_SECONDS = 60
+EXTRACTION_MEMORY_LIMIT_MB = 1024
+
+
+def extract_text_from_docx(doc):
+    """Extract text from paragraphs and tables in a DOCX Document."""
+    text_parts = []
+    for para in doc.paragraphs:
+        if para.text:
+            text_parts.append(para.text)
+    for table in doc.tables:
+        for row in table.rows:
+            for cell in row.cells:
+                for para in cell.paragraphs:
+                    if para.text:
+                        text_parts.append(para.text)
+    return "\n".join(text_parts)
+
+
+_W = "{http://schemas.openxmlformats.org/wordprocessingml/2006/main}"
+_DC_CREATOR = "{http://purl.org/dc/elements/1.1/}creator"
+_MC_FALLBACK = "{http://schemas.openxmlformats.org/markup-compatibility/2006}Fallback"
+# Content that python-docx does not treat as body text (text boxes, and the
+# duplicate fallback copy of alternate content).
+_SKIPPED_CONTAINERS = {_W + "txbxContent", _MC_FALLBACK}
+_RUN_CHARACTERS = {_W + "tab": "\t", _W + "ptab": "\t", _W + "cr": "\n", _W + "noBreakHyphen": "-"}
+
+
+def _docx_core_author(archive):
+    """Return ``dc:creator`` from ``docProps/core.xml``, or ``None``."""
+    try:
+        with archive.open("docProps/core.xml") as f:
+            creator = ET.parse(f).getroot().find(_DC_CREATOR)
+    except KeyError:
+        return None
+    if creator is None or not (creator.text or "").strip():
+        return None
+    return creator.text.strip()
+
+
+def extract_docx_fast(filepath):
+    """Extract ``(text, author)`` from a DOCX by streaming ``word/document.xml``.
+
+    Paragraphs are emitted in document order, including those inside tables,
+    and each table cell is visited once so merged cells are not repeated.
+    """
+    with zipfile.ZipFile(filepath) as archive:
+        doc_author = _docx_core_author(archive)
+        text_parts = []
+        paragraph_stack = []
+        run_depth = 0
+        skip_depth = 0
+        with archive.open("word/document.xml") as f:
+            for event, elem in ET.iterparse(f, events=("start", "end")):
+                tag = elem.tag
+                if tag in _SKIPPED_CONTAINERS:
+                    skip_depth += 1 if event == "start" else -1
+                    continue
+                if skip_depth:
+                    continue
+                if event == "start":
+                    if tag == _W + "p":
+                        paragraph_stack.append([])
+                    elif tag == _W + "r":
+                        run_depth += 1
+                    continue
+
+                if tag == _W + "p":
+                    paragraph_text = "".join(paragraph_stack.pop())
+                    if paragraph_text:
+                        text_parts.append(paragraph_text)
+                    elem.clear()
+                elif tag == _W + "r":
+                    run_depth -= 1
+                elif run_depth and paragraph_stack:
+                    if tag == _W + "t":
+                        paragraph_stack[-1].append(elem.text or "")
+                    elif tag == _W + "br":
+                        if elem.get(_W + "type", "textWrapping") == "textWrapping":
+                            paragraph_stack[-1].append("\n")
+                    elif tag in _RUN_CHARACTERS:
+                        paragraph_stack[-1].append(_RUN_CHARACTERS[tag])
+    return "\n".join(text_parts), doc_author
+
+
+def normalize_whitespace(text):
+    """Collapse runs of three or more whitespace characters into a blank line."""
+    return re.sub(r"\s{3,}", "\n\n", text).strip()
+
+
+def iter_pdf_pages(filepath, max_pages=None):
+    """Yield the whitespace-normalised text of each PDF page.
+
+    The file is memory-mapped rather than read into memory, pages without
+    extractable text are skipped, and iteration stops after ``max_pages``.
+    """
+    with open(filepath, "rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+        reader = PyPDF2.PdfReader(mapped)
+        if reader.is_encrypted:
+            logging.warning(
+                f"PDF '{filepath}' is encrypted. Attempting to read anyway if default password allows."
+            )
+        for page_num, page in enumerate(reader.pages):
+            if max_pages is not None and page_num >= max_pages:
+                logging.info(f"Stopped reading {filepath} after {max_pages} pages.")
+                return
+            try:
+                page_text = page.extract_text()
+            except Exception as page_e:
+                logging.warning(
+                    f"Could not extract text from page {page_num + 1} of {filepath}: {page_e}"
+                )
+                continue
+            page_text = normalize_whitespace(page_text or "")
+            if page_text:  # Ensure text was actually extracted
+                yield page_text
+
+
+def extract_text_from_pdf(filepath, max_pages=None, word_budget=None):
+    """Extract PDF text page by page, joining once at the end.
+
+    Reading stops early once ``word_budget`` words have been collected.
+    """
+    pages = []
+    word_count = 0
+    for page_text in iter_pdf_pages(filepath, max_pages=max_pages):
+        pages.append(page_text)
+        word_count += len(page_text.split())
+        if word_budget is not None and word_count >= word_budget:
+            logging.info(f"Stopped reading {filepath} at the {word_budget}-word budget.")
+            break
+    return "\n".join(pages)
+
+
+def _parse_file(filepath):
+    """Parse ``filepath`` and return ``(text, author)`` without using the cache."""
+    extension = filepath.suffix
+    text = ""
+    doc_author = None
+    try:
+        if extension.lower() == ".docx":
+            try:
+                text, doc_author = extract_docx_fast(filepath)
+            except (zipfile.BadZipFile, KeyError, ET.ParseError) as fast_e:
+                logging.warning(
+                    f"Fast DOCX extraction failed for {filepath} ({fast_e}); using python-docx."
+                )
+                doc = DocxDocument(filepath)
+                doc_author = doc.core_properties.author or None
+                text = extract_text_from_docx(doc)
+            text = normalize_whitespace(text)
+        elif extension.lower() == ".pdf":
+            if PyPDF2 is None:
+                logging.error(
+                    "PyPDF2 library is not installed. Please install it to process PDF files: pip install PyPDF2"
+                )
+                return None, None
+            if filepath.stat().st_size == 0:  # mmap cannot map an empty file
+                logging.warning(f"No text extracted or file is empty: {filepath}")
+                return None, None
+            # Pages are already whitespace-normalised by ``iter_pdf_pages``.
+            text = extract_text_from_pdf(
+                filepath, max_pages=PDF_MAX_PAGES, word_budget=PDF_WORD_BUDGET
+            )
+        else:  # Attempt plain text for other files
+            logging.info(f"Attempting to read '{filepath}' as plain text.")
+            with open(filepath, "r", encoding="utf-8", errors="ignore") as f:
+                text = normalize_whitespace(f.read())
+
+        if not text:
+            logging.warning(f"No text extracted or file is empty: {filepath}")
+            return None, None
+        return text, doc_author
+
+    except FileNotFoundError:
+        logging.error(f"File not found: {filepath}")
+        return None, None
+    except MemoryError:
+        raise  # reported by the extraction worker that hit its memory ceiling
+    except Exception as e:
+        if PyPDF2 is not None and isinstance(e, PyPDF2.errors.PdfReadError):
+            logging.error(
+                f"Could not read PDF (possibly corrupted or password protected): {filepath}"
+            )
+            return None, None
+        logging.error(f"Error extracting text from {filepath}: {e}")
+        return None, None
+
+
+class ExtractionCache:
+    """Persistent store of extracted text keyed by file content and extractor version."""
+
+    def __init__(self, directory=EXTRACTION_CACHE_DIR, version=EXTRACTOR_VERSION):
+        self.directory = Path(directory)
+        self.version = version
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+
+    def _path_for(self, content_hash):
+        return self.directory / f"{content_hash}-v{self.version}.json"
+
+    def get(self, content_hash):
+        """Return the cached ``{"text", "author", "word_count"}`` entry or ``None``."""
+        try:
+            entry = json.loads(self._path_for(content_hash).read_text(encoding="utf-8"))
+        except FileNotFoundError:
+            entry = None
+        except Exception as e:
+            logging.warning(f"Ignoring unreadable extraction cache entry for {content_hash}: {e}")
+            entry = None
+        with self._lock:
+            if entry is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+        return entry
+
+    def put(self, content_hash, text, author):
+        """Store an extraction result."""
+        entry = {"text": text, "author": author, "word_count": len(text.split())}
+        path = self._path_for(content_hash)
+        try:
+            path.parent.mkdir(parents=True, exist_ok=True)
+            tmp_path = path.with_suffix(f".{os.getpid()}.{threading.get_ident()}.tmp")
+            tmp_path.write_text(json.dumps(entry), encoding="utf-8")
+            os.replace(tmp_path, path)
+        except Exception as e:
+            logging.warning(f"Could not write extraction cache entry {path}: {e}")
+        return entry
+
+
+_shared_cache = ExtractionCache()
+
+
+def get_extraction_cache():
+    """Return the process-wide extraction cache."""
+    return _shared_cache
+
+
+def extract_submission(filepath):
+    """Return ``{"text", "author", "word_count"}`` for a submission, or ``None``.
+
+    Extraction results are served from the extraction cache when the file's
+    contents have been seen before.
+    """
+    filepath = Path(filepath)
+    content_hash = file_fingerprint(filepath) if EXTRACTION_CACHE_ENABLED else None
+    if content_hash:
+        entry = get_extraction_cache().get(content_hash)
+        if entry is not None:
+            logging.info(f"Using cached text extraction for {filepath.name}.")
+            return entry
+
+    text, doc_author = _parse_file(filepath)
+    if not text:
+        return None
+    if content_hash:
+        return get_extraction_cache().put(content_hash, text, doc_author)
+    return {"text": text, "author": doc_author, "word_count": len(text.split())}
+
+
+def extract_text_from_file(filepath):
+    """Extracts text and author metadata from supported files.
+
+    Returns a tuple ``(text, author)`` where ``author`` may be ``None`` if not
+    available; both are ``None`` if extraction failed.
+    """
+    entry = extract_submission(filepath)
+    if entry is None:
+        return None, None
+    return entry["text"], entry["author"]
+
+
+class _LogCollector(logging.Handler):
+    """Keep ``(level, message)`` for the records a worker logs for one file."""
+
+    def __init__(self):
+        super().__init__()
+        self.records = []
+
+    def emit(self, record):
+        self.records.append((record.levelno, record.getMessage()))
+
+    def drain(self):
+        records, self.records = self.records, []
+        return records
+
+
+def _extraction_worker(conn, memory_limit_bytes):
+    """Worker-process entry point: parse the files sent over ``conn`` until ``None``.
+
+    The memory ceiling is applied once when the worker starts. Whatever
+    ``_parse_file`` logs is sent back with each result, so the parent writes
+    it to its own log.
+    """
+    if resource is not None and memory_limit_bytes:
+        try:
+            resource.setrlimit(resource.RLIMIT_AS, (memory_limit_bytes, memory_limit_bytes))
+        except (ValueError, OSError):
+            pass
+    collector = _LogCollector()
+    root = logging.getLogger()
+    root.handlers = [collector]
+    root.setLevel(logging.INFO)
+    try:
+        while True:
+            filepath = conn.recv()
+            if filepath is None:
+                return
+            try:
+                text, doc_author = _parse_file(Path(filepath))
+            except MemoryError:
+                # The heap may be unusable now; report and let the pool replace us.
+                conn.send(
+                    {"error": "exceeded the extraction memory limit", "logs": collector.drain()}
+                )
+                return
+            conn.send({"text": text, "author": doc_author, "logs": collector.drain()})
+    except EOFError:
+        return
+    finally:
+        conn.close()
+
+
+class _ExtractionWorker:
+    """A long-lived worker process and the pipe used to talk to it."""
+
+    def __init__(self, context, memory_limit_bytes):
+        self.conn, child_conn = context.Pipe()
+        self.process = context.Process(
+            target=_extraction_worker, args=(child_conn, memory_limit_bytes), daemon=True
+        )
+        self.process.start()
+        child_conn.close()
+
+    def kill(self):
+        if self.process.is_alive():
+            self.process.terminate()
+        self.process.join()
+        self.conn.close()
+
+    def close(self):
+        try:
+            self.conn.send(None)
+            self.process.join(timeout=5)
+        except (OSError, ValueError):
+            pass
+        self.kill()
+
+
+class ExtractionPool:
+    """Extract submissions in worker processes ahead of the API stage.
+
+    Up to ``max_workers`` long-lived worker processes parse files, so the
+    python-docx/PyPDF2 imports and process start-up are paid once per worker
+    rather than once per file. Each worker runs under an address-space
+    ceiling, and a file that exceeds the wall-clock timeout gets its worker
+    killed and replaced, so a pathological PDF cannot stall the batch. (A
+    ``ProcessPoolExecutor`` cannot cancel one running task, hence the
+    dedicated workers.) :meth:`submit` returns a future resolving to
+    ``(text, author)``, or ``(None, None)`` on failure, exactly like
+    :func:`extract_text_from_file`. Cached extractions are returned without
+    touching a worker.
+    """
+
+    def __init__(
+        self,
+        max_workers=None,
+        timeout=EXTRACTION_TIMEOUT_SECONDS,
+        memory_limit_mb=EXTRACTION_MEMORY_LIMIT_MB,
+    ):
+        self.timeout = timeout
+        self.memory_limit_bytes = int(memory_limit_mb * 1024 * 1024) if memory_limit_mb else None
+        # The parent holds API client threads, so workers are not plain forks.
+        self._context = multiprocessing.get_context(
+            "forkserver" if "forkserver" in multiprocessing.get_all_start_methods() else "spawn"
+        )
+        self._idle = queue.SimpleQueue()
+        self._executor = ThreadPoolExecutor(
+            max_workers=max_workers or os.cpu_count() or 1,
+            thread_name_prefix="extract",
+        )
+
+    def submit(self, filepath):
+        """Schedule extraction of ``filepath`` and return a future."""
+        return self._executor.submit(self._extract, Path(filepath))
+
+    def _checkout(self):
+        try:
+            return self._idle.get_nowait()
+        except queue.Empty:
+            return _ExtractionWorker(self._context, self.memory_limit_bytes)
+
+    def _extract(self, filepath):
+        content_hash = file_fingerprint(filepath) if EXTRACTION_CACHE_ENABLED else None
+        if content_hash:
+            entry = get_extraction_cache().get(content_hash)
+            if entry is not None:
+                return entry["text"], entry["author"]
+
+        worker = self._checkout()
+        try:
+            worker.conn.send(str(filepath))
+            if not worker.conn.poll(self.timeout):
+                logging.error(
+                    f"Text extraction timed out after {self.timeout}s: {filepath}"
+                )
+                worker.kill()
+                return None, None
+            result = worker.conn.recv()
+        except (EOFError, OSError):
+            worker.kill()
+            logging.error(
+                f"Text extraction worker exited unexpectedly (exit code {worker.process.exitcode}): {filepath}"
+            )
+            return None, None
+
+        for level, message in result.get("logs", ()):
+            logging.log(level, message)
+        if "error" in result:
+            worker.kill()
+            logging.error(f"Error extracting text from {filepath}: {result['error']}")
+            return None, None
+        self._idle.put(worker)
+        text, doc_author = result["text"], result["author"]
+        if text and content_hash:
+            get_extraction_cache().put(content_hash, text, doc_author)
+        return text, doc_author
+
+    def shutdown(self):
+        self._executor.shutdown(wait=True)
+        while True:
+            try:
+                self._idle.get_nowait().close()
+            except queue.Empty:
+                break
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.shutdown()
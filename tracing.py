@@ -0,0 +1,221 @@
+"""Lightweight per-submission tracing of the grading pipeline.
+
+Each run gets a trace ID. ``run_grading_process`` opens a ``submission`` span
+per file, and the stages inside it (extraction, prompt construction, the
+Gemini call, parsing, scoring, review, rendering) open child spans with
+:func:`span`. Finished spans are appended to ``<output folder>/trace.jsonl``,
+one JSON object per line::
+
+    {"trace_id": ..., "span_id": ..., "parent_id": ..., "name": "parse",
+     "submission": "alice", "start": 1718000000.1, "duration_ms": 12.3,
+     "status": "ok", "attributes": {}}
+
+and :meth:`Tracer.summary` reports the p50/p95 latency of every stage at the
+end of the run.
+
+With ``GRADER_PROFILE=1`` in the environment, the CPU-bound stages listed in
+``PROFILED_STAGES`` also run under ``cProfile``. Only one span is profiled at
+a time (the profiler cannot be nested or shared between threads), and the
+stats are merged per stage into ``<output folder>/profiles/<stage>.prof`` for
+``python -m pstats`` or snakeviz.
+"""
+
+import cProfile
+import json
+import logging
+import math
+import os
+import pstats
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from pathlib import Path
+
+TRACE_FILE = "trace.jsonl"
+PROFILE_DIR = "profiles"
+PROFILE_ENABLED = os.getenv("GRADER_PROFILE", "").lower() in ("1", "true", "yes")
+# Extraction only shows up here when it runs inline rather than in the pool.
+PROFILED_STAGES = ("extract", "build_prompt", "parse", "score", "render")
+
+
+def percentile(values, pct):
+    """Return the nearest-rank ``pct`` percentile of ``values`` (0 if empty)."""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    rank = max(1, math.ceil(pct / 100 * len(ordered)))
+    return ordered[rank - 1]
+
+
+class Tracer:
+    """Collects spans for one run and writes them as JSON lines."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self._profile_lock = threading.Lock()
+        self._file = None
+        self.trace_id = None
+        self.output_folder = None
+        self.profile = False
+        self.durations = {}
+        self._profiles = {}
+
+    def start_run(self, output_folder, profile=None):
+        """Begin a new trace, truncating ``<output_folder>/trace.jsonl``.
+
+        ``profile`` overrides ``PROFILE_ENABLED``. Returns the trace ID.
+        """
+        self.close()
+        with self._lock:
+            self.trace_id = uuid.uuid4().hex
+            self.output_folder = Path(output_folder)
+            self.profile = PROFILE_ENABLED if profile is None else profile
+            self.durations = {}
+            self._profiles = {}
+            try:
+                self.output_folder.mkdir(parents=True, exist_ok=True)
+                self._file = open(self.output_folder / TRACE_FILE, "w", encoding="utf-8")
+            except OSError as e:
+                logging.error(f"Cannot write trace file in {self.output_folder}: {e}")
+                self._file = None
+        logging.info(f"Tracing run {self.trace_id}.")
+        return self.trace_id
+
+    def _stack(self):
+        stack = getattr(self._local, "stack", None)
+        if stack is None:
+            stack = self._local.stack = []
+        return stack
+
+    @contextmanager
+    def span(self, name, submission=None, **attributes):
+        """Time the enclosed block as a span named ``name``.
+
+        ``submission`` defaults to that of the enclosing span. Extra keyword
+        arguments are stored as span attributes; the yielded dict can be used
+        to add more while the span is open.
+        """
+        if self.trace_id is None:
+            yield attributes
+            return
+        stack = self._stack()
+        parent_id, parent_submission = stack[-1] if stack else (None, None)
+        span_id = uuid.uuid4().hex[:16]
+        submission = submission if submission is not None else parent_submission
+        stack.append((span_id, submission))
+        profiler = self._start_profile(name)
+        status = "ok"
+        start = time.time()
+        started = time.perf_counter()
+        try:
+            yield attributes
+        except BaseException as e:
+            status = f"error: {type(e).__name__}"
+            raise
+        finally:
+            duration = time.perf_counter() - started
+            self._stop_profile(name, profiler)
+            stack.pop()
+            self._record(
+                {
+                    "trace_id": self.trace_id,
+                    "span_id": span_id,
+                    "parent_id": parent_id,
+                    "name": name,
+                    "submission": submission,
+                    "start": round(start, 6),
+                    "duration_ms": round(duration * 1000, 3),
+                    "status": status,
+                    "attributes": attributes,
+                }
+            )
+
+    def _record(self, record):
+        with self._lock:
+            self.durations.setdefault(record["name"], []).append(record["duration_ms"] / 1000)
+            if self._file is not None:
+                self._file.write(json.dumps(record, default=str) + "\n")
+                self._file.flush()
+
+    def _start_profile(self, name):
+        if not self.profile or name not in PROFILED_STAGES:
+            return None
+        if not self._profile_lock.acquire(blocking=False):
+            return None  # another span is already being profiled
+        profiler = cProfile.Profile()
+        try:
+            profiler.enable()
+        except ValueError:  # another profiler is active in this process
+            self._profile_lock.release()
+            return None
+        return profiler
+
+    def _stop_profile(self, name, profiler):
+        if profiler is None:
+            return
+        profiler.disable()
+        with self._lock:
+            stats = self._profiles.get(name)
+            if stats is None:
+                self._profiles[name] = pstats.Stats(profiler)
+            else:
+                stats.add(profiler)
+        self._profile_lock.release()
+
+    def stage_latencies(self):
+        """Return ``{stage: {"count", "p50", "p95", "max"}}`` in seconds."""
+        with self._lock:
+            durations = {name: list(values) for name, values in self.durations.items()}
+        return {
+            name: {
+                "count": len(values),
+                "p50": percentile(values, 50),
+                "p95": percentile(values, 95),
+                "max": max(values),
+            }
+            for name, values in durations.items()
+        }
+
+    def summary(self):
+        """Return the per-stage latency breakdown as log-friendly text."""
+        latencies = self.stage_latencies()
+        if not latencies:
+            return "Stage latency: no spans recorded."
+        width = max(len(name) for name in latencies)
+        lines = [f"Stage latency (trace {self.trace_id}): p50 / p95 / max over n spans"]
+        for name, stats in sorted(latencies.items(), key=lambda kv: -kv[1]["p95"]):
+            lines.append(
+                f"  {name:<{width}}  {stats['p50']:.3f}s / {stats['p95']:.3f}s / "
+                f"{stats['max']:.3f}s  (n={stats['count']})"
+            )
+        return "\n".join(lines)
+
+    def close(self):
+        """Close the trace file and write any captured profiles."""
+        with self._lock:
+            if self._file is not None:
+                self._file.close()
+                self._file = None
+            self.trace_id = None
+            profiles, self._profiles = self._profiles, {}
+        if profiles:
+            profile_dir = self.output_folder / PROFILE_DIR
+            profile_dir.mkdir(parents=True, exist_ok=True)
+            for name, stats in profiles.items():
+                stats.dump_stats(str(profile_dir / f"{name}.prof"))
+            logging.info(f"cProfile stats saved in: {profile_dir}")
+
+
+_shared_tracer = Tracer()
+
+
+def get_tracer():
+    """Return the process-wide tracer shared by the grading scripts."""
+    return _shared_tracer
+
+
+def span(name, submission=None, **attributes):
+    """Open a span on the shared tracer (see :meth:`Tracer.span`)."""
+    return _shared_tracer.span(name, submission=submission, **attributes)